@@ -0,0 +1,171 @@
+# streaming decompression of compressed csv inputs (.gz, .zst, .zip)
+import gzip
+import io
+import os
+import queue
+import threading
+import zipfile
+
+import constants as const
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+EXTENSIONS = (".gz", ".zst", ".zip")
+
+
+def is_compressed(path):
+    return path.endswith(EXTENSIONS)
+
+
+def locate(path):
+    """
+    Find a csv file or its compressed download: name.csv, name.csv.gz, name.csv.zst or name.zip
+    :param path: csv file
+    :return: first existing candidate, path itself when none exists
+    """
+    stem = path[:-len(".csv")] if path.endswith(".csv") else path
+    for candidate in (path, path + ".gz", path + ".zst", stem + ".zip"):
+        if os.path.exists(candidate):
+            return candidate
+    return path
+
+
+def zip_member(archive):
+    """
+    :param archive: zipfile.ZipFile
+    :return: ZipInfo of the only csv file of the archive
+    """
+    members = [info for info in archive.infolist() if info.filename.lower().endswith(".csv")]
+    if len(members) != 1:
+        raise ValueError("%s: expected one csv file, found %s" % (archive.filename,
+                                                                   [info.filename for info in members]))
+    return members[0]
+
+
+def source_size(path):
+    """
+    :param path: csv file or compressed csv file
+    :return: uncompressed size in bytes, None when the format does not record it
+    """
+    if path.endswith(".zip"):
+        with zipfile.ZipFile(path) as archive:
+            return zip_member(archive).file_size
+    if is_compressed(path):
+        return None
+    return os.path.getsize(path)
+
+
+def open_source(path, block_size=const.DECOMPRESS_BLOCK, queue_size=const.DECOMPRESS_QUEUE_SIZE):
+    """
+    Open a csv file for binary reading; compressed files are decoded on the
+    fly by a background thread, nothing is extracted to disk
+    :param path: csv file or compressed csv file
+    :param block_size: decompressed bytes handed over at a time
+    :param queue_size: decompressed blocks read ahead
+    :return: buffered binary file object (read, readline, close)
+    """
+    if not is_compressed(path):
+        return open(path, mode='rb')
+    return io.BufferedReader(DecompressReader(decompressed(path), block_size, queue_size), block_size)
+
+
+def decompressed(path):
+    """
+    :param path: compressed csv file
+    :return: binary stream of the decompressed content, read in the decompression thread
+    """
+    if path.endswith(".gz"):
+        return gzip.open(path, mode='rb')
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise ImportError("reading %s needs the zstandard package (pip3 install zstandard)" % path)
+        return zstandard.ZstdDecompressor().stream_reader(open(path, mode='rb'), closefd=True)
+    archive = zipfile.ZipFile(path)
+    return ZipMember(archive, archive.open(zip_member(archive)))
+
+
+class ZipMember:
+    """
+    Member stream that also closes its archive.
+    """
+
+    def __init__(self, archive, stream):
+        self.archive = archive
+        self.stream = stream
+
+    def read(self, size=-1):
+        return self.stream.read(size)
+
+    def close(self):
+        self.stream.close()
+        self.archive.close()
+
+
+class DecompressReader(io.RawIOBase):
+    """
+    Raw reader fed by a decompression thread.
+
+    The thread reads block_size decompressed bytes at a time into a bounded
+    queue, so decompression (zlib and zstd release the GIL) overlaps with
+    csv parsing in the loader and at most queue_size blocks are held in
+    memory. Errors of the thread are raised by the next read.
+    """
+
+    def __init__(self, stream, block_size, queue_size):
+        super().__init__()
+        self.stream = stream
+        self.block_size = block_size
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.block = memoryview(b'')
+        self.eof = False
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="decompress", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        try:
+            while not self.stopped.is_set():
+                block = self.stream.read(self.block_size)
+                self.put(block)
+                if not block:
+                    return
+        except Exception as e:
+            self.put(e)
+
+    def put(self, item):
+        # Give up once the reader is closed, nobody takes blocks any more
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self.block:
+            if self.eof:
+                return 0
+            item = self.queue.get()
+            if isinstance(item, Exception):
+                raise item
+            if not item:
+                self.eof = True
+                return 0
+            self.block = memoryview(item)
+        size = min(len(buffer), len(self.block))
+        buffer[:size] = self.block[:size]
+        self.block = self.block[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self.stopped.set()
+            self.thread.join()
+            self.stream.close()
+        super().close()
@@ -0,0 +1,96 @@
+# microbenchmark: mapping.CostShareParser vs utils.get_num_decimal/get_desc
+import argparse
+import random
+import timeit
+
+import utils
+from mapping import CostShareParser
+
+# Type names of copay_type/coins_type in schema.sql
+COPAY_TYPES = ["No Charge", "No Charge after deductible", "Copay", "Copay after deductible",
+               "Copay before deductible", "Copay with deductible", "Copay per Day", "Copay per Stay",
+               "Copay per Day after deductible", "Copay per Stay after deductible",
+               "Copay per Day before deductible", "Copay per Stay before deductible",
+               "Copay per Day with deductible", "Copay per Stay with deductible", "Not Applicable"]
+COINS_TYPES = ["No Charge", "No Charge after deductible", "Coinsurance", "Coinsurance after deductible",
+               "Not Applicable"]
+
+
+def reference(value, types, default):
+    """
+    Cost sharing cell as parsed by add_plan_benefits before CostShareParser
+    """
+    if value:
+        amount = utils.get_num_decimal(value)
+        desc = utils.get_desc(value)
+        if desc:
+            if desc == 'Not Applicable':
+                amount = None
+            return amount, types[desc]
+        return amount, types[default]
+    return None, types["Not Applicable"]
+
+
+def sample_cells(count, distinct, seed):
+    """
+    Copay/coinsurance cells with a few hundred distinct values, like Benefits_Cost_Sharing_PUF.csv
+    """
+    rnd = random.Random(seed)
+    copay_suffix = ["", " Copay after deductible", " Copay before deductible", " Copay with deductible",
+                    " Copay per Day", " Copay per Stay", " Copay per Day after deductible"]
+    coins_suffix = ["%", "% Coinsurance after deductible"]
+
+    copay = ["No Charge", "No Charge after deductible", "Not Applicable", ""]
+    coins = ["No Charge", "No Charge after deductible", "Not Applicable", ""]
+    while len(copay) < distinct:
+        copay.append("$%d.00%s" % (rnd.randint(1, 500) * 5, rnd.choice(copay_suffix)))
+    while len(coins) < distinct:
+        coins.append("%d.00%s" % (rnd.randint(0, 50), rnd.choice(coins_suffix)))
+
+    return [rnd.choice(copay) for _ in range(count)], [rnd.choice(coins) for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cost sharing cell parsing")
+    parser.add_argument("--cells", type=int, default=200000, help="cells parsed per column type")
+    parser.add_argument("--distinct", type=int, default=300, help="distinct cell values per column type")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    copay_types = dict((name, i + 1) for i, name in enumerate(COPAY_TYPES))
+    coins_types = dict((name, i + 1) for i, name in enumerate(COINS_TYPES))
+    copay_cells, coins_cells = sample_cells(args.cells, args.distinct, seed=2020)
+
+    copay_parser = CostShareParser(copay_types, "Copay")
+    coins_parser = CostShareParser(coins_types, "Coinsurance")
+
+    # Both paths must agree before timing them
+    for cell in set(copay_cells):
+        assert copay_parser.parse(cell) == reference(cell, copay_types, "Copay"), cell
+    for cell in set(coins_cells):
+        assert coins_parser.parse(cell) == reference(cell, coins_types, "Coinsurance"), cell
+
+    def run_reference():
+        for cell in copay_cells:
+            reference(cell, copay_types, "Copay")
+        for cell in coins_cells:
+            reference(cell, coins_types, "Coinsurance")
+
+    def run_parser():
+        for cell in copay_cells:
+            copay_parser(cell)
+        for cell in coins_cells:
+            coins_parser(cell)
+
+    total = 2 * args.cells
+    old = min(timeit.repeat(run_reference, number=1, repeat=args.repeat))
+    new = min(timeit.repeat(run_parser, number=1, repeat=args.repeat))
+    print("utils.get_num_decimal/get_desc: %.3fs (%.0f cells/s)" % (old, total / old))
+    print("CostShareParser:                %.3fs (%.0f cells/s)" % (new, total / new))
+    print("Speedup: %.1fx" % (old / new))
+    for name, cost_parser in (("Copay", copay_parser), ("Coinsurance", coins_parser)):
+        print("%s cells: %d hits, %d misses, %d cached" % ((name,) + cost_parser.stats()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+# benchmark: rows/s per table of every loader mode over the load time of its data set, on generate_data.py files
+# Truncates every data table and drops the disease collection before each mode, use a scratch database.
+import argparse
+import collections
+import csv
+import datetime
+import os
+import time
+
+from psycopg2 import sql
+from tabulate import tabulate
+
+import constraints
+import load_data
+import partitions
+import constants as const
+
+TABLES = collections.OrderedDict([
+    ("plans", [table_mapping.table for table_mapping in load_data.PLAN_MAPPINGS]),
+    ("benefits", [table_mapping.table for table_mapping in load_data.BENEFIT_MAPPINGS]),
+    ("rate", [table_mapping.table for table_mapping in load_data.RATE_MAPPINGS]),
+    ("business_rules", [const.TABLE_BUSINESS_RULE, const.TABLE_BUSINESS_RULE_COHABIT]),
+])
+
+# Mode name -> load_data.py options, {workers} is --rate-workers
+MODES = collections.OrderedDict([
+    ("insert", ["--mode", const.LOAD_MODE_INSERT]),
+    ("copy", ["--mode", const.LOAD_MODE_COPY]),
+    ("pipeline", ["--pipeline"]),
+    ("staging", ["--staging"]),
+    ("rate-workers", ["--rate-workers", "{workers}"]),
+    ("fast-load", ["--fast-load"]),
+])
+
+BUILD = "(keys and indexes)"
+
+
+def truncate(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(sql.SQL("TRUNCATE {} CASCADE").format(
+            sql.SQL(", ").join(sql.Identifier(table) for tables in TABLES.values() for table in tables)))
+        # Every mode attaches new plan year partitions rather than appending to the ones of the last mode
+        for year in set(year for table in partitions.KEYS for year in partitions.partitions(cursor, table)):
+            partitions.drop(cursor, year)
+    connection.commit()
+    load_data.connect_mongo()[const.COL_MEDICAL_DISEASE].drop()
+
+
+def count(connection, table):
+    with connection.cursor() as cursor:
+        cursor.execute(sql.SQL("SELECT count(*) FROM {}").format(sql.Identifier(table)))
+        return cursor.fetchone()[0]
+
+
+def run(mode, options, datasets):
+    """
+    Load the data sets from scratch in one mode
+    :param mode: name in MODES
+    :param options: load_data.py options of the mode
+    :param datasets: names in TABLES, in load order
+    :return: list of [mode, data set, table, rows, seconds]; seconds is the load time of the data set
+    """
+    connection = load_data.connect()
+    truncate(connection)
+    fast_load = "--fast-load" in options
+    if fast_load:
+        constraints.defer(connection)
+
+    results = list()
+    for dataset in datasets:
+        start = time.perf_counter()
+        load_data.run_dataset(load_data.parse_args(options), dataset)
+        seconds = time.perf_counter() - start
+        results += [[mode, dataset, table, count(connection, table), seconds] for table in TABLES[dataset]]
+        # The counts must not hold locks on the tables while the next data set loads, or the build waits on them
+        connection.commit()
+
+    if fast_load:
+        start = time.perf_counter()
+        constraints.build(load_data.connect)
+        results.append([mode, "", BUILD, 0, time.perf_counter() - start])
+    connection.close()
+    return results
+
+
+def save(path, scale, results):
+    """
+    Append the results to a csv file, written with a header when new
+    """
+    new = not os.path.exists(path)
+    now = datetime.datetime.now().isoformat(timespec="seconds")
+    with open(path, "a", newline='') as fd:
+        out = csv.writer(fd)
+        if new:
+            out.writerow(["date", "scale", "mode", "dataset", "table", "rows", "dataset_seconds",
+                          "rows_per_dataset_second"])
+        for mode, dataset, table, rows, seconds in results:
+            out.writerow([now, scale, mode, dataset, table, rows, "%.3f" % seconds,
+                          "%.0f" % (rows / seconds if seconds > 0 else 0)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the loader modes table by table")
+    parser.add_argument("modes", nargs="*", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--data-dir", default="synthetic-dataset", help="files written by generate_data.py")
+    parser.add_argument("--datasets", type=load_data.comma_list, default=list(TABLES),
+                        help="comma separated data sets to load, in load order (benefits need plans)")
+    parser.add_argument("--rate-workers", type=int, default=4, help="shard workers of the rate-workers mode")
+    parser.add_argument("--scale", default="", help="scale of the generated files, recorded with the results")
+    parser.add_argument("--results", help="csv file the results are appended to")
+    args = parser.parse_args()
+
+    results = list()
+    for mode in args.modes:
+        options = [option.format(workers=args.rate_workers) for option in MODES[mode]] + ["--data-dir", args.data_dir]
+        print("======%s: python3 load_data.py %s======" % (mode, " ".join(options)))
+        results += run(mode, options, args.datasets)
+
+    # One row per table, rows/s of each mode: the table rows over the load time of the whole data set, the
+    # writers of some modes (staging, shards, pipeline) do not time tables one by one
+    rates = collections.OrderedDict()
+    for mode, dataset, table, rows, seconds in results:
+        key = (dataset, table)
+        rates.setdefault(key, dict())[mode] = ("%.2f s" % seconds if table == BUILD else
+                                               "%.0f" % (rows / seconds if seconds > 0 else 0))
+        rates[key]["rows"] = rows
+    data = [[dataset, table, values["rows"]] + [values.get(mode, "") for mode in args.modes]
+            for (dataset, table), values in rates.items()]
+    print(tabulate(data, headers=["Data set", "Table", "Rows"] +
+                   ["%s rows/s (data set)" % mode for mode in args.modes], tablefmt="fancy_grid"))
+
+    if args.results:
+        save(args.results, args.scale, results)
+        print("Results appended to %s" % args.results)
+
+
+if __name__ == '__main__':
+    main()
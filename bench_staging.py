@@ -0,0 +1,71 @@
+# benchmark: python transforms vs staging tables + INSERT ... SELECT
+# Truncates the tables of the benchmarked data sets (plans cascades to benefits), use a scratch database.
+import argparse
+import time
+
+from psycopg2 import sql
+from tabulate import tabulate
+
+import writers
+import load_data
+import constants as const
+
+TABLES = {
+    "plans": [table_mapping.table for table_mapping in load_data.PLAN_MAPPINGS],
+    "rate": [table_mapping.table for table_mapping in load_data.RATE_MAPPINGS],
+    "business_rules": [const.TABLE_BUSINESS_RULE, const.TABLE_BUSINESS_RULE_COHABIT],
+}
+
+
+def truncate(dataset):
+    with load_data.conn.cursor() as cursor:
+        cursor.execute(sql.SQL("TRUNCATE {} CASCADE").format(
+            sql.SQL(", ").join(sql.Identifier(table) for table in TABLES[dataset])))
+    load_data.mongodb[const.COL_MEDICAL_DISEASE].drop()
+    load_data.conn.commit()
+
+
+def run(dataset, use_staging):
+    """
+    Load a data set from scratch
+    :return: (seconds, csv records)
+    """
+    truncate(dataset)
+    load_data.use_staging = use_staging
+    start = time.perf_counter()
+    records = load_data.load_dataset(dataset)
+    return time.perf_counter() - start, records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark staging tables against the python transforms")
+    parser.add_argument("datasets", nargs="*", choices=sorted(TABLES), default=["rate", "business_rules"])
+    parser.add_argument("--mode", choices=[const.LOAD_MODE_COPY, const.LOAD_MODE_INSERT],
+                        default=const.LOAD_MODE_COPY, help="writer of the python transforms")
+    parser.add_argument("--batch-size", type=int, default=const.COPY_BATCH_SIZE)
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    # Load options not benchmarked keep the defaults of load_data.py; one process loads the rates
+    load_data.set_options(load_data.parse_args(["--mode", args.mode, "--batch-size", str(args.batch_size)]))
+    load_data.progress_interval = None
+    load_data.conn = load_data.connect()
+    load_data.writer = writers.create_writer(args.mode, load_data.conn.cursor(), args.batch_size)
+    load_data.mongodb = load_data.connect_mongo()
+    load_data.documents = writers.DocumentWriter(load_data.mongodb[const.COL_MEDICAL_DISEASE])
+
+    data = list()
+    for dataset in args.datasets:
+        python, records = min(run(dataset, False) for _ in range(args.repeat))
+        staged, _ = min(run(dataset, True) for _ in range(args.repeat))
+        data.append([dataset, records, "%.2f" % python, "%.0f" % (records / python),
+                     "%.2f" % staged, "%.0f" % (records / staged), "%.1fx" % (python / staged)])
+
+    print(tabulate(data, headers=["Data set", "Records", "Python (s)", "Records/s", "Staging (s)", "Records/s",
+                                  "Speedup"], tablefmt="fancy_grid"))
+    load_data.writer.close()
+    load_data.conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+# resumable load checkpoints kept in postgres
+import hashlib
+import os
+
+from psycopg2 import sql
+
+import constants as const
+
+
+class CheckpointError(RuntimeError):
+    """
+    Raised when a load cannot resume from its checkpoint.
+    """
+    pass
+
+
+def file_hash(path, block_size=const.CHECKPOINT_HASH_BLOCK):
+    """
+    Fingerprint of a file read in two blocks instead of whole: a multi-GB file is not read once more
+    before the load reads it. An appended file always changes it; an edit in the middle of a file of
+    the same size does not, Checkpoint.resume also compares the mtime
+    :param path: file
+    :param block_size: bytes read at the head and at the tail
+    :return: sha256 hex digest of the file size, first and last blocks
+    """
+    size = os.path.getsize(path)
+    digest = hashlib.sha256(str(size).encode())
+    with open(path, mode='rb') as fd:
+        digest.update(fd.read(block_size))
+        if size > block_size:
+            fd.seek(max(block_size, size - block_size))
+            digest.update(fd.read(block_size))
+    return digest.hexdigest()
+
+
+class Checkpoint:
+    """
+    Load progress of one data set: identity of the source file and byte
+    offset/row count of the last committed record.
+
+    save() returns the statement storing the checkpoint; it is run on the
+    connection holding the loaded tuples so both commit together.
+    """
+
+    COLUMNS = ("dataset", "file_path", "file_size", "file_mtime", "file_hash", "byte_offset", "rows", "completed")
+
+    def __init__(self, dataset, path):
+        """
+        :param dataset: data set name, see load_data.DATASETS
+        :param path: csv file
+        """
+        stat = os.stat(path)
+        self.dataset = dataset
+        self.path = path
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+        self.digest = None
+        self.offset = None
+        self.rows = 0
+        self.completed = False
+
+    @property
+    def hash(self):
+        """
+        Fingerprint of the file, read when a checkpoint is compared or saved, never by a dry run
+        """
+        if self.digest is None:
+            self.digest = file_hash(self.path)
+        return self.digest
+
+    def resume(self, cursor, ignore_mtime=False):
+        """
+        Continue from the saved checkpoint of the data set, if any
+        :param cursor: postgres cursor
+        :param ignore_mtime: accept a file with another mtime, e.g. copied since the checkpoint; size and
+                             fingerprint must still match
+        :return: N/A
+        """
+        cursor.execute(sql.SQL("SELECT file_size, file_mtime, file_hash, byte_offset, rows, completed FROM {} "
+                               "WHERE dataset = %s").format(sql.Identifier(const.TABLE_CHECKPOINT)),
+                       (self.dataset,))
+        saved = cursor.fetchone()
+        if saved is None:
+            return
+        size, mtime, digest, offset, rows, completed = saved
+        if size != self.size or digest != self.hash:
+            raise CheckpointError("%s changed since the checkpoint of %s, load again without --resume"
+                                  % (self.path, self.dataset))
+        # The fingerprint does not read the middle of the file, a reissued file of the same size is told
+        # apart by its mtime
+        if mtime != self.mtime and not ignore_mtime:
+            raise CheckpointError("%s was modified since the checkpoint of %s, load again without --resume, "
+                                  "or add --resume-ignore-mtime if the file was only copied"
+                                  % (self.path, self.dataset))
+        self.offset = offset
+        self.rows = rows
+        self.completed = completed
+
+    def save(self, offset, rows, completed=False):
+        """
+        :param offset: byte offset after the last record to commit
+        :param rows: records read since the load (or resume) started
+        :param completed: the whole file is loaded
+        :return: (statement, parameters) upserting the checkpoint
+        """
+        statement = sql.SQL("INSERT INTO {} ({}, updated_at) VALUES ({}, now()) "
+                            "ON CONFLICT (dataset) DO UPDATE SET ({}, updated_at) = ({}, now())").format(
+            sql.Identifier(const.TABLE_CHECKPOINT),
+            sql.SQL(", ").join(sql.Identifier(column) for column in self.COLUMNS),
+            sql.SQL(", ").join(sql.Placeholder() * len(self.COLUMNS)),
+            sql.SQL(", ").join(sql.Identifier(column) for column in self.COLUMNS[1:]),
+            sql.SQL(", ").join(sql.SQL("EXCLUDED.") + sql.Identifier(column) for column in self.COLUMNS[1:]))
+        return statement, (self.dataset, self.path, self.size, self.mtime, self.hash, offset, self.rows + rows,
+                           completed)
@@ -27,6 +27,60 @@ Const.DB_USER = "manager"
 Const.MONGO_HOST = "172.17.0.3"
 Const.MONGO_PORT = "27017"
 
+# Constants - DATABASE - Connection Pool
+Const.POOL_MIN_SIZE = 1
+Const.POOL_MAX_SIZE = 8
+Const.POOL_TIMEOUT = 30.0
+Const.POOL_CHECK_INTERVAL = 60.0
+
+# Constants - DATABASE - Compiled SQL Cache
+Const.SQL_CACHE_SIZE = 256
+
+# Constants - DATABASE - Result Cache
+Const.RESULT_CACHE_ENTRIES = 512
+Const.RESULT_CACHE_BYTES = 64 << 20
+Const.RESULT_CACHE_TTL = 3600.0
+Const.RESULT_CACHE_VERSION_CHECK = 5.0
+Const.RESULT_CACHE_DIR = None
+
+# Constants - LOADER - Write Mode
+Const.LOAD_MODE_INSERT = "insert"
+Const.LOAD_MODE_COPY = "copy"
+Const.COPY_BATCH_SIZE = 5000
+Const.PIPELINE_QUEUE_SIZE = 8
+Const.SHARDS_PER_WORKER = 4
+Const.MONGO_BATCH_SIZE = 1000
+
+# Constants - LOADER - CSV Reading
+Const.CSV_ENCODING = "iso-8859-1"
+Const.PROGRESS_INTERVAL = 1.0
+Const.COST_SHARE_CACHE_SIZE = 4096
+Const.DECOMPRESS_BLOCK = 1 << 20
+Const.DECOMPRESS_QUEUE_SIZE = 8
+
+# Constants - LOADER - Checkpoints
+Const.CHECKPOINT_ROWS = 50000
+Const.CHECKPOINT_HASH_BLOCK = 1 << 20
+
+# Constants - LOADER - Profiling
+Const.PROFILE_TOP = 25
+
+# Constants - LOADER - Fast Load
+Const.BUILD_WORKERS = 4
+
+# Constants - LOADER - Staging
+Const.STAGING_WORK_MEM = "256MB"
+Const.STAGING_MAINTENANCE_WORK_MEM = "1GB"
+
+# Constants - SNAPSHOT - Binary Export/Restore
+Const.SNAPSHOT_DIR = "snapshots"
+Const.SNAPSHOT_WORKERS = 4
+
+# Constants - GENERATOR - Synthetic Data Set
+Const.SYNTH_ISSUERS = 300
+Const.SYNTH_YEAR = 2020
+Const.SYNTH_SEED = 2020
+
 # Constants - MONGO - Database
 Const.MONGO_DB_NAME = "insurance"
 
@@ -42,6 +96,9 @@ Const.IN = "IN"
 Const.LESS_THEN = "<="
 Const.LARGER_THEN = ">="
 
+# Constants - REQUEST - Plan Year
+Const.REQ_PLAN_YEAR = 2020
+
 # Constants - REQUEST - Average Individual Rate
 Const.REQ_AGE = "age"
 Const.REQ_METAL_LEVEL = "metal level"
@@ -81,6 +138,13 @@ Const.TABLE_RATE_FAMILY = "rate_family"
 Const.TABLE_BUSINESS_RULE = "business_rules"
 Const.TABLE_BUSINESS_RULE_COHABIT = "business_rules_cohabitation"
 
+# Constants - TABLE NAME - Loader
+Const.TABLE_DEFERRED_DDL = "load_deferred_ddl"
+Const.TABLE_LOAD_VIOLATION = "load_violations"
+Const.TABLE_CHECKPOINT = "load_checkpoints"
+Const.TABLE_FINGERPRINT = "load_fingerprints"
+Const.TABLE_LOAD_VERSION = "load_version"
+
 # Constants - TABLE ATTRIBUTES - Plans
 Const.PLAN_ISSUER_ID = "issuer_id"
 Const.PLAN_ID = "plan_id"
@@ -0,0 +1,290 @@
+# deferred constraint and index build for fast initial loads
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from psycopg2 import sql
+from tabulate import tabulate
+
+import constants as const
+
+# Tables filled by load_data.py, referenced tables before the tables referencing them
+DATA_TABLES = [const.TABLE_PLAN, const.TABLE_PLAN_MULTI_NET,
+               const.TABLE_MEDICAL_PLAN, const.TABLE_M_PLAN_REFERRAL, const.TABLE_M_PLAN_SBC,
+               const.TABLE_M_PLAN_MOOP, const.TABLE_M_PLAN_MOOP_INT, const.TABLE_M_PLAN_DED,
+               const.TABLE_M_PLAN_DED_INT,
+               const.TABLE_DENTAL_PLAN, const.TABLE_D_PLAN_MOOP, const.TABLE_D_PLAN_DED,
+               const.TABLE_BENEFIT, const.TABLE_BENEFIT_LIMIT,
+               const.TABLE_RATE_INDIVIDUAL, const.TABLE_RATE_FAMILY,
+               const.TABLE_BUSINESS_RULE, const.TABLE_BUSINESS_RULE_COHABIT]
+
+KIND_PRIMARY = "p"
+KIND_UNIQUE = "u"
+KIND_FOREIGN = "f"
+KIND_INDEX = "i"
+
+CAPTURE_CONSTRAINTS = """
+SELECT c.conrelid::regclass::text, c.conname::text, c.contype, pg_get_constraintdef(c.oid),
+       ARRAY(SELECT a.attname::text
+             FROM unnest(c.conkey) WITH ORDINALITY AS k(attnum, n)
+                      JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = k.attnum
+             ORDER BY k.n),
+       NULLIF(c.confrelid, 0)::regclass::text,
+       ARRAY(SELECT a.attname::text
+             FROM unnest(c.confkey) WITH ORDINALITY AS k(attnum, n)
+                      JOIN pg_attribute a ON a.attrelid = c.confrelid AND a.attnum = k.attnum
+             ORDER BY k.n)
+FROM pg_constraint c
+WHERE c.conrelid = ANY (%s::regclass[])
+  AND c.contype IN ('p', 'u', 'f')
+"""
+
+CAPTURE_INDEXES = """
+SELECT i.indrelid::regclass::text, c.relname::text, pg_get_indexdef(i.indexrelid)
+FROM pg_index i
+         JOIN pg_class c ON c.oid = i.indexrelid
+WHERE i.indrelid = ANY (%s::regclass[])
+  AND NOT EXISTS(SELECT 1 FROM pg_constraint k WHERE k.conindid = i.indexrelid AND k.contype IN ('p', 'u', 'x'))
+"""
+
+# Indexes of partitioned tables are captured as ON ONLY <table>, which creates no index on the partitions
+# and leaves the parent index invalid; they are replayed on the whole partition tree
+ON_ONLY = " ON ONLY "
+
+INVALID_INDEXES = """
+SELECT i.indrelid::regclass::text, c.relname::text
+FROM pg_index i
+         JOIN pg_class c ON c.oid = i.indexrelid
+WHERE i.indrelid = ANY (%s::regclass[])
+  AND NOT i.indisvalid
+ORDER BY 1, 2
+"""
+
+# Rows deleted by the inner statement are kept in the violation report
+MOVE = "WITH moved AS ({delete}) " \
+       "INSERT INTO {violations} (table_name, constraint_name, reason, row_data) " \
+       "SELECT {table_name}, {name}, {reason}, to_jsonb(moved) FROM moved"
+
+DELETE_NULL_KEYS = "DELETE FROM {table} WHERE {any_null} RETURNING *"
+
+# ctid is only unique within a partition, tableoid tells the partitions of a partitioned table apart
+DELETE_DUPLICATES = "DELETE FROM {table} WHERE (tableoid, ctid) IN (" \
+                    "SELECT tableoid, ctid FROM (SELECT tableoid, ctid, row_number() OVER (" \
+                    "PARTITION BY {columns} ORDER BY tableoid, ctid) AS n " \
+                    "FROM {table} WHERE {all_set}) AS ranked WHERE n > 1) RETURNING *"
+
+DELETE_ORPHANS = "DELETE FROM {table} AS c WHERE {all_set} AND NOT EXISTS (" \
+                 "SELECT 1 FROM {ref_table} AS p WHERE {join}) RETURNING c.*"
+
+
+def defer(connection, tables=DATA_TABLES):
+    """
+    Save the keys, foreign keys and indexes of the data tables and drop them.
+
+    Definitions are kept in load_deferred_ddl, so a build interrupted by a
+    failed load can be run again later (python3 constraints.py).
+    :param connection: postgres connection
+    :param tables: tables to strip
+    :return: number of definitions set aside
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(CAPTURE_CONSTRAINTS, (tables,))
+        definitions = list(cursor.fetchall())
+        cursor.execute(CAPTURE_INDEXES, (tables,))
+        definitions += [(table, name, KIND_INDEX, definition, None, None, None)
+                        for table, name, definition in cursor.fetchall()]
+
+        cursor.executemany(sql.SQL("INSERT INTO {} VALUES (%s, %s, %s, %s, %s, %s, %s) "
+                                   "ON CONFLICT DO NOTHING").format(sql.Identifier(const.TABLE_DEFERRED_DDL)),
+                           definitions)
+
+        # Foreign keys first, they depend on the keys they reference
+        for kind in (KIND_FOREIGN, KIND_PRIMARY, KIND_UNIQUE, KIND_INDEX):
+            for table, name, definition_kind, _, _, _, _ in definitions:
+                if definition_kind != kind:
+                    continue
+                if kind == KIND_INDEX:
+                    cursor.execute(sql.SQL("DROP INDEX {}").format(sql.Identifier(name)))
+                else:
+                    cursor.execute(sql.SQL("ALTER TABLE {} DROP CONSTRAINT {}").format(sql.Identifier(table),
+                                                                                        sql.Identifier(name)))
+    connection.commit()
+    print("Deferred %d constraints and indexes" % len(definitions))
+    return len(definitions)
+
+
+def build(connect, workers=const.BUILD_WORKERS):
+    """
+    Rebuild what defer() dropped.
+
+    Keys and indexes are built in parallel, one table per connection, after
+    moving rows with NULL or duplicate keys to load_violations. Foreign keys
+    are then checked set based, table by table from referenced to
+    referencing tables; orphan rows are moved to load_violations, the
+    constraint is added NOT VALID and validated in parallel.
+    :param connect: function opening a new postgres connection
+    :param workers: connections used at the same time
+    :return: number of rows moved to load_violations
+    """
+    connection = connect()
+    with connection.cursor() as cursor:
+        cursor.execute(sql.SQL("SELECT table_name, name, kind, definition, columns, ref_table, ref_columns "
+                               "FROM {}").format(sql.Identifier(const.TABLE_DEFERRED_DDL)))
+        definitions = cursor.fetchall()
+    if not definitions:
+        connection.close()
+        return 0
+
+    order = dict((table, i) for i, table in enumerate(DATA_TABLES))
+    definitions.sort(key=lambda definition: (order.get(definition[0], len(order)), definition[1]))
+    keys = dict()
+    foreign_keys = list()
+    for definition in definitions:
+        if definition[2] == KIND_FOREIGN:
+            foreign_keys.append(definition)
+        else:
+            keys.setdefault(definition[0], list()).append(definition)
+
+    steps = list()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for result in pool.map(lambda table: build_keys(connect, keys[table]), keys):
+            steps += result
+
+        for definition in foreign_keys:
+            steps.append(check_foreign_key(connection, definition))
+        steps += pool.map(lambda definition: validate(connect, definition), foreign_keys)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql.SQL("DELETE FROM {}").format(sql.Identifier(const.TABLE_DEFERRED_DDL)))
+    connection.commit()
+    invalid = invalid_indexes(connection)
+    connection.close()
+
+    print(tabulate(steps, headers=["Step", "Table", "Name", "Violations", "Seconds"], tablefmt="fancy_grid"))
+    violations = sum(step[3] for step in steps)
+    if violations:
+        print("%d rows moved to %s" % (violations, const.TABLE_LOAD_VIOLATION))
+    if invalid:
+        raise RuntimeError("Invalid indexes after the build, rebuild them with REINDEX: " +
+                           ", ".join("%s.%s" % (table, name) for table, name in invalid))
+    return violations
+
+
+def invalid_indexes(connection, tables=DATA_TABLES):
+    """
+    :param connection: postgres connection
+    :param tables: relations
+    :return: [(table, index)] of the indexes postgres cannot use, e.g. a partitioned index missing on a partition
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(INVALID_INDEXES, (tables,))
+        invalid = cursor.fetchall()
+    connection.commit()
+    return invalid
+
+
+def build_keys(connect, definitions):
+    """
+    Build the keys and indexes of one table on its own connection
+    :param connect: function opening a new postgres connection
+    :param definitions: load_deferred_ddl rows of the table, no foreign keys
+    :return: report steps
+    """
+    steps = list()
+    connection = connect()
+    with connection.cursor() as cursor:
+        for table, name, kind, definition, columns, _, _ in definitions:
+            began = time.perf_counter()
+            moved = 0
+            if kind == KIND_INDEX:
+                cursor.execute(definition.replace(ON_ONLY, " ON ", 1))
+            else:
+                if kind == KIND_PRIMARY:
+                    moved += move(cursor, table, name, "null key", sql.SQL(DELETE_NULL_KEYS).format(
+                        table=sql.Identifier(table),
+                        any_null=sql.SQL(" OR ").join(sql.SQL("{} IS NULL").format(sql.Identifier(column))
+                                                      for column in columns)))
+                moved += move(cursor, table, name, "duplicate key", sql.SQL(DELETE_DUPLICATES).format(
+                    table=sql.Identifier(table),
+                    columns=sql.SQL(", ").join(sql.Identifier(column) for column in columns),
+                    all_set=all_set(columns)))
+                add_constraint(cursor, table, name, definition)
+            connection.commit()
+            steps.append(["key" if kind != KIND_INDEX else "index", table, name, moved,
+                          "%.2f" % (time.perf_counter() - began)])
+    connection.close()
+    return steps
+
+
+def check_foreign_key(connection, definition):
+    """
+    Move orphan rows of a foreign key to the violation report and add the constraint unvalidated
+    :param connection: postgres connection
+    :param definition: load_deferred_ddl row
+    :return: report step
+    """
+    table, name, _, constraint, columns, ref_table, ref_columns = definition
+    began = time.perf_counter()
+    with connection.cursor() as cursor:
+        moved = move(cursor, table, name, "orphan", sql.SQL(DELETE_ORPHANS).format(
+            table=sql.Identifier(table),
+            ref_table=sql.Identifier(ref_table),
+            all_set=all_set(columns, "c"),
+            join=sql.SQL(" AND ").join(sql.SQL("{} = {}").format(sql.Identifier("c", column),
+                                                                  sql.Identifier("p", ref_column))
+                                       for column, ref_column in zip(columns, ref_columns))))
+        add_constraint(cursor, table, name, constraint + " NOT VALID")
+    connection.commit()
+    return ["foreign key", table, name, moved, "%.2f" % (time.perf_counter() - began)]
+
+
+def validate(connect, definition):
+    """
+    Validate an unvalidated foreign key on its own connection
+    :param connect: function opening a new postgres connection
+    :param definition: load_deferred_ddl row
+    :return: report step
+    """
+    table, name = definition[:2]
+    began = time.perf_counter()
+    connection = connect()
+    with connection.cursor() as cursor:
+        cursor.execute(sql.SQL("ALTER TABLE {} VALIDATE CONSTRAINT {}").format(sql.Identifier(table),
+                                                                               sql.Identifier(name)))
+    connection.commit()
+    connection.close()
+    return ["validate", table, name, 0, "%.2f" % (time.perf_counter() - began)]
+
+
+def move(cursor, table, name, reason, delete):
+    """
+    Run a DELETE ... RETURNING and keep the deleted rows in load_violations
+    :return: number of rows moved
+    """
+    cursor.execute(sql.SQL(MOVE).format(delete=delete,
+                                        violations=sql.Identifier(const.TABLE_LOAD_VIOLATION),
+                                        table_name=sql.Literal(table),
+                                        name=sql.Literal(name),
+                                        reason=sql.Literal(reason)))
+    return cursor.rowcount
+
+
+def add_constraint(cursor, table, name, definition):
+    cursor.execute(sql.SQL("ALTER TABLE {} ADD CONSTRAINT {} ").format(sql.Identifier(table), sql.Identifier(name)) +
+                   sql.SQL(definition))
+
+
+def all_set(columns, alias=None):
+    """
+    Condition true when none of the columns is NULL
+    """
+    return sql.SQL(" AND ").join(sql.SQL("{} IS NOT NULL").format(sql.Identifier(*filter(None, (alias, column))))
+                                 for column in columns)
+
+
+if __name__ == '__main__':
+    from load_data import connect
+
+    parser = argparse.ArgumentParser(description="Rebuild constraints and indexes deferred by a fast load")
+    parser.add_argument("--workers", type=int, default=const.BUILD_WORKERS)
+    build(connect, parser.parse_args().workers)
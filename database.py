@@ -1,14 +1,277 @@
 # database related code
+import collections
+import contextlib
+import functools
+import inspect
+import threading
+import time
+
 import psycopg2
-import psycopg2.extras
+import psycopg2.extensions
 import pymongo
 import constants as const
 from psycopg2 import sql
 
+import result_cache
+from pool import ConnectionPool
+
+
+EXPLAIN_ANALYZE = "EXPLAIN (ANALYZE, FORMAT JSON) "
+
+
+class Session:
+    """
+    Connection borrowed from the pool for one request, released when the session ends.
+    Every statement runs in its own cursor, closed once its rows are fetched. While plans
+    is a list, each statement is first run under EXPLAIN (ANALYZE) and its plan appended.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.connection = None
+        self.plans = None
+
+    def __enter__(self):
+        self.connection = self.pool.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # A connection that failed is not handed to the next request
+        broken = isinstance(exc_value, (psycopg2.OperationalError, psycopg2.InterfaceError))
+        self.pool.release(self.connection, discard=broken)
+        self.connection = None
+
+    def explain(self, cursor, query, parameters=()):
+        if self.plans is None:
+            return
+        cursor.execute(EXPLAIN_ANALYZE + query if isinstance(query, str) else sql.SQL(EXPLAIN_ANALYZE) + query,
+                       parameters)
+        self.plans.append(cursor.fetchone()[0][0])
+
+    def fetchall(self, query, parameters=()):
+        with self.connection.cursor() as cursor:
+            self.explain(cursor, query, parameters)
+            cursor.execute(query, parameters)
+            return cursor.fetchall()
+
+    def fetchone(self, query, parameters=()):
+        with self.connection.cursor() as cursor:
+            self.explain(cursor, query, parameters)
+            cursor.execute(query, parameters)
+            return cursor.fetchone()
+
+
+class Connection(psycopg2.extensions.connection):
+    """
+    Connection remembering the names of the statements prepared on it.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+
+class PreparedStatement:
+    """
+    Fixed query run by name with EXECUTE. It is PREPAREd once per connection,
+    so postgres parses and analyzes its text once; after a few executions it
+    may also keep a generic plan instead of planning every call.
+    """
+
+    def __init__(self, name, query):
+        """
+        :param name: statement name
+        :param query: SQL text with %s placeholders
+        """
+        self.name = name
+        parts = query.split("%s")
+        self.text = parts[0] + "".join("$%d%s" % (i, part) for i, part in enumerate(parts[1:], 1))
+        self.parameter_count = len(parts) - 1
+        self.last_parameters = None
+        self.calls = 0
+        self.prepares = 0
+        self.prepare_seconds = 0.0
+        self.execute_seconds = 0.0
+        self.planning_ms = None
+        self.execution_ms = None
+
+    def prepare_statement(self):
+        return sql.SQL("PREPARE {} AS ").format(sql.Identifier(self.name)) + sql.SQL(self.text)
+
+    def execute_statement(self, prefix=""):
+        statement = sql.SQL(prefix + "EXECUTE {}").format(sql.Identifier(self.name))
+        if self.parameter_count:
+            statement += sql.SQL(" ({})").format(sql.SQL(", ").join([sql.Placeholder()] * self.parameter_count))
+        return statement
+
+
+class Statements:
+    """
+    Registry of the prepared statements of Query, shared by every pooled connection.
+
+    execute() times the PREPARE of each connection and every EXECUTE round
+    trip, rows fetched included. explain() asks postgres how one execution
+    splits into planning and execution time.
+    """
+    registry = collections.OrderedDict()
+    lock = threading.Lock()
+    REPORT_HEADERS = ["Statement", "Calls", "Prepares", "Prepare (ms)", "Execute (ms)", "Planning (ms)",
+                      "Execution (ms)"]
+
+    @classmethod
+    def get(cls, name, query):
+        with cls.lock:
+            statement = cls.registry.get(name)
+            if statement is None:
+                statement = cls.registry[name] = PreparedStatement(name, query)
+            return statement
+
+    @classmethod
+    def prepare(cls, connection, cursor, statement):
+        if statement.name in connection.prepared:
+            return 0.0
+        start = time.perf_counter()
+        cursor.execute(statement.prepare_statement())
+        connection.prepared.add(statement.name)
+        return time.perf_counter() - start
+
+    @classmethod
+    def execute(cls, session, name, query, parameters):
+        """
+        Run a registered statement on the connection of a session, preparing it there first if needed
+        :param session: Session
+        :param name: statement name
+        :param query: SQL text with %s placeholders, registered on first use
+        :param parameters: values of the placeholders
+        :return: fetched rows
+        """
+        statement = cls.get(name, query)
+        with session.connection.cursor() as cursor:
+            prepare = cls.prepare(session.connection, cursor, statement)
+            if session.plans is not None:
+                cursor.execute(statement.execute_statement(EXPLAIN_ANALYZE), parameters)
+                session.plans.append(cursor.fetchone()[0][0])
+            start = time.perf_counter()
+            cursor.execute(statement.execute_statement(), parameters)
+            rows = cursor.fetchall()
+            spent = time.perf_counter() - start
+        with cls.lock:
+            statement.calls += 1
+            statement.execute_seconds += spent
+            statement.last_parameters = parameters
+            if prepare:
+                statement.prepares += 1
+                statement.prepare_seconds += prepare
+        return rows
+
+    @classmethod
+    def explain(cls, session, name, parameters=None):
+        """
+        EXPLAIN (ANALYZE) one execution of a statement
+        :param session: Session
+        :param name: registered statement name
+        :param parameters: values of the placeholders, the ones of its last call when None
+        :return: planning ms, execution ms reported by postgres
+        """
+        statement = cls.registry[name]
+        with session.connection.cursor() as cursor:
+            cls.prepare(session.connection, cursor, statement)
+            cursor.execute(statement.execute_statement(EXPLAIN_ANALYZE),
+                           statement.last_parameters if parameters is None else parameters)
+            plan = cursor.fetchone()[0][0]
+        statement.planning_ms = plan["Planning Time"]
+        statement.execution_ms = plan["Execution Time"]
+        return statement.planning_ms, statement.execution_ms
+
+    @classmethod
+    def report(cls):
+        """
+        :return: one row per statement, for tabulate with REPORT_HEADERS
+        """
+        data = list()
+        with cls.lock:
+            for statement in cls.registry.values():
+                data.append([statement.name, statement.calls, statement.prepares,
+                             "%.2f" % (statement.prepare_seconds * 1000 / statement.prepares)
+                             if statement.prepares else "",
+                             "%.2f" % (statement.execute_seconds * 1000 / statement.calls) if statement.calls else "",
+                             "" if statement.planning_ms is None else "%.2f" % statement.planning_ms,
+                             "" if statement.execution_ms is None else "%.2f" % statement.execution_ms])
+        return data
+
+
+class SqlCache:
+    """
+    Bounded LRU cache of rendered SQL text, keyed by the shape of a dynamic query.
+
+    The shape holds everything that changes the text (attributes, table,
+    constraint keys and operators in order, order by) but no parameter
+    value, so a query of a known shape is neither composed nor rendered
+    again; only its parameters change.
+    """
+
+    def __init__(self, max_size=const.SQL_CACHE_SIZE):
+        """
+        :param max_size: maximum number of cached texts, the least recently used goes first
+        """
+        self.max_size = max_size
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, shape, render):
+        """
+        :param shape: hashable key of the query
+        :param render: function returning the SQL text, called on a miss
+        :return: SQL text
+        """
+        with self.lock:
+            text = self.entries.get(shape)
+            if text is not None:
+                self.entries.move_to_end(shape)
+                self.hits += 1
+                return text
+            self.misses += 1
+        text = render()
+        with self.lock:
+            self.entries[shape] = text
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return text
+
+    def stats(self):
+        """
+        :return: (hits, misses, current size)
+        """
+        with self.lock:
+            return self.hits, self.misses, len(self.entries)
+
+
+def cached(method):
+    """
+    Serve a Query method from Query.result_cache: calls with the same arguments, given by position,
+    by keyword or left to their default, share one result until the data set version moves
+    """
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    def wrapper(cls, *args, **kwargs):
+        if cls.result_cache is None or getattr(cls.local, "uncached", False):
+            return method(cls, *args, **kwargs)
+        bound = signature.bind(cls, *args, **kwargs)
+        bound.apply_defaults()
+        arguments = tuple(bound.arguments.items())[1:]
+        return cls.result_cache.get(method.__name__, arguments, lambda: method(cls, *args, **kwargs))
+
+    return wrapper
+
 
 class Query:
-    conn = None
-    cursor = None
+    pool = None
+    sql_cache = SqlCache()
+    result_cache = None
+    local = threading.local()
 
     @staticmethod
     def __generate_conditions__(conditions):
@@ -21,24 +284,91 @@ class Query:
             results.append(tmp)
         return sql.Composed(results)
 
+    @staticmethod
+    def __shape__(conditions):
+        # IN conditions carry their SQL, the other operators a placeholder
+        return tuple((key, (value[0], repr(value[1])) if value[0] == const.IN else value[0])
+                     for key, value in conditions.items())
+
+    @classmethod
+    def __compiled__(cls, shape, build, parameters, one=False):
+        """
+        Run a dynamic query, composed and rendered only the first time its shape is seen
+        :param shape: key of the query in sql_cache
+        :param build: function returning the sql.Composed query
+        :param parameters: values of its placeholders
+        :param one: fetch one row instead of all
+        :return: rows, or one row
+        """
+        with cls.session() as session:
+            query = cls.sql_cache.get(shape, lambda: build().as_string(session.connection))
+            return session.fetchone(query, parameters) if one else session.fetchall(query, parameters)
+
     @classmethod
     def __query__(cls, query, parameters=()):
-        cursor = cls.conn.cursor()
-        cursor.execute(query, parameters)
-        return cursor.fetchall()
+        with cls.session() as session:
+            return session.fetchall(query, parameters)
 
     @classmethod
     def __query_one__(cls, query, parameters=()):
-        cursor = cls.conn.cursor()
-        cursor.execute(query, parameters)
-        return cursor.fetchone()
+        with cls.session() as session:
+            return session.fetchone(query, parameters)
+
+    @classmethod
+    def __prepared__(cls, name, query, parameters):
+        with cls.session() as session:
+            return Statements.execute(session, name, query, parameters)
+
+    @classmethod
+    @contextlib.contextmanager
+    def session(cls):
+        """
+        Run the queries of the calling thread on one pooled connection until the block ends;
+        without a session every query borrows a connection for itself
+        :return: Session of the thread, the enclosing one when nested
+        """
+        active = getattr(cls.local, "session", None)
+        if active is not None:
+            yield active
+            return
+        with Session(cls.pool) as session:
+            cls.local.session = session
+            try:
+                yield session
+            finally:
+                cls.local.session = None
+
+    @classmethod
+    @contextlib.contextmanager
+    def uncached(cls):
+        """
+        Run the cached methods against postgres in the calling thread until the block ends, e.g. to time them
+        """
+        cls.local.uncached = True
+        try:
+            yield
+        finally:
+            cls.local.uncached = False
 
     @classmethod
-    def init(cls, hostname, dbname, user):
-        cls.conn = psycopg2.connect("host=%s dbname=%s user=%s" % (hostname, dbname, user))
-        cls.cursor = cls.conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+    def __data_version__(cls):
+        with cls.session() as session:
+            if session.fetchone(result_cache.version_table_query())[0] is None:
+                return None
+            row = session.fetchone(result_cache.version_query())
+            return row[0] if row else None
 
     @classmethod
+    def init(cls, hostname, dbname, user, min_size=const.POOL_MIN_SIZE, max_size=const.POOL_MAX_SIZE,
+             cache_dir=const.RESULT_CACHE_DIR):
+        dsn = "host=%s dbname=%s user=%s" % (hostname, dbname, user)
+        cls.pool = ConnectionPool(lambda: psycopg2.connect(dsn, connection_factory=Connection), min_size, max_size)
+        # Shared by the processes of the host when a directory is given, private to this one otherwise
+        store = result_cache.DiskStore(cache_dir) if cache_dir else result_cache.MemoryStore()
+        cls.result_cache = result_cache.ResultCache(store, cls.__data_version__)
+
+    @classmethod
+    @cached
     def get_time_intervals(cls, metal_level_id, age):
         query = "SELECT effective_date, expiration_date FROM (" \
                 "SELECT DISTINCT effective_date, expiration_date " \
@@ -53,9 +383,10 @@ class Query:
                 "AND age_range_from <= %s " \
                 "AND age_range_to >= %s) r2 " \
                 "ORDER BY effective_date, expiration_date DESC"
-        return cls.__query__(query, (metal_level_id, age, age))
+        return cls.__prepared__("get_time_intervals", query, (metal_level_id, age, age))
 
     @classmethod
+    @cached
     def get_avg_rate(cls, metal_level_id, age, effective_date, expiration_date, insurance_type):
         # Table name of medical or dental plans
         table_name = const.TABLE_MEDICAL_PLAN if insurance_type == "medical" \
@@ -77,7 +408,8 @@ class Query:
                                                                        "AND expiration_date = %s " \
                                                                        "GROUP BY state, effective_date, expiration_date " \
                                                                        "ORDER BY state"
-        return cls.__query__(query, (metal_level_id, age, age, effective_date, expiration_date))
+        return cls.__prepared__("get_avg_rate_" + table_name, query,
+                                (metal_level_id, age, age, effective_date, expiration_date))
 
     @classmethod
     def get_plans(cls, attributes, constrains, insurance_type, detail_constrains):
@@ -85,35 +417,36 @@ class Query:
         table_name = const.TABLE_MEDICAL_PLAN if insurance_type == "medical" \
             else const.TABLE_DENTAL_PLAN
 
-        if detail_constrains:
-            # Having detailed constrains on medical/dental plans
-            subquery = sql.SQL("SELECT {} FROM {} WHERE {}").format(
-                sql.Identifier(const.PLAN_ID),
-                sql.Identifier(table_name),
-                sql.SQL(" AND ").join(cls.__generate_conditions__(detail_constrains))
-            )
-        else:
-            # No detailed constrains
-            subquery = sql.SQL("SELECT {} FROM {}").format(
-                sql.Identifier(const.PLAN_ID),
-                sql.Identifier(table_name)
-            )
-
-        # Add extra constrain to plan id
-        constrains[const.PLAN_ID] = (const.IN, subquery)
+        def build():
+            if detail_constrains:
+                # Having detailed constrains on medical/dental plans
+                subquery = sql.SQL("SELECT {} FROM {} WHERE {}").format(
+                    sql.Identifier(const.PLAN_ID),
+                    sql.Identifier(table_name),
+                    sql.SQL(" AND ").join(cls.__generate_conditions__(detail_constrains))
+                )
+            else:
+                # No detailed constrains
+                subquery = sql.SQL("SELECT {} FROM {}").format(
+                    sql.Identifier(const.PLAN_ID),
+                    sql.Identifier(table_name)
+                )
 
-        # Generate SQL query
-        query = sql.SQL("SELECT {} FROM {} WHERE {}").format(
-            sql.SQL(',').join(sql.Identifier(attr) for attr in attributes),
-            sql.Identifier(const.TABLE_PLAN),
-            sql.SQL(" AND ").join(cls.__generate_conditions__(constrains))).as_string(cls.conn)
+            # Add extra constrain to plan id
+            conditions = collections.OrderedDict(constrains)
+            conditions[const.PLAN_ID] = (const.IN, subquery)
 
-        # Remove the extra constrain in plan id
-        constrains.pop(const.PLAN_ID)
+            # Generate SQL query
+            return sql.SQL("SELECT {} FROM {} WHERE {}").format(
+                sql.SQL(',').join(sql.Identifier(attr) for attr in attributes),
+                sql.Identifier(const.TABLE_PLAN),
+                sql.SQL(" AND ").join(cls.__generate_conditions__(conditions)))
 
-        return cls.__query__(query,
-                             list(value[1] for value in constrains.values()) +
-                             list(value[1] for value in detail_constrains.values()))
+        shape = ("get_plans", tuple(attributes), cls.__shape__(constrains), table_name,
+                 cls.__shape__(detail_constrains))
+        return cls.__compiled__(shape, build,
+                                list(value[1] for value in constrains.values()) +
+                                list(value[1] for value in detail_constrains.values()))
 
     @classmethod
     def get_eye_insurance(cls, insurance_type, group_type, age, metal_level_id):
@@ -133,9 +466,10 @@ class Query:
                 "AND plan_benefit_limitation.benefit_name LIKE ALL (ARRAY [%s, %s]) " \
                 "GROUP BY r1.plan_id, rate_individual.effective_date, rate_individual.expiration_date, benefit_name, " \
                 "limit_qty, limit_unit"
-        return cls.__query__(query, (metal_level_id, age, age, key1, key2))
+        return cls.__prepared__("get_eye_insurance", query, (metal_level_id, age, age, key1, key2))
 
     @classmethod
+    @cached
     def get_benefit_list(cls):
         query = "SELECT DISTINCT benefit_name FROM plan_benefit ORDER BY benefit_name ASC"
         return cls.__query__(query)
@@ -147,44 +481,48 @@ class Query:
                 "WHERE plan_benefit.benefit_name = %s AND plan_benefit.plan_id = plan_benefit_limitation.plan_id " \
                 "GROUP BY plan_benefit.plan_id, plan_benefit.benefit_name, plan_benefit_limitation.limit_qty, " \
                 "plan_benefit_limitation.limit_unit"
-        return cls.__query__(query, (benefit_type,))
+        return cls.__prepared__("get_benefit", query, (benefit_type,))
 
     @classmethod
+    @cached
     def get_plan_state(cls):
         query = "SELECT DISTINCT state FROM plans ORDER BY state"
         return cls.__query__(query)
 
     @classmethod
     def plain_query(cls, attributes, table_name, constrains, order_by=None):
-        if order_by:
-            query = sql.SQL("SELECT {} FROM {} WHERE {} ORDER BY {}").format(
-                sql.SQL(',').join(sql.Identifier(attr) for attr in attributes),
-                sql.Identifier(table_name),
-                sql.SQL(" AND ").join(cls.__generate_conditions__(constrains)),
-                sql.Identifier(order_by)
-            )
+        def build():
+            if order_by:
+                return sql.SQL("SELECT {} FROM {} WHERE {} ORDER BY {}").format(
+                    sql.SQL(',').join(sql.Identifier(attr) for attr in attributes),
+                    sql.Identifier(table_name),
+                    sql.SQL(" AND ").join(cls.__generate_conditions__(constrains)),
+                    sql.Identifier(order_by)
+                )
 
-        else:
-            query = sql.SQL("SELECT {} FROM {} WHERE {}").format(
+            return sql.SQL("SELECT {} FROM {} WHERE {}").format(
                 sql.SQL(',').join(sql.Identifier(attr) for attr in attributes),
                 sql.Identifier(table_name),
                 sql.SQL(" AND ").join(cls.__generate_conditions__(constrains))
             )
 
-        return cls.__query__(query, list(value[1] for value in constrains.values()))
+        shape = ("plain_query", tuple(attributes), table_name, cls.__shape__(constrains), order_by)
+        return cls.__compiled__(shape, build, list(value[1] for value in constrains.values()))
 
     @classmethod
     def plain_query_one(cls, attributes, table_name, constrains):
-        query = sql.SQL("SELECT {} FROM {} WHERE {}").format(
-            sql.SQL(',').join(sql.Identifier(attr) for attr in attributes),
-            sql.Identifier(table_name),
-            sql.SQL(" AND ").join(cls.__generate_conditions__(constrains))
-        )
+        def build():
+            return sql.SQL("SELECT {} FROM {} WHERE {}").format(
+                sql.SQL(',').join(sql.Identifier(attr) for attr in attributes),
+                sql.Identifier(table_name),
+                sql.SQL(" AND ").join(cls.__generate_conditions__(constrains))
+            )
 
-        return cls.__query_one__(query, list(value[1] for value in constrains.values()))
+        shape = ("plain_query_one", tuple(attributes), table_name, cls.__shape__(constrains))
+        return cls.__compiled__(shape, build, list(value[1] for value in constrains.values()), one=True)
 
     @classmethod
-    def get_tobacco_insurance(cls, wellness, age):
+    def get_tobacco_insurance(cls, wellness, age, year=const.REQ_PLAN_YEAR):
         query = "SELECT r1.plan_id, AVG(rate_individual.individual_rate), AVG(rate_individual.individual_tobacco_rate) " \
                 "FROM rate_individual, " \
                 "(SELECT plans.std_component_id, plans.plan_id FROM medical_plans " \
@@ -192,9 +530,11 @@ class Query:
                 "WHERE medical_plans.is_wellness_program_offered = %s) r1 " \
                 "WHERE tobacco = True AND rate_individual.std_component_id = r1.std_component_id " \
                 "AND rate_individual.age_range_from <= %s AND rate_individual.age_range_to >= %s " \
-                "AND rate_individual.effective_date = '2020-01-01' AND rate_individual.expiration_date = '2020-12-31' " \
+                "AND rate_individual.effective_date = %s AND rate_individual.expiration_date = %s " \
                 "GROUP BY r1.plan_id, rate_individual.age_range_from, rate_individual.age_range_to"
-        return cls.__query__(query, (wellness, age, age))
+        # Dates of one plan year, only its partition is read (pruned at execution with a generic plan)
+        return cls.__prepared__("get_tobacco_insurance", query,
+                                (wellness, age, age, "%d-01-01" % year, "%d-12-31" % year))
 
 
 class Mongo:
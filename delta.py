@@ -0,0 +1,290 @@
+# incremental loading of new releases through source row fingerprints
+import collections
+import hashlib
+import io
+import time
+
+from psycopg2 import sql
+from tabulate import tabulate
+
+import mapping
+import staging
+import writers
+import constants as const
+
+PREFIX = "delta_"
+ALIAS = "k"
+
+# How the rows of a table follow their source row
+REPLACE = "replace"  # deleted and inserted again when the source row changes or goes
+UPSERT = "upsert"  # updated in place, rows of other data sets reference them
+DEPENDENT = "dependent"  # filled by another data set, only deleted with removed source rows
+
+
+def fingerprint(row):
+    """
+    :param row: positional csv row
+    :return: 16 byte digest of every cell of the row
+    """
+    return hashlib.blake2b("\x1f".join(row).encode(), digest_size=16).digest()
+
+
+class DeltaTable:
+    """
+    A table filled from a data set, and how to find the rows of a source
+    row key in it.
+    """
+
+    def __init__(self, table_mapping, key, mode=REPLACE, where=None):
+        """
+        :param table_mapping: mapping.Mapping of the table, the key columns are converted from the source key
+        :param key: table columns holding the source row key
+        :param mode: REPLACE, UPSERT or DEPENDENT
+        :param where: function(cell) -> SQL condition on the source key, for tables filled by some rows only
+        """
+        self.table = table_mapping.table
+        self.key = key
+        self.mode = mode
+        self.where = where
+        self.key_mapping = mapping.Mapping(self.table, [column for column in table_mapping.definition
+                                                        if set(column.target) & set(key)])
+
+
+class Delta:
+    """
+    Changes of one data set since its last load.
+
+    classify() fingerprints every record of the new release and compares it
+    with load_fingerprints, by row key: the natural key of the tables the
+    record fills. The usual loader then writes the new and changed records
+    only, into UNLOGGED delta_<table> copies (see writer()), and apply()
+    merges them set based in one transaction: rows of changed and removed
+    keys are deleted children first, UPSERT tables are merged with
+    INSERT ... ON CONFLICT DO UPDATE, the other tables are inserted again,
+    and the fingerprints are replaced.
+    """
+
+    def __init__(self, dataset, key, tables):
+        """
+        :param dataset: data set name, see load_data.DATASETS
+        :param key: csv columns of the source row key
+        :param tables: DeltaTable list, referenced tables before the tables referencing them
+        """
+        self.dataset = dataset
+        self.key = key
+        self.tables = tables
+        self.keys_table = PREFIX + dataset + "_keys"
+        self.positions = None
+        self.changed = dict()
+        self.removed = list()
+        self.sources = collections.OrderedDict((state, 0) for state in ("new", "changed", "removed", "unchanged"))
+        self.steps = list()
+
+    def bind(self, index):
+        """
+        :param index: csv column name -> position
+        :return: self
+        """
+        self.positions = [index[column] for column in self.key]
+        return self
+
+    def row_key(self, row):
+        return tuple(row[position] for position in self.positions)
+
+    def classify(self, cursor, index, rows):
+        """
+        Compare the records of a release with the fingerprints of the last load
+        :param cursor: postgres cursor
+        :param index: csv column name -> position
+        :param rows: records of the release
+        :return: number of keys to load again
+        """
+        cursor.execute(sql.SQL("SELECT row_key, fingerprint FROM {} WHERE dataset = %s").format(
+            sql.Identifier(const.TABLE_FINGERPRINT)), (self.dataset,))
+        stored = dict((tuple(key), bytes(digest)) for key, digest in cursor)
+
+        self.bind(index)
+        release = dict()
+        for row in rows:
+            key = self.row_key(row)
+            digest = fingerprint(row)
+            if key in release:
+                # Records sharing a key change together
+                digest = hashlib.blake2b(release[key] + digest, digest_size=16).digest()
+            release[key] = digest
+
+        for key, digest in release.items():
+            old = stored.pop(key, None)
+            if old == digest:
+                self.sources["unchanged"] += 1
+                continue
+            self.sources["new" if old is None else "changed"] += 1
+            self.changed[key] = digest
+        self.removed = list(stored)
+        self.sources["removed"] = len(self.removed)
+        return len(self.changed)
+
+    def selected(self, row):
+        """
+        :param row: positional csv row, see bind()
+        :return: the record is new or changed
+        """
+        return self.row_key(row) in self.changed
+
+    def keys(self):
+        """
+        :return: source keys of the new, changed and removed records
+        """
+        return list(self.changed) + self.removed
+
+    def prepare(self, cursor):
+        """
+        Create the delta tables and the table of changed keys
+        :param cursor: postgres cursor
+        :return: N/A
+        """
+        for table in self.tables:
+            if table.mode != DEPENDENT:
+                self.create(cursor, PREFIX + table.table, sql.SQL("(LIKE {})").format(sql.Identifier(table.table)))
+
+        self.create(cursor, self.keys_table, sql.SQL("({}, removed BOOLEAN, fingerprint BYTEA)").format(
+            sql.SQL(", ").join(sql.Identifier(column) + sql.SQL(" TEXT") for column in self.key)))
+        data = io.StringIO()
+        for key, removed, digest in ([(key, False, digest) for key, digest in self.changed.items()] +
+                                     [(key, True, None) for key in self.removed]):
+            values = key + (removed, None if digest is None else "\\x" + digest.hex())
+            data.write('\t'.join(writers.copy_value(value) for value in values))
+            data.write('\n')
+        data.seek(0)
+        cursor.copy_expert(sql.SQL("COPY {} FROM STDIN").format(sql.Identifier(self.keys_table)).as_string(cursor),
+                           data)
+
+    def writer(self, inner):
+        """
+        :param inner: writer of the load
+        :return: writer sending the tuples of the data set tables to their delta table
+        """
+        return RedirectWriter(inner, dict((table.table, PREFIX + table.table) for table in self.tables
+                                          if table.mode != DEPENDENT))
+
+    def apply(self, cursor):
+        """
+        Merge the delta tables into the data set tables and store the new fingerprints.
+        Runs in the caller's transaction.
+        :param cursor: postgres cursor
+        :return: N/A
+        """
+        keys = sql.SQL("{} AS {}").format(sql.Identifier(self.keys_table), sql.Identifier(ALIAS))
+        for table in reversed(self.tables):
+            condition = self.match(cursor, table)
+            if table.mode != REPLACE:
+                condition += sql.SQL(" AND {}.removed").format(sql.Identifier(ALIAS))
+            self.run(cursor, table.table, "delete", sql.SQL("DELETE FROM {} AS t USING {} WHERE {}").format(
+                sql.Identifier(table.table), keys, condition))
+
+        for table in self.tables:
+            source = sql.SQL("SELECT * FROM {}").format(sql.Identifier(PREFIX + table.table))
+            if table.mode == REPLACE:
+                self.run(cursor, table.table, "insert", sql.SQL("INSERT INTO {} ").format(
+                    sql.Identifier(table.table)) + source)
+            elif table.mode == UPSERT:
+                self.upsert(cursor, table, source)
+
+        # Fingerprints of removed and changed keys go, the ones of new and changed keys come
+        row_key = sql.SQL("ARRAY[{}]").format(sql.SQL(", ").join(sql.Identifier(ALIAS, column)
+                                                                 for column in self.key))
+        cursor.execute(sql.SQL("DELETE FROM {} AS f USING {} WHERE f.dataset = %s AND f.row_key = {}").format(
+            sql.Identifier(const.TABLE_FINGERPRINT), keys, row_key), (self.dataset,))
+        cursor.execute(sql.SQL("INSERT INTO {} (dataset, row_key, fingerprint) SELECT %s, {}, {}.fingerprint "
+                               "FROM {} WHERE NOT {}.removed").format(
+            sql.Identifier(const.TABLE_FINGERPRINT), row_key, sql.Identifier(ALIAS), keys, sql.Identifier(ALIAS)),
+            (self.dataset,))
+        self.drop(cursor)
+
+    def match(self, cursor, table):
+        """
+        :return: SQL condition joining the rows of a table (t) to their source key (k)
+        """
+        types = staging.column_types(cursor, table.table)
+        cell = lambda name: sql.Identifier(ALIAS, name)
+        conditions = [sql.SQL("t.{} = CAST({} AS {})").format(sql.Identifier(column), expression,
+                                                               sql.SQL(types[column]))
+                      for column, expression in zip(table.key_mapping.columns, table.key_mapping.select(cell))
+                      if column in table.key]
+        if table.where is not None:
+            conditions.append(table.where(cell))
+        return sql.SQL(" AND ").join(conditions)
+
+    def upsert(self, cursor, table, source):
+        columns = [column for column in staging.column_types(cursor, table.table) if column not in table.key]
+        began = time.perf_counter()
+        cursor.execute(sql.SQL("INSERT INTO {} {} ON CONFLICT ({}) DO UPDATE SET ({}) = ROW({}) "
+                               "RETURNING xmax = 0").format(
+            sql.Identifier(table.table), source,
+            sql.SQL(", ").join(sql.Identifier(column) for column in table.key),
+            sql.SQL(", ").join(sql.Identifier(column) for column in columns),
+            sql.SQL(", ").join(sql.SQL("EXCLUDED.") + sql.Identifier(column) for column in columns)))
+        # xmax is 0 for inserted tuples, set for updated ones
+        inserted = sum(1 for (new,) in cursor if new)
+        self.steps.append([table.table, "insert", inserted, time.perf_counter() - began])
+        self.steps.append([table.table, "update", cursor.rowcount - inserted, 0.0])
+
+    def run(self, cursor, table, step, statement):
+        began = time.perf_counter()
+        cursor.execute(statement)
+        self.steps.append([table, step, cursor.rowcount, time.perf_counter() - began])
+
+    def create(self, cursor, name, definition):
+        cursor.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(name)))
+        cursor.execute(sql.SQL("CREATE UNLOGGED TABLE {} ").format(sql.Identifier(name)) + definition)
+
+    def drop(self, cursor):
+        for name in [PREFIX + table.table for table in self.tables if table.mode != DEPENDENT] + [self.keys_table]:
+            cursor.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(name)))
+
+    def report(self):
+        print("Source keys: " + ", ".join("%d %s" % (count, state) for state, count in self.sources.items()))
+        rows = collections.OrderedDict((table.table, collections.Counter()) for table in self.tables)
+        seconds = collections.Counter()
+        for table, step, count, spent in self.steps:
+            rows[table][step] += count
+            seconds[table] += spent
+        print(tabulate([[table, counts["insert"], counts["update"], counts["delete"], "%.2f" % seconds[table]]
+                        for table, counts in rows.items()],
+                       headers=["Table", "Inserted", "Updated", "Deleted", "Seconds"], tablefmt="fancy_grid"))
+
+
+class RedirectWriter:
+    """
+    Writer renaming the tables of the tuples it hands to another writer.
+    """
+
+    def __init__(self, inner, tables):
+        """
+        :param inner: writer
+        :param tables: table name -> name written instead, other tables are written unchanged
+        """
+        self.inner = inner
+        self.tables = tables
+
+    @property
+    def stats(self):
+        """
+        TableStats of the inner writer, counted under the names written instead
+        """
+        return self.inner.stats
+
+    def write(self, table, columns, values):
+        self.inner.write(self.tables.get(table, table), columns, values)
+
+    def execute(self, statement, params=None):
+        self.inner.execute(statement, params)
+
+    def flush(self):
+        self.inner.flush()
+
+    def report(self):
+        self.inner.report()
+
+    def close(self):
+        pass
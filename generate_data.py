@@ -0,0 +1,621 @@
+# synthetic CMS PUF data sets shaped like the 2020 release, for load benchmarks
+import argparse
+import collections
+import csv
+import gzip
+import os
+import random
+
+import constants as const
+
+FILE_PLAN = "Plan_Attributes_PUF.csv"
+FILE_BENEFITS = "Benefits_Cost_Sharing_PUF.csv"
+FILE_RATE = "Rate_PUF.csv"
+FILE_BUSINESS_RULES = "Business_Rules_PUF.csv"
+
+# States of the federal exchange and their number of rating areas, weighted by issuer count
+STATES = collections.OrderedDict([
+    ("AK", 3), ("AL", 13), ("AR", 7), ("AZ", 7), ("DE", 1), ("FL", 67), ("GA", 16), ("HI", 1), ("IA", 7),
+    ("IL", 13), ("IN", 17), ("KS", 7), ("LA", 8), ("MI", 16), ("MO", 10), ("MS", 6), ("MT", 4), ("NC", 16),
+    ("ND", 4), ("NE", 4), ("NH", 1), ("NJ", 1), ("NY", 8), ("OH", 17), ("OK", 5), ("OR", 7), ("SC", 46),
+    ("SD", 5), ("TN", 8), ("TX", 26), ("UT", 6), ("VT", 1), ("VA", 12), ("WI", 16), ("WV", 11), ("WY", 3)])
+STATE_WEIGHTS = {"FL": 6, "TX": 6, "IL": 4, "OH": 4, "MI": 4, "GA": 3, "NC": 3, "WI": 4, "NY": 3, "VA": 3}
+
+# Community rated states: rates by family tier ("Family Option") instead of by age
+FAMILY_TIER_STATES = ("NY", "VT")
+
+# Type names of the enumeration tables in schema.sql, with their share of the records
+MARKET_COVERAGE = [("Individual", 70), ("SHOP (Small Group)", 30)]
+MEDICAL_PLAN_TYPES = [("HMO", 45), ("PPO", 25), ("EPO", 20), ("POS", 10)]
+DENTAL_PLAN_TYPES = [("PPO", 70), ("HMO", 20), ("Indemnity", 10)]
+QHP_TYPES = [("On the Exchange", 30), ("Off the Exchange", 15), ("Both", 55)]
+DESIGN_TYPES = [("Not Applicable", 60), ("Design Type 1", 8), ("Design Type 2", 12), ("Design Type 3", 10),
+                ("Design Type 4", 6), ("Design Type 5", 4)]
+CHILD_ONLY = [("Allows Adult and Child-Only", 85), ("Allows Adult-Only", 10), ("Allows Child-Only", 5)]
+INDIVIDUAL_METALS = [("Bronze", 25), ("Expanded Bronze", 10), ("Silver", 30), ("Gold", 25), ("Platinum", 4),
+                     ("Catastrophic", 6)]
+SHOP_METALS = [("Bronze", 20), ("Silver", 35), ("Gold", 35), ("Platinum", 10)]
+DENTAL_METALS = [("High", 50), ("Low", 50)]
+RATE_RULES = [("A different rate (specifically for parties of two or more)for each enrollee is added together", 85),
+              ("There are rates specifically for couples and for families (not just addition of individual rates)",
+               15)]
+AGE_RULES = [("Age on effective date", 80), ("Age on insurance date (age on birthday nearest the effective date)", 5),
+             ("Age on January 1st of the effective date year", 15)]
+COHABIT_TYPES = ["Spouse", "Adopted Child", "Foster Child", "Stepson or Stepdaughter", "Ward",
+                 "Grandson or Granddaughter", "Nephew or Niece", "Brother or Sister", "Self"]
+FAMILY_TIERS = [const.CSV_RATE_COUPLE, const.CSV_RATE_PRIM_ONE_DEPENDENT, const.CSV_RATE_PRIM_TWO_DEPENDENT,
+                const.CSV_RATE_PRIM_THREE_DEPENDENT, const.CSV_RATE_COUPLE_ONE_DEPENDENT,
+                const.CSV_RATE_COUPLE_TWO_DEPENDENT, const.CSV_RATE_COUPLE_THREE_DEPENDENT]
+FAMILY_TIER_FACTORS = [2.0, 1.7, 1.7, 1.7, 2.85, 2.85, 2.85]
+DISEASES = ["Asthma", "Heart Disease", "Depression", "Diabetes", "High Blood Pressure and High Cholesterol",
+            "Low Back Pain", "Pain Management", "Pregnancy", "Weight Loss Programs"]
+
+# Federal default age curve, 21 year old = 1.0
+AGES = ["0-14"] + [str(age) for age in range(15, 64)] + ["64 and over"]
+AGE_FACTORS = [0.765, 0.833, 0.859, 0.885, 0.913, 0.941, 0.970, 1.000, 1.000, 1.000, 1.000, 1.004, 1.024, 1.048,
+               1.087, 1.119, 1.135, 1.159, 1.183, 1.198, 1.214, 1.222, 1.230, 1.238, 1.246, 1.262, 1.278, 1.302,
+               1.325, 1.357, 1.397, 1.444, 1.500, 1.563, 1.635, 1.706, 1.786, 1.865, 1.952, 2.040, 2.135, 2.230,
+               2.333, 2.437, 2.548, 2.603, 2.714, 2.810, 2.873, 2.952, 3.000]
+
+# Monthly premium of a 21 year old, deductible and maximum out of pocket ranges per metal level
+PREMIUMS = {"Catastrophic": 230, "Expanded Bronze": 300, "Bronze": 290, "Silver": 370, "Gold": 430,
+            "Platinum": 520, "High": 38, "Low": 26}
+DEDUCTIBLES = {"Catastrophic": (8150, 8150), "Expanded Bronze": (5000, 7500), "Bronze": (5500, 8150),
+               "Silver": (2500, 4800), "Gold": (500, 1750), "Platinum": (0, 500), "High": (50, 75), "Low": (50, 100)}
+MOOPS = {"Catastrophic": (8150, 8150), "Expanded Bronze": (7500, 8150), "Bronze": (7500, 8150),
+         "Silver": (6500, 8150), "Gold": (4500, 7900), "Platinum": (1500, 4000), "High": (350, 350),
+         "Low": (350, 350)}
+# Cost sharing reduction variants of silver plans: plan id suffix -> share of the deductible and MOOP left
+CSR_VARIANTS = collections.OrderedDict([("01", None), ("02", 0.0), ("03", None), ("04", 0.75), ("05", 0.3),
+                                        ("06", 0.1)])
+CSR_NAMES = {"00": "Standard Off Exchange Plan", "01": "Standard On Exchange Plan",
+             "02": "Zero Cost Sharing Plan Variation", "03": "Limited Cost Sharing Plan Variation",
+             "04": "73% AV Level Silver Plan", "05": "87% AV Level Silver Plan", "06": "94% AV Level Silver Plan"}
+
+# Benefits of a medical plan: name, cost sharing style
+MEDICAL_BENEFITS = [
+    ("Primary Care Visit to Treat an Injury or Illness", "visit"), ("Specialist Visit", "specialist"),
+    ("Other Practitioner Office Visit (Nurse, Physician Assistant)", "visit"),
+    ("Outpatient Facility Fee (e.g.,  Ambulatory Surgery Center)", "facility"),
+    ("Outpatient Surgery Physician/Surgical Services", "facility"), ("Hospice Services", "free"),
+    ("Routine Dental Services (Adult)", "excluded"), ("Infertility Treatment", "excluded"),
+    ("Long-Term/Custodial Nursing Home Care", "excluded"), ("Private-Duty Nursing", "facility"),
+    ("Routine Eye Exam (Adult)", "excluded"), ("Urgent Care Centers or Facilities", "visit"),
+    ("Home Health Care Services", "facility"), ("Emergency Room Services", "emergency"),
+    ("Emergency Transportation/Ambulance", "emergency"), ("Inpatient Hospital Services (e.g., Hospital Stay)", "stay"),
+    ("Inpatient Physician and Surgical Services", "facility"), ("Bariatric Surgery", "excluded"),
+    ("Cosmetic Surgery", "excluded"), ("Skilled Nursing Facility", "stay"),
+    ("Prenatal and Postnatal Care", "free"), ("Delivery and All Inpatient Services for Maternity Care", "stay"),
+    ("Mental/Behavioral Health Outpatient Services", "visit"), ("Mental/Behavioral Health Inpatient Services", "stay"),
+    ("Substance Abuse Disorder Outpatient Services", "visit"), ("Substance Abuse Disorder Inpatient Services", "stay"),
+    ("Generic Drugs", "drug"), ("Preferred Brand Drugs", "drug"), ("Non-Preferred Brand Drugs", "drug"),
+    ("Specialty Drugs", "specialty"), ("Outpatient Rehabilitation Services", "limited"),
+    ("Habilitation Services", "limited"), ("Chiropractic Care", "limited"), ("Durable Medical Equipment", "facility"),
+    ("Hearing Aids", "excluded"), ("Imaging (CT/PET Scans, MRIs)", "facility"),
+    ("Preventive Care/Screening/Immunization", "free"), ("Routine Foot Care", "excluded"),
+    ("Acupuncture", "excluded"), ("Weight Loss Programs", "excluded"), ("Routine Eye Exam for Children", "free"),
+    ("Eye Glasses for Children", "free"), ("Dental Check-Up for Children", "excluded"),
+    ("Rehabilitative Speech Therapy", "limited"), ("Rehabilitative Occupational and Rehabilitative Physical Therapy",
+                                                   "limited"),
+    ("Well Baby Visits and Care", "free"), ("Laboratory Outpatient and Professional Services", "facility"),
+    ("X-rays and Diagnostic Imaging", "facility"), ("Basic Dental Care - Child", "excluded"),
+    ("Orthodontia - Child", "excluded"), ("Major Dental Care - Child", "excluded"),
+    ("Basic Dental Care - Adult", "excluded"), ("Orthodontia - Adult", "excluded"),
+    ("Major Dental Care - Adult", "excluded"), ("Abortion for Which Public Funding is Prohibited", "excluded"),
+    ("Transplant", "stay"), ("Accidental Dental", "facility"), ("Dialysis", "facility"),
+    ("Allergy Testing", "specialist"), ("Chemotherapy", "facility"), ("Radiation", "facility"),
+    ("Diabetes Education", "free"), ("Prosthetic Devices", "facility"), ("Infusion Therapy", "facility"),
+    ("Treatment for Temporomandibular Joint Disorders", "excluded"), ("Nutritional Counseling", "limited"),
+    ("Reconstructive Surgery", "facility"), ("Clinical Trials", "facility"), ("Diabetes Care Management", "free"),
+    ("Inherited Metabolic Disorder - PKU", "facility"), ("Off Label Prescription Drugs", "drug"),
+    ("Mental/Behavioral Health Outpatient Office Visit", "visit"),
+    ("Substance Abuse Disorder Outpatient Office Visit", "visit"), ("Telemedicine", "visit"),
+    ("Sterilization", "free"), ("Autism Spectrum Disorders Treatment", "limited")]
+DENTAL_BENEFITS = [
+    ("Routine Dental Services (Adult)", "dental_free"), ("Dental Check-Up for Children", "dental_free"),
+    ("Basic Dental Care - Child", "dental_basic"), ("Orthodontia - Child", "dental_major"),
+    ("Major Dental Care - Child", "dental_major"), ("Basic Dental Care - Adult", "dental_basic"),
+    ("Orthodontia - Adult", "excluded"), ("Major Dental Care - Adult", "dental_major"),
+    ("Accidental Dental", "dental_basic"), ("Dental Anesthesia", "dental_basic"), ("Sealants", "dental_free"),
+    ("Fluoride Treatment", "dental_free"), ("Space Maintainers", "dental_basic"), ("Periodontics", "dental_major"),
+    ("Endodontics", "dental_major"), ("Oral Surgery", "dental_major"), ("Implants", "excluded"),
+    ("Crowns", "dental_major"), ("Dentures", "dental_major"), ("X-rays", "dental_free"),
+    ("Cleanings", "dental_free"), ("Fillings", "dental_basic")]
+# Maximum out of pocket and deductible columns, e.g. MEHBInnTier1IndividualMOOP, TEHBDedOutOfNetFamilyPerGroup
+MOOP_PATTERN = "%s{network}{kind}MOOP"
+DED_PATTERN = "%sDed{network}{kind}"
+NETWORKS = ("InnTier1", "InnTier2", "OutOfNet", "CombInnOon")
+KINDS = (("Individual", 1, ""), ("FamilyPerPerson", 1, " per person"), ("FamilyPerGroup", 2, " per group"))
+
+LIMIT_UNITS = [("Visit(s) per Year", (20, 30, 60)), ("Exam(s) per Year", (1, 2)), ("Days per Year", (60, 100)),
+               ("Visit(s) per Benefit Period", (12, 20)), ("Item(s) per Year", (1,))]
+
+# Constant cells of every record
+SOURCE_NAMES = [("HIOS", 75), ("SERFF", 20), ("OPM", 5)]
+IMPORT_DATE = "10/24/%d 13:05"
+
+
+class Component:
+    """
+    Standard component: one plan design of an issuer, sold as one or more
+    plan variants and rated by rating area.
+    """
+
+    def __init__(self, issuer, product, number, rnd):
+        self.issuer = issuer
+        self.product = product
+        self.state = issuer.state
+        self.std_comp_id = "%s%04d" % (product.product_id, number)
+        self.dental = product.dental
+        self.market = product.market
+        self.plan_type = product.plan_type
+        self.shop = product.market == "SHOP (Small Group)"
+        if self.dental:
+            self.metal = choose(rnd, DENTAL_METALS)
+        else:
+            self.metal = choose(rnd, SHOP_METALS if self.shop else INDIVIDUAL_METALS)
+        self.multi_tier = not self.dental and rnd.random() < 0.1
+        self.moop_integrated = rnd.random() < 0.85
+        self.ded_integrated = rnd.random() < 0.7
+        self.deductible = round_to(rnd.randint(*DEDUCTIBLES[self.metal]), 50)
+        self.moop = max(round_to(rnd.randint(*MOOPS[self.metal]), 50), self.deductible)
+        self.premium = PREMIUMS[self.metal] * issuer.price
+        self.family_option = self.state in FAMILY_TIER_STATES or (self.dental and rnd.random() < 0.5)
+
+        areas = STATES[self.state]
+        first = rnd.randint(1, areas)
+        self.areas = list(range(first, min(areas, first + rnd.randint(0, areas)) + 1))
+
+        if self.dental or self.shop:
+            self.variants = ["01"]
+        elif self.metal == "Silver":
+            self.variants = list(CSR_VARIANTS)
+        else:
+            self.variants = ["01", "02", "03"]
+        if product.qhp_type == "Off the Exchange":
+            self.variants = ["00"]
+
+
+class Product:
+    def __init__(self, issuer, number, rnd):
+        self.product_id = "%s%s%03d" % (issuer.issuer_id, issuer.state, number)
+        self.dental = rnd.random() < 0.3
+        self.market = choose(rnd, MARKET_COVERAGE)
+        self.plan_type = choose(rnd, DENTAL_PLAN_TYPES if self.dental else MEDICAL_PLAN_TYPES)
+        self.qhp_type = choose(rnd, QHP_TYPES)
+
+
+class Issuer:
+    def __init__(self, issuer_id, state, rnd):
+        self.issuer_id = issuer_id
+        self.state = state
+        self.source_name = choose(rnd, SOURCE_NAMES)
+        self.price = rnd.uniform(0.85, 1.2)
+        self.network_id = "%sN%03d" % (state, rnd.randint(1, 999))
+        self.service_area_id = "%sS%03d" % (state, rnd.randint(1, 999))
+        self.formulary_id = "%sF%03d" % (state, rnd.randint(1, 999))
+        self.url = "https://www.issuer%s.example.com" % issuer_id
+
+
+class Release:
+    """
+    Synthetic release of the four CMS PUF files.
+
+    scale 1 is about the size of a national release: 300 issuers, 12k plans,
+    800k benefit records, 2.7M rate records. Plan ids, standard component ids
+    and rating areas are consistent across the files, and the cells the
+    loader parses (cost sharing strings, enumeration type names, ages,
+    amounts, dates, cohabitation rules) follow the formats and rough value
+    distributions of the real files. The same seed writes the same files.
+    """
+
+    def __init__(self, scale=1.0, year=const.SYNTH_YEAR, seed=const.SYNTH_SEED):
+        """
+        :param scale: size relative to the 2020 release
+        :param year: business year
+        :param seed: random seed
+        """
+        self.year = year
+        self.rnd = random.Random(seed)
+        self.import_date = IMPORT_DATE % (year - 1)
+        self.components = list()
+
+        states = list(STATES)
+        weights = [STATE_WEIGHTS.get(state, 1) for state in states]
+        issuer_ids = self.rnd.sample(range(10000, 100000), max(1, int(round(const.SYNTH_ISSUERS * scale))))
+        for issuer_id in issuer_ids:
+            issuer = Issuer(str(issuer_id), self.rnd.choices(states, weights)[0], self.rnd)
+            for number in range(1, self.rnd.randint(1, 4) + 1):
+                product = Product(issuer, number, self.rnd)
+                count = int(self.rnd.triangular(1, 20, 6))
+                self.components += [Component(issuer, product, k + 1, self.rnd) for k in range(count)]
+
+    def common(self, component):
+        return [self.year, component.state, component.issuer.issuer_id, component.issuer.source_name,
+                self.import_date]
+
+    def write(self, directory, compress=False):
+        """
+        Write the four files
+        :param directory: output directory, created when missing
+        :param compress: write .csv.gz files
+        :return: ordered dict file name -> records
+        """
+        os.makedirs(directory, exist_ok=True)
+        counts = collections.OrderedDict()
+        for name, header, rows in ((FILE_PLAN, PLAN_HEADER, self.plans()),
+                                   (FILE_BENEFITS, BENEFIT_HEADER, self.benefits()),
+                                   (FILE_RATE, RATE_HEADER, self.rates()),
+                                   (FILE_BUSINESS_RULES, RULE_HEADER, self.business_rules())):
+            path = os.path.join(directory, name + (".gz" if compress else ""))
+            opener = gzip.open if compress else open
+            with opener(path, "wt", encoding=const.CSV_ENCODING, newline='') as fd:
+                out = csv.writer(fd)
+                out.writerow(header)
+                counts[name] = 0
+                for row in rows:
+                    out.writerow(row)
+                    counts[name] += 1
+            print("%s: %d records" % (path, counts[name]))
+        return counts
+
+    # ------------------------- Plan_Attributes_PUF -------------------------
+
+    def plans(self):
+        rnd = self.rnd
+        for component in self.components:
+            issuer = component.issuer
+            design = "Not Applicable" if component.dental else choose(rnd, DESIGN_TYPES)
+            child_only = choose(rnd, CHILD_ONLY)
+            wellness = yes(rnd, 0.3)
+            for variant in component.variants:
+                plan = dict()
+                plan[const.CSV_PLAN_ISSUER_ID] = issuer.issuer_id
+                plan[const.CSV_PLAN_ID] = "%s-%s" % (component.std_comp_id, variant)
+                plan[const.CSV_PLAN_MARK_NAME] = "%s %s %s %d" % (issuer.issuer_id, component.metal,
+                                                                  component.plan_type, component.deductible)
+                plan[const.CSV_PLAN_VAR_NAME] = "%s %s" % (plan[const.CSV_PLAN_MARK_NAME], CSR_NAMES[variant])
+                plan[const.CSV_STD_COMP_ID] = component.std_comp_id
+                plan[const.CSV_HIOS_PROD_ID] = component.product.product_id
+                plan[const.CSV_HPID] = ""
+                plan[const.CSV_NETWORK_ID] = issuer.network_id
+                plan[const.CSV_SERV_AREA_ID] = issuer.service_area_id
+                plan[const.CSV_FORMULARY_ID] = "" if component.dental else issuer.formulary_id
+                plan[const.CSV_IS_NEW_PLAN] = "New" if rnd.random() < 0.2 else "Existing"
+                plan[const.CSV_MARK_COVERAGE] = component.market
+                plan[const.CSV_PLAN_TYPE] = component.plan_type
+                plan[const.CSV_QHP_TYPE] = component.product.qhp_type
+                plan[const.CSV_DESIGN_TYPE] = design
+                plan[const.CSV_CHILD_ONLY] = child_only
+                plan[const.CSV_COMPOSITE_RATE] = yes(rnd, 0.3) if component.shop else "No"
+                plan[const.CSV_OUT_COUNTRY_COV] = yes(rnd, 0.4)
+                plan[const.CSV_OUT_COUNTRY_COV_DESC] = ("Emergency services only" if
+                                                        plan[const.CSV_OUT_COUNTRY_COV] == "Yes" else "")
+                plan[const.CSV_OUT_SERV_AREA_COV] = yes(rnd, 0.5)
+                plan[const.CSV_OUT_SERV_AREA_COV_DESC] = ("Emergency and urgent care" if
+                                                          plan[const.CSV_OUT_SERV_AREA_COV] == "Yes" else "")
+                plan[const.CSV_PLAN_EXCLUSIONS] = "Cosmetic services" if rnd.random() < 0.1 else ""
+                plan[const.CSV_EST_ADV_PAYMENT_INDIAN] = ""
+                plan[const.CSV_CSR_VAR_TYPE] = CSR_NAMES[variant]
+                plan[const.CSV_MULTI_NETWORK] = "Yes" if component.multi_tier else "No"
+                plan[const.CSV_FIRST_TIER_UTIL] = "%d%%" % rnd.choice((60, 70, 80)) if component.multi_tier else "100%"
+                plan[const.CSV_SECOND_TIER_UTIL] = ("%d%%" % (100 - int(plan[const.CSV_FIRST_TIER_UTIL][:-1]))
+                                                    if component.multi_tier else "")
+                plan[const.CSV_EFFECTIVE_DATE] = "%d-%02d-01" % (self.year, 1 if not component.shop else
+                                                                 rnd.choice((1, 1, 4, 7, 10)))
+                plan[const.CSV_EXPIRATION_DATE] = "%d-12-31" % self.year
+                plan[const.CSV_METAL_LEVEL] = component.metal
+                plan[const.CSV_DENTAL_ONLY] = "Yes" if component.dental else "No"
+                plan[const.CSV_URL_ENROLLMENT] = issuer.url + "/enroll"
+                plan[const.CSV_URL_FORMULARY] = "" if component.dental else issuer.url + "/formulary"
+                plan[const.CSV_URL_BROCHURE] = "%s/plans/%s.pdf" % (issuer.url, plan[const.CSV_PLAN_ID])
+                if component.dental:
+                    self.dental_plan(plan, component)
+                else:
+                    self.medical_plan(plan, component, variant, wellness)
+                self.limits(plan, component, CSR_VARIANTS.get(variant))
+                yield self.common(component) + [plan.get(column, "") for column in PLAN_HEADER[len(COMMON):]]
+
+    def dental_plan(self, plan, component):
+        plan[const.CSV_EHB_PEDIATRIC_QTY] = "%.2f" % self.rnd.uniform(0.5, 1.5)
+        plan[const.CSV_GUARANTEED_RATE] = yes(self.rnd, 0.6)
+
+    def medical_plan(self, plan, component, variant, wellness):
+        rnd = self.rnd
+        plan[const.CSV_PREG_NOTICE] = yes(rnd, 0.2)
+        plan[const.CSV_WELLNESS_OFFER] = wellness
+        plan[const.CSV_UNI_DESIGN] = yes(rnd, 0.1)
+        plan[const.CSV_EHB_PERCENT] = "%.4f" % rnd.uniform(0.98, 1.0)
+        plan[const.CSV_REFERRAL_REQUIRED] = yes(rnd, 0.8 if component.plan_type in ("HMO", "POS") else 0.05)
+        if plan[const.CSV_REFERRAL_REQUIRED] == "Yes":
+            plan[const.CSV_REFERRAL] = "Allergy/Immunology, Cardiology, Dermatology, Neurology, Orthopedics"
+        plan[const.CSV_DED_INTEGRATED] = "Yes" if component.ded_integrated else "No"
+        plan[const.CSV_MOOP_INTEGRATED] = "Yes" if component.moop_integrated else "No"
+        plan[const.CSV_DISEASE_PROGRAM] = (", ".join(sorted(rnd.sample(DISEASES, rnd.randint(1, 6))))
+                                           if rnd.random() < 0.6 else "")
+        # Summary of benefits and coverage examples
+        deductible = min(component.deductible, 2000 + component.deductible // 10)
+        for ded, copay, coins, limit, total in (
+                (const.CSV_DED_BABY, const.CSV_COPAY_BABY, const.CSV_COINS_BABY, const.CSV_LIMIT_BABY, 12700),
+                (const.CSV_DED_DIABETES, const.CSV_COPAY_DIABETES, const.CSV_COINS_DIABETES, const.CSV_LIMIT_DIABETES,
+                 5600),
+                (const.CSV_DED_FRACTURE, const.CSV_COPAY_FRACTURE, const.CSV_COINS_FRACTURE, const.CSV_LIMIT_FRACTURE,
+                 2500)):
+            plan[ded] = dollars(min(deductible, total))
+            plan[copay] = dollars(round_to(rnd.randint(0, total // 10), 10))
+            plan[coins] = dollars(round_to(rnd.randint(0, total // 4), 10))
+            plan[limit] = dollars(rnd.choice((0, 0, 0, 20, 60)))
+
+    def limits(self, plan, component, reduction):
+        """
+        Maximum out of pocket and deductible columns: MEHB (medical) and DEHB (drug), or TEHB when
+        integrated; stand alone dental plans use the MEHB columns
+        """
+        moop, deductible = component.moop, component.deductible
+        if reduction is not None:
+            moop, deductible = moop * reduction, deductible * reduction
+        # Network -> factor of the in network tier 1 amount, missing networks are "Not Applicable"
+        networks = {"InnTier1": 1}
+        if component.multi_tier:
+            networks["InnTier2"] = 1.5
+        if component.plan_type not in ("HMO", "EPO"):
+            networks["OutOfNet"] = 2
+        coinsurance = "No Charge" if component.metal == "Platinum" else "%d.00%%" % self.rnd.choice((0, 10, 20, 30))
+
+        if component.dental:
+            fill(plan, MOOP_PATTERN % "MEHB", networks, moop)
+            fill(plan, DED_PATTERN % "MEHB", networks, deductible, coinsurance)
+            return
+        drug_moop, drug_deductible = moop * 0.15, deductible * 0.1
+        if component.moop_integrated:
+            fill(plan, MOOP_PATTERN % "TEHB", networks, moop)
+        else:
+            fill(plan, MOOP_PATTERN % "MEHB", networks, moop - drug_moop)
+            fill(plan, MOOP_PATTERN % "DEHB", networks, drug_moop)
+        if component.ded_integrated:
+            fill(plan, DED_PATTERN % "TEHB", networks, deductible, coinsurance)
+        else:
+            fill(plan, DED_PATTERN % "MEHB", networks, deductible - drug_deductible, coinsurance)
+            fill(plan, DED_PATTERN % "DEHB", networks, drug_deductible, coinsurance)
+
+    # ------------------------- Benefits_Cost_Sharing_PUF -------------------------
+
+    def benefits(self):
+        rnd = self.rnd
+        for component in self.components:
+            benefits = DENTAL_BENEFITS if component.dental else MEDICAL_BENEFITS
+            # Cost sharing is decided per standard component, variants differ by their deductible only
+            designs = [(name, style, self.cost_sharing(component, style)) for name, style in benefits]
+            for variant in component.variants:
+                plan_id = "%s-%s" % (component.std_comp_id, variant)
+                for name, style, (covered, copay, coins, limit) in designs:
+                    benefit = dict()
+                    benefit[const.CSV_STD_COMP_ID] = component.std_comp_id
+                    benefit[const.CSV_PLAN_ID] = plan_id
+                    benefit[const.CSV_BENEFIT_NAME] = name
+                    benefit[const.CSV_IS_COVER] = "Covered" if covered else "Not Covered"
+                    if covered:
+                        tier2 = None if component.multi_tier else "Not Applicable"
+                        oon = "Not Applicable" if component.plan_type in ("HMO", "EPO") else None
+                        benefit[const.CSV_COPAY_INN_TIER1] = copay
+                        benefit[const.CSV_COPAY_INN_TIER2] = tier2 or copay
+                        benefit[const.CSV_COPAY_OON] = oon or "No Charge"
+                        benefit[const.CSV_COINS_INN_TIER1] = coins
+                        benefit[const.CSV_COINS_INN_TIER2] = tier2 or coins
+                        benefit[const.CSV_COINS_OON] = oon or "50.00%"
+                        benefit[const.CSV_IS_EHB] = "Yes" if style != "excluded" else ""
+                        benefit[const.CSV_EXCL_FROM_INN_MOOP] = yes(rnd, 0.03)
+                        benefit[const.CSV_EXCL_FROM_OON_MOOP] = yes(rnd, 0.3) if not oon else ""
+                        if limit is not None:
+                            benefit[const.CSV_QUANT_LIMIT] = "Yes"
+                            benefit[const.CSV_BENEFIT_LIMIT_QTY], benefit[const.CSV_BENEFIT_LIMIT_UNIT] = limit
+                            benefit[const.CSV_BENEFIT_EXPLANATION] = "Combined limit with related services"
+                        else:
+                            benefit[const.CSV_QUANT_LIMIT] = "No"
+                    else:
+                        benefit[const.CSV_BENEFIT_EXCL] = "Not covered" if rnd.random() < 0.3 else ""
+                    yield self.common(component) + [benefit.get(column, "")
+                                                    for column in BENEFIT_HEADER[len(COMMON):]]
+
+    def cost_sharing(self, component, style):
+        """
+        :return: (covered, copay cell, coinsurance cell, (limit quantity, unit) or None)
+        """
+        rnd = self.rnd
+        if style == "excluded":
+            return rnd.random() < 0.15, "No Charge", "20.00%", None
+        if not rnd.random() < 0.97:
+            return False, "", "", None
+
+        after = rnd.choice(("", "", " after deductible"))
+        coins = "%d.00%%" % rnd.choice((10, 20, 20, 30, 40, 50))
+        limit = None
+        if style in ("free", "dental_free"):
+            copay, coins = "No Charge", "No Charge"
+        elif style == "visit":
+            copay, coins = dollars(rnd.choice((0, 10, 15, 20, 25, 30, 35, 40, 50)), 2) + " Copay" + after, "No Charge"
+        elif style == "specialist":
+            copay, coins = dollars(rnd.choice((40, 50, 60, 65, 75, 80, 100)), 2) + " Copay" + after, "No Charge"
+        elif style == "emergency":
+            if rnd.random() < 0.5:
+                copay, coins = dollars(rnd.choice((250, 350, 400, 500, 750)), 2) + " Copay" + after, "No Charge"
+            else:
+                copay, coins = "No Charge", coins + " Coinsurance after deductible"
+        elif style == "stay":
+            if rnd.random() < 0.4:
+                copay, coins = dollars(rnd.choice((250, 300, 500, 1000)), 2) + rnd.choice(
+                    (" Copay per Day", " Copay per Stay", " Copay per Day after deductible")), "No Charge"
+            else:
+                copay, coins = "No Charge after deductible", coins + " Coinsurance after deductible"
+        elif style == "drug":
+            amount = rnd.choice((0, 3, 5, 10, 15, 20, 35, 50, 75, 100))
+            copay, coins = dollars(amount, 2) + " Copay" + after, "No Charge"
+        elif style == "specialty":
+            copay, coins = "No Charge", coins + rnd.choice((" Coinsurance", " Coinsurance after deductible"))
+        elif style == "dental_basic":
+            copay, coins = "No Charge", coins + " Coinsurance after deductible"
+        elif style == "dental_major":
+            copay, coins = "No Charge", "50.00% Coinsurance after deductible"
+        else:
+            copay, coins = "No Charge", coins + " Coinsurance after deductible"
+        if component.metal == "Catastrophic" and style not in ("free", "visit"):
+            copay, coins = "No Charge after deductible", "No Charge after deductible"
+
+        if style == "limited" or rnd.random() < 0.05:
+            unit, quantities = rnd.choice(LIMIT_UNITS)
+            limit = str(rnd.choice(quantities)), unit
+        return True, copay, coins, limit
+
+    # ------------------------- Rate_PUF -------------------------
+
+    def rates(self):
+        rnd = self.rnd
+        for component in self.components:
+            # Small group rates change every quarter
+            periods = ([("%d-%02d-01" % (self.year, month), "%d-%02d-%02d" % (self.year, month + 2, day))
+                        for month, day in ((1, 31), (4, 30), (7, 30), (10, 31))] if component.shop else
+                       [("%d-01-01" % self.year, "%d-12-31" % self.year)])
+            tobacco = not component.dental and not component.family_option and rnd.random() < 0.4
+            for quarter, (effective, expiration) in enumerate(periods):
+                for area in component.areas:
+                    premium = component.premium * (1 + 0.015 * quarter) * (0.85 + 0.1 * (area % 5))
+                    rate = [effective, expiration, component.std_comp_id, "Rating Area %d" % area]
+                    if component.family_option:
+                        family = ["%.2f" % (premium * factor) for factor in FAMILY_TIER_FACTORS]
+                        yield self.common(component) + [""] + rate + ["No Preference", "Family Option",
+                                                                    "%.2f" % premium, ""] + family
+                        continue
+                    for age, factor in zip(AGES, AGE_FACTORS):
+                        individual = premium * factor
+                        yield self.common(component) + [""] + rate + [
+                            "Tobacco User/Non-Tobacco User" if tobacco else "No Preference", age,
+                            "%.2f" % individual, "%.2f" % (individual * 1.25) if tobacco else ""] + [""] * 7
+
+    # ------------------------- Business_Rules_PUF -------------------------
+
+    def business_rules(self):
+        rnd = self.rnd
+        for component in self.components:
+            if rnd.random() < 0.4:
+                cohabit = ";".join("%s,%s" % (name, yes(rnd, 0.3))
+                                   for name in rnd.sample(COHABIT_TYPES, rnd.randint(1, len(COHABIT_TYPES))))
+            else:
+                cohabit = ""
+            yield self.common(component) + [
+                component.product.product_id, component.std_comp_id, choose(rnd, RATE_RULES),
+                rnd.choice(("3", "Not Applicable")), rnd.choice(("3", "Not Applicable")),
+                "26" if rnd.random() < 0.9 else "Not Applicable", rnd.choice(("3", "Not Applicable")),
+                yes(rnd, 0.7), yes(rnd, 0.9), choose(rnd, AGE_RULES),
+                rnd.choice(("6", "12", "Not Applicable")) if not component.dental else "Not Applicable", cohabit]
+
+
+def choose(rnd, weighted):
+    """
+    :param rnd: random.Random
+    :param weighted: list of (value, weight)
+    :return: one value
+    """
+    values, weights = zip(*weighted)
+    return rnd.choices(values, weights)[0]
+
+
+def yes(rnd, probability):
+    return "Yes" if rnd.random() < probability else "No"
+
+
+def round_to(value, step):
+    return int(round(value / step) * step)
+
+
+def dollars(amount, decimals=0):
+    return "${:,.{}f}".format(amount, decimals)
+
+
+def fill(plan, pattern, networks, amount, coinsurance=None):
+    """
+    Fill the maximum out of pocket or deductible columns of one benefit group
+    :param plan: csv column name -> cell
+    :param pattern: MOOP_PATTERN or DED_PATTERN of the group
+    :param networks: network -> factor of the amount, other networks are "Not Applicable"
+    :param amount: in network tier 1 amount for an individual
+    :param coinsurance: coinsurance cell of the in network tiers, deductibles only
+    :return: N/A
+    """
+    for network in NETWORKS:
+        factor = networks.get(network)
+        for kind, persons, suffix in KINDS:
+            cell = dollars(round_to(amount * factor * persons, 50)) + suffix if factor else "Not Applicable"
+            plan[pattern.format(network=network, kind=kind)] = cell
+        if coinsurance is not None and network in ("InnTier1", "InnTier2"):
+            plan[pattern.format(network=network, kind="Coinsurance")] = coinsurance if factor else "Not Applicable"
+
+
+def limit_columns():
+    """
+    :return: maximum out of pocket and deductible column names, in the order of the CMS file
+    """
+    columns = list()
+    for pattern in (MOOP_PATTERN, DED_PATTERN):
+        for benefit in ("MEHB", "DEHB", "TEHB"):
+            for network in NETWORKS:
+                kinds = [kind for kind, _, _ in KINDS]
+                if pattern == DED_PATTERN and network in ("InnTier1", "InnTier2"):
+                    kinds.append("Coinsurance")
+                columns += [(pattern % benefit).format(network=network, kind=kind) for kind in kinds]
+    return columns
+
+
+COMMON = [const.CSV_PLAN_YEAR, const.CSV_PLAN_STATE, const.CSV_PLAN_ISSUER_ID, const.CSV_SOURCE_NAME,
+          const.CSV_IMPORT_DATE]
+PLAN_HEADER = COMMON + [
+    const.CSV_HIOS_PROD_ID, const.CSV_HPID, const.CSV_NETWORK_ID, const.CSV_SERV_AREA_ID, const.CSV_FORMULARY_ID,
+    const.CSV_IS_NEW_PLAN, const.CSV_MARK_COVERAGE, const.CSV_DENTAL_ONLY, const.CSV_PLAN_MARK_NAME,
+    const.CSV_STD_COMP_ID, const.CSV_PLAN_TYPE, const.CSV_METAL_LEVEL, const.CSV_DESIGN_TYPE, const.CSV_UNI_DESIGN,
+    const.CSV_QHP_TYPE, const.CSV_PREG_NOTICE, const.CSV_REFERRAL_REQUIRED, const.CSV_REFERRAL,
+    const.CSV_PLAN_EXCLUSIONS, const.CSV_EST_ADV_PAYMENT_INDIAN, const.CSV_COMPOSITE_RATE, const.CSV_CHILD_ONLY,
+    const.CSV_WELLNESS_OFFER, const.CSV_DISEASE_PROGRAM, const.CSV_EHB_PERCENT, const.CSV_EHB_PEDIATRIC_QTY,
+    const.CSV_GUARANTEED_RATE, const.CSV_EFFECTIVE_DATE,
+    const.CSV_EXPIRATION_DATE, const.CSV_OUT_COUNTRY_COV, const.CSV_OUT_COUNTRY_COV_DESC,
+    const.CSV_OUT_SERV_AREA_COV, const.CSV_OUT_SERV_AREA_COV_DESC, const.CSV_DED_INTEGRATED,
+    const.CSV_MOOP_INTEGRATED, const.CSV_MULTI_NETWORK, const.CSV_FIRST_TIER_UTIL, const.CSV_SECOND_TIER_UTIL,
+    const.CSV_PLAN_ID, const.CSV_PLAN_VAR_NAME, const.CSV_CSR_VAR_TYPE, const.CSV_DED_BABY, const.CSV_COPAY_BABY,
+    const.CSV_COINS_BABY, const.CSV_LIMIT_BABY, const.CSV_DED_DIABETES, const.CSV_COPAY_DIABETES,
+    const.CSV_COINS_DIABETES, const.CSV_LIMIT_DIABETES, const.CSV_DED_FRACTURE, const.CSV_COPAY_FRACTURE,
+    const.CSV_COINS_FRACTURE, const.CSV_LIMIT_FRACTURE] + limit_columns() + [
+    const.CSV_URL_ENROLLMENT, const.CSV_URL_FORMULARY, const.CSV_URL_BROCHURE]
+BENEFIT_HEADER = COMMON + [
+    const.CSV_STD_COMP_ID, const.CSV_PLAN_ID, const.CSV_BENEFIT_NAME, const.CSV_COPAY_INN_TIER1,
+    const.CSV_COPAY_INN_TIER2, const.CSV_COPAY_OON, const.CSV_COINS_INN_TIER1, const.CSV_COINS_INN_TIER2,
+    const.CSV_COINS_OON, const.CSV_IS_EHB, const.CSV_IS_COVER, const.CSV_QUANT_LIMIT, const.CSV_BENEFIT_LIMIT_QTY,
+    const.CSV_BENEFIT_LIMIT_UNIT, const.CSV_BENEFIT_EXCL, const.CSV_BENEFIT_EXPLANATION,
+    const.CSV_EXCL_FROM_INN_MOOP, const.CSV_EXCL_FROM_OON_MOOP]
+RATE_HEADER = COMMON + [
+    "FederalTIN", const.CSV_RATE_EFF_DATE, const.CSV_RATE_EXPI_DATE, const.CSV_RATE_STD_COMP_ID,
+    const.CSV_RATE_AREA_ID, const.CSV_RATE_TOBACCO, const.CSV_RATE_AGE, const.CSV_RATE_INDI_RATE,
+    const.CSV_RATE_INDI_TOBACCO_RATE] + FAMILY_TIERS
+RULE_HEADER = COMMON + [
+    const.CSV_RULE_PROD_ID, const.CSV_RULE_STD_COMP_ID, const.CSV_RULE_RATE_RULE_TYPE,
+    const.CSV_RULE_TWO_PARENTS_MAX_DEPENDENT, const.CSV_RULE_SINGLE_PARENT_MAX_DEPENDENT,
+    const.CSV_RULE_DEPENDENT_MAX_AGE, const.CSV_RULE_CHILD_ONLY_MAX_CHILDREN,
+    const.CSV_RULE_DOMESTIC_PARTNER_AS_SPOUSE, const.CSV_RULE_SAME_SEX_PARTNER_AS_SPOUSE,
+    const.CSV_RULE_AGE_DETERMINE_RULE, const.CSV_RULE_MIN_TOBACCO_FREE_MONTHS, const.CSV_RULE_COHABIT_RULE]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write synthetic CMS PUF files for load benchmarks")
+    parser.add_argument("--scale", type=float, default=0.01,
+                        help="size relative to a national release (1 = about 300 issuers, 12k plans, "
+                             "2.7M rate records)")
+    parser.add_argument("--year", type=int, default=const.SYNTH_YEAR, help="business year")
+    parser.add_argument("--seed", type=int, default=const.SYNTH_SEED, help="random seed, same seed same files")
+    parser.add_argument("--out-dir", default="synthetic-dataset", help="directory of the files")
+    parser.add_argument("--gzip", action="store_true", help="write .csv.gz files")
+    args = parser.parse_args()
+
+    release = Release(args.scale, args.year, args.seed)
+    print("%d standard components" % len(release.components))
+    release.write(args.out_dir, args.gzip)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+# indexes of the hot query paths of database.Query: migration of existing databases and EXPLAIN ANALYZE check
+import argparse
+import collections
+import re
+import sys
+import time
+
+from psycopg2 import sql
+from tabulate import tabulate
+
+import constants as const
+
+# Index -> (relation, key columns, covered columns, partial index predicate); see schema.sql
+INDEXES = collections.OrderedDict([
+    # Plan search: market coverage is always given, state often; the other filters and the selected columns
+    # are covered, the search is answered from the index
+    ("plans_market_coverage_state_idx", (const.TABLE_PLAN, (const.MARK_COVERAGE, const.PLAN_STATE),
+                                         (const.PLAN_TYPE, const.QHP_TYPE, const.CHILD_ONLY, const.PLAN_ID,
+                                          const.PLAN_VAR_NAME), None)),
+    # Standard component and state of the plans joined to the rates
+    ("plans_plan_id_rate_idx", (const.TABLE_PLAN, (const.PLAN_ID,), (const.STD_COMP_ID, const.PLAN_STATE), None)),
+    ("plans_state_idx", (const.TABLE_PLAN, (const.PLAN_STATE,), (), None)),
+    ("medical_plans_metal_level_idx", (const.TABLE_MEDICAL_PLAN, (const.M_METAL_LEVEL,), (const.PLAN_ID,), None)),
+    ("dental_plans_metal_level_idx", (const.TABLE_DENTAL_PLAN, (const.D_METAL_LEVEL,), (const.PLAN_ID,), None)),
+    # The primary key leads with plan_id, benefits are also looked up by name
+    ("plan_benefit_benefit_name_idx", (const.TABLE_BENEFIT, (const.BENEFIT_NAME,), (const.PLAN_ID,), None)),
+    # Rates by standard component and age, clustered on (maintenance.py); the periods and rate are covered
+    ("rate_individual_std_component_idx", (const.TABLE_RATE_INDIVIDUAL,
+                                           (const.RATE_STD_COMP_ID, const.RATE_AGE_FROM, const.RATE_AGE_TO),
+                                           (const.RATE_EFF_DATE, const.RATE_EXPI_DATE, const.RATE_INDI_RATE), None)),
+    # Tobacco rates only, a constant predicate the generic plan of a prepared statement can use too
+    ("rate_individual_tobacco_idx", (const.TABLE_RATE_INDIVIDUAL,
+                                     (const.RATE_STD_COMP_ID, const.RATE_AGE_FROM, const.RATE_AGE_TO),
+                                     (const.RATE_EFF_DATE, const.RATE_EXPI_DATE, const.RATE_INDI_RATE,
+                                      const.RATE_INDI_TOBACCO_RATE), const.RATE_TOBACCO)),
+    ("rate_family_std_component_idx", (const.TABLE_RATE_FAMILY, (const.RATE_FAM_STD_COMP_ID, const.RATE_FAM_TYPE),
+                                       (), None)),
+])
+
+# Query method -> indexes its plan must use, with the arguments of maintenance.sample_queries
+EXPECTED = collections.OrderedDict([
+    ("get_time_intervals", ("medical_plans_metal_level_idx", "plans_plan_id_rate_idx",
+                            "rate_individual_std_component_idx")),
+    ("get_plans", ("plans_market_coverage_state_idx", "medical_plans_metal_level_idx")),
+    ("get_eye_insurance", ("medical_plans_metal_level_idx", "rate_individual_std_component_idx")),
+    ("get_benefit_list", ("plan_benefit_benefit_name_idx",)),
+    ("get_benefit", ("plan_benefit_benefit_name_idx",)),
+    ("get_plan_state", ("plans_state_idx",)),
+    ("get_tobacco_insurance", ("rate_individual_tobacco_idx",)),
+    ("get_avg_rate", ("medical_plans_metal_level_idx", "rate_individual_std_component_idx")),
+    ("plain_query", ("plan_benefit_pkey",)),
+    ("plain_query_one", ("plans_pkey",)),
+])
+
+CREATE = "create"
+REBUILD = "rebuild"
+CURRENT = "current"
+
+DEFINITIONS = """
+SELECT c.relname::text, pg_get_indexdef(c.oid), i.indisvalid
+FROM pg_class c
+         JOIN pg_index i ON i.indexrelid = c.oid
+WHERE c.relname = ANY (%s)
+"""
+
+# Indexes of the partitions a plan reads belong to the index of the partitioned table
+ROOT_INDEXES = """
+SELECT c.relname::text, coalesce(r.relname, c.relname)::text
+FROM pg_class c
+         LEFT JOIN pg_class r ON r.oid = pg_partition_root(c.oid)
+WHERE c.relname = ANY (%s)
+"""
+
+
+def definition(name):
+    """
+    :return: CREATE INDEX statement of an index of INDEXES, as written in schema.sql
+    """
+    table, columns, include, predicate = INDEXES[name]
+    text = "CREATE INDEX %s ON %s (%s)" % (name, table, ", ".join(columns))
+    if include:
+        text += " INCLUDE (%s)" % ", ".join(include)
+    if predicate:
+        text += " WHERE %s" % predicate
+    return text
+
+
+def normalize(text):
+    """
+    :return: index definition without what pg_get_indexdef adds (schema, ONLY, btree, quotes, parentheses)
+    """
+    text = text.lower().replace(" on only ", " on ").replace(" using btree ", " ").replace("public.", "")
+    return " ".join(re.sub(r'[()"]', " ", text).split())
+
+
+def migrate(cursor, names=INDEXES):
+    """
+    Bring the indexes of a database set up with an older schema.sql up to INDEXES: missing ones are
+    created, invalid ones and ones with another definition are dropped and created again. Indexes of
+    the partitioned rate tables are built on every partition; the tables are locked against writes
+    while their indexes build
+    :param cursor: postgres cursor
+    :param names: indexes of INDEXES
+    :return: report steps
+    """
+    cursor.execute(sql.SQL("SELECT count(*) FROM {}").format(sql.Identifier(const.TABLE_DEFERRED_DDL)))
+    if cursor.fetchone()[0]:
+        raise ValueError("Indexes are set aside by a fast load, rebuild them first (python3 constraints.py)")
+    cursor.execute(DEFINITIONS, (list(names),))
+    current = dict((name, (text, valid)) for name, text, valid in cursor.fetchall())
+
+    steps = list()
+    for name in names:
+        table = INDEXES[name][0]
+        if name not in current:
+            action = CREATE
+        elif not current[name][1] or normalize(current[name][0]) != normalize(definition(name)):
+            # An invalid index, e.g. a partitioned one created ON ONLY the parent, is not used by any plan
+            action = REBUILD
+        else:
+            steps.append([name, table, CURRENT, ""])
+            continue
+        start = time.perf_counter()
+        if action == REBUILD:
+            cursor.execute(sql.SQL("DROP INDEX {}").format(sql.Identifier(name)))
+        cursor.execute(sql.SQL(definition(name)))
+        steps.append([name, table, action, "%.2f" % (time.perf_counter() - start)])
+    return steps
+
+
+def used_indexes(plan):
+    """
+    :param plan: node of an EXPLAIN (FORMAT JSON) plan
+    :return: names of the indexes scanned by the node and the nodes below it
+    """
+    names = set()
+    if "Index Name" in plan:
+        names.add(plan["Index Name"])
+    for child in plan.get("Plans", ()):
+        names |= used_indexes(child)
+    return names
+
+
+def verify(expected=EXPECTED):
+    """
+    Run each Query method of maintenance.sample_queries once under EXPLAIN (ANALYZE), bypassing the
+    result cache, and check that its plans use the expected indexes
+    :param expected: query -> indexes
+    :return: report rows, number of expected indexes not used
+    """
+    # database connects when imported
+    from database import Query
+    from maintenance import sample_queries
+
+    data = list()
+    missing = 0
+    with Query.session() as session, Query.uncached():
+        for name, query in sample_queries().items():
+            session.plans = list()
+            try:
+                query()
+                plans = session.plans
+            finally:
+                session.plans = None
+            used = set()
+            for plan in plans:
+                used |= used_indexes(plan["Plan"])
+            with session.connection.cursor() as cursor:
+                cursor.execute(ROOT_INDEXES, (list(used),))
+                used = set(root for _, root in cursor.fetchall())
+            execution = sum(plan["Execution Time"] for plan in plans)
+            for index in expected.get(name, ()):
+                found = index in used
+                missing += not found
+                data.append([name, index, "yes" if found else "NO", ", ".join(sorted(used - {index})),
+                             "%.2f" % execution])
+    return data, missing
+
+
+if __name__ == '__main__':
+    from load_data import connect
+
+    parser = argparse.ArgumentParser(description="Create or rebuild the indexes of the hot query paths and check "
+                                                 "with EXPLAIN ANALYZE that the Query methods use them")
+    parser.add_argument("--check-only", action="store_true", help="leave the indexes as they are")
+    options = parser.parse_args()
+
+    if not options.check_only:
+        connection = connect()
+        with connection.cursor() as cursor:
+            steps = migrate(cursor)
+        connection.commit()
+        connection.close()
+        print(tabulate(steps, headers=["Index", "Table", "Action", "Seconds"], tablefmt="fancy_grid"))
+
+    rows, not_used = verify()
+    print(tabulate(rows, headers=["Query", "Index", "Used", "Other indexes", "Execution (ms)"],
+                   tablefmt="fancy_grid"))
+    if not_used:
+        print("%d expected indexes not used; the planner may prefer a sequential scan on small tables, "
+              "run maintenance.py (VACUUM ANALYZE) first" % not_used)
+    sys.exit(1 if not_used else 0)
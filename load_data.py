@@ -1,1138 +1,1428 @@
-import csv
+import argparse
+import collections
+import datetime
+import functools
+import multiprocessing
+import os
+import sys
+import time
 import psycopg2.extras
 import pymongo
-
-import utils
+from psycopg2 import sql
+
+import archive
+import shard
+import orchestrator
+import profiling
+import constraints
+import maintenance
+import partitions
+import staging
+import selection
+import checkpoint
+import delta
+import reader
+import references
+import result_cache
+import writers
+import mapping
 import constants as const
-from datetime import datetime
 from enumeration import Enum
-from psycopg2.extensions import AsIs
+from mapping import Column
 
 file_plan = "2020-dataset/Plan_Attributes_PUF.csv"
 file_benefits = "2020-dataset/Benefits_Cost_Sharing_PUF.csv"
 file_rate = "2020-dataset/Rate_PUF.csv"
 file_business_rules = "2020-dataset/Business_Rules_PUF.csv"
 
+# Seconds between progress lines, None while data sets load in parallel
+progress_interval = const.PROGRESS_INTERVAL
 
-def save_data(table, attributes):
-    """
-    Insert tuple into postgres
-    :param table: relation name
-    :param attributes: relation attributes and value
-    :return: N/A
-    """
-    columns = attributes.keys()
-    values = [attributes[column] for column in columns]
+# Reshape rates, business rules and medical plan moop/ded in postgres from unlogged staging tables
+use_staging = False
 
-    insert_statement = 'insert into %s (%s) values %s'
-    cursor.execute(insert_statement, (AsIs(table),
-                                      AsIs(','.join(columns)),
-                                      tuple(values)))
+# Continue data sets from their saved checkpoint, records committed per checkpoint
+resume = False
+checkpoint_rows = const.CHECKPOINT_ROWS
 
+# Load only the records changed since the last load, see load_delta()
+use_delta = False
+changes = None
 
-def load_plans():
-    """
-    Load Plan_Attributes CSV file into database
-    :return:
-    """
-    print("------LOAD Plan_Attributes_PUF.csv------")
-    collection = mongodb[const.COL_MEDICAL_DISEASE]
-
-    with open(file_plan, mode='r', encoding='iso-8859-1') as fd:
-        # Count total row number
-        reader = csv.DictReader(fd)
-        count = 0
-        rows = sum(1 for _ in reader)
-        fd.seek(0)
-
-        # Loading data into database
-        reader = csv.DictReader(fd)
-        for raw_data in reader:
-            succeed = add_plan_general_info(raw_data)
-            if not succeed:
-                print("Fail")
-                break
+# States / issuers / effective dates to load, None loads everything (see selection.py)
+subset = None
 
-            # Plans that use multiple tiers
-            if raw_data[const.CSV_MULTI_NETWORK] == 'Yes':
-                add_plan_multi_network(raw_data)
+# Run every transform but discard the tuples, no database is opened
+dry_run = False
 
-            # Divide plan into dental and medical
-            if raw_data[const.CSV_DENTAL_ONLY] == "Yes":
-                # Is dental plan
-                add_dental_plan(raw_data)
+# Time the read/parse/transform/write stages of each data set, cProfile data sets into profile_dir
+stage_timers = False
+profile_dir = None
+timers = None
 
-                # Maximum out of pocket information for dental plan
-                add_dental_plan_moop(raw_data)
 
-                # Deductible information for dental plan
-                add_dental_plan_ded(raw_data)
+def connect():
+    """
+    Open a new postgres connection
+    :return: connection
+    """
+    return psycopg2.connect("host=%s dbname=%s user=%s" % (const.HOST_NAME,
+                                                           const.DB_NAME,
+                                                           const.DB_USER))
 
-            else:
-                # Is medical plan
-                add_medical_plan(raw_data)
 
-                # Has specialist referral
-                if raw_data[const.CSV_REFERRAL_REQUIRED] == 'Yes':
-                    add_medical_plan_referral(raw_data)
+def locate_files(directory=None):
+    """
+    Point the data set files at their compressed downloads (.csv.gz, .csv.zst, .zip) when the csv is missing
+    :param directory: directory holding the data set files, None keeps the current one
+    :return: N/A
+    """
+    global file_plan, file_benefits, file_rate, file_business_rules
+    files = [file_plan, file_benefits, file_rate, file_business_rules]
+    if directory is not None:
+        files = [os.path.join(directory, os.path.basename(path)) for path in files]
+    file_plan, file_benefits, file_rate, file_business_rules = [archive.locate(path) for path in files]
 
-                # Summary of benefits and coverage information for medical plan
-                add_medical_plan_sbc(raw_data)
 
-                # Maximum out of pocket information for medical plan
-                if raw_data[const.CSV_MOOP_INTEGRATED] == 'Yes':
-                    add_medical_plan_moop_int(raw_data)
-                else:
-                    add_medical_plan_moop(raw_data)
+def save_data(table, columns, values):
+    """
+    Hand tuple to the active writer (INSERT or buffered COPY)
+    :param table: relation name
+    :param columns: relation attributes
+    :param values: attribute values, in the order of columns
+    :return: N/A
+    """
+    if timers is None:
+        writer.write(table, columns, values)
+        return
+    start = time.perf_counter()
+    writer.write(table, columns, values)
+    timers.write += time.perf_counter() - start
 
-                # Deductible information for medical plan
-                if raw_data[const.CSV_DED_INTEGRATED] == 'Yes':
-                    add_medical_plan_ded_int(raw_data)
-                else:
-                    add_medical_plan_ded(raw_data)
 
-                if raw_data[const.CSV_DISEASE_PROGRAM]:
-                    add_medical_plan_disease(raw_data, collection)
+def save_row(table_mapping, row):
+    """
+    Map a csv row onto a relation and save the tuple
+    :param table_mapping: mapping.Mapping bound to the csv header
+    :param row: positional csv row
+    :return: N/A
+    """
+    if timers is None:
+        writer.write(table_mapping.table, table_mapping.columns, table_mapping.build(row))
+        return
+    save_data(table_mapping.table, table_mapping.columns, convert(table_mapping, row))
 
-            count += 1
-            print('\rLoading Process:{:.2f}%'.format(count * 100 / rows), end='')
 
-    conn.commit()
-    print("\nDONE!")
+def convert(table_mapping, row):
+    """
+    Map a csv row onto the values of a relation
+    :param table_mapping: mapping.Mapping bound to the csv header
+    :param row: positional csv row
+    :return: attribute values, in the order of the mapping columns
+    """
+    if timers is None:
+        return table_mapping.build(row)
+    start = time.perf_counter()
+    try:
+        return table_mapping.build(row)
+    finally:
+        timers.parse += time.perf_counter() - start
 
 
-def add_plan_general_info(raw):
-    attr = dict()
+def commit():
+    """
+    Flush buffered tuples and commit the transaction
+    :return: N/A
+    """
+    start = time.perf_counter()
+    writer.flush()
+    if not dry_run:
+        conn.commit()
+    if timers is not None:
+        timers.write += time.perf_counter() - start
 
-    if raw[const.CSV_PLAN_ISSUER_ID]:
-        attr[const.PLAN_ISSUER_ID] = raw[const.CSV_PLAN_ISSUER_ID]
 
-    if raw[const.CSV_PLAN_ID]:
-        attr[const.PLAN_ID] = raw[const.CSV_PLAN_ID]
+def open_checkpoint(dataset, path):
+    """
+    Start the checkpoint of a data set, or pick up the saved one when resuming
+    :param dataset: name in DATASETS
+    :param path: csv file
+    :return: checkpoint.Checkpoint, completed when there is nothing left to load
+    """
+    mark = checkpoint.Checkpoint(dataset, path)
+    if dry_run:
+        return mark
+    with conn.cursor() as cursor:
+        if resume:
+            mark.resume(cursor, ignore_mtime=args.resume_ignore_mtime)
+        if mark.completed:
+            print("Already loaded, skipped")
+        elif mark.offset is not None:
+            print("Resuming after record %d (byte %d)" % (mark.rows, mark.offset))
+        else:
+            # Forget the checkpoint of an earlier run before writing anything
+            cursor.execute(*mark.save(None, 0))
+    conn.commit()
+    return mark
 
-    if raw[const.CSV_PLAN_VAR_NAME]:
-        attr[const.PLAN_VAR_NAME] = raw[const.CSV_PLAN_VAR_NAME]
 
-    if raw[const.CSV_PLAN_MARK_NAME]:
-        attr[const.PLAN_MARK_NAME] = raw[const.CSV_PLAN_MARK_NAME]
+def save_checkpoint(mark, offset, rows, completed=False):
+    """
+    Commit every tuple and document written so far together with the checkpoint
+    :param mark: checkpoint.Checkpoint
+    :param offset: byte offset after the last record written
+    :param rows: records read since the load (or resume) started
+    :param completed: the whole file is loaded
+    :return: N/A
+    """
+    start = time.perf_counter()
+    documents.flush()
+    writer.execute(*mark.save(offset, rows, completed))
+    if timers is not None:
+        timers.write += time.perf_counter() - start
+    commit()
 
-    if raw[const.CSV_STD_COMP_ID]:
-        attr[const.STD_COMP_ID] = raw[const.CSV_STD_COMP_ID]
 
-    if raw[const.CSV_PLAN_YEAR]:
-        attr[const.PLAN_YEAR] = raw[const.CSV_PLAN_YEAR]
+def selected_rows(stream, dataset):
+    """
+    Records of a file within the selected states, issuers and effective dates
+    :param stream: reader.CsvStream
+    :param dataset: name in DATASETS
+    :return: iterable of positional csv rows
+    """
+    if subset is None:
+        return stream
+    return filter(subset.predicate(dataset, stream.index), stream)
 
-    if raw[const.CSV_PLAN_STATE]:
-        attr[const.PLAN_STATE] = raw[const.CSV_PLAN_STATE]
 
-    if raw[const.CSV_SOURCE_NAME]:
-        attr[const.SOURCE_NAME] = raw[const.CSV_SOURCE_NAME]
+def source_rows(stream, dataset):
+    """
+    Records of a file to load: the selected ones, and only the new and changed ones of a delta load
+    :param stream: reader.CsvStream
+    :param dataset: name in DATASETS
+    :return: iterable of positional csv rows
+    """
+    rows = selected_rows(stream, dataset)
+    if changes is not None:
+        changes.bind(stream.index)
+        rows = filter(changes.selected, rows)
+    if timers is not None:
+        rows = timers.rows(rows)
+    return rows
 
-    if raw[const.CSV_IMPORT_DATE]:
-        ts = datetime.strptime(raw[const.CSV_IMPORT_DATE], "%m/%d/%Y %H:%M")
-        attr[const.IMPORT_DATE] = ts.strftime("%Y-%m-%d %H:%M:%S")
 
-    if raw[const.CSV_HIOS_PROD_ID]:
-        attr[const.HIOS_PROD_ID] = raw[const.CSV_HIOS_PROD_ID]
+def staged_rows(dataset, stage, where=None):
+    """
+    SQL twin of selected_rows() for a staging table
+    :param dataset: name in DATASETS
+    :param stage: staging.Stage of the data set file
+    :param where: SQL condition of the statement
+    :return: where, restricted to the selected records
+    """
+    if subset is None:
+        return where
+    return selection.restrict(subset.condition(dataset, stage.cell), where)
+
+
+def integer_columns(pairs):
+    return [Column(target, source, mapping.integer) for target, source in pairs]
+
+
+# ------------------------- Plan Attributes Data Set -------------------------
+
+PLAN_GENERAL_INFO = mapping.Mapping(const.TABLE_PLAN, [
+    Column(const.PLAN_ISSUER_ID, const.CSV_PLAN_ISSUER_ID),
+    Column(const.PLAN_ID, const.CSV_PLAN_ID),
+    Column(const.PLAN_VAR_NAME, const.CSV_PLAN_VAR_NAME),
+    Column(const.PLAN_MARK_NAME, const.CSV_PLAN_MARK_NAME),
+    Column(const.STD_COMP_ID, const.CSV_STD_COMP_ID),
+    Column(const.PLAN_YEAR, const.CSV_PLAN_YEAR),
+    Column(const.PLAN_STATE, const.CSV_PLAN_STATE),
+    Column(const.SOURCE_NAME, const.CSV_SOURCE_NAME),
+    Column(const.IMPORT_DATE, const.CSV_IMPORT_DATE, mapping.timestamp("%m/%d/%Y %H:%M")),
+    Column(const.HIOS_PROD_ID, const.CSV_HIOS_PROD_ID),
+    Column(const.HPID, const.CSV_HPID),
+    Column(const.NETWORK_ID, const.CSV_NETWORK_ID),
+    Column(const.SERV_AREA_ID, const.CSV_SERV_AREA_ID),
+    Column(const.FORMULARY_ID, const.CSV_FORMULARY_ID),
+    Column(const.IS_NEW_PLAN, const.CSV_IS_NEW_PLAN, mapping.flag('New')),
+    Column(const.MARK_COVERAGE, const.CSV_MARK_COVERAGE, mapping.enum(Enum.mark_cov_type, required=True)),
+    Column(const.PLAN_TYPE, const.CSV_PLAN_TYPE, mapping.enum(Enum.plan_type, required=True)),
+    Column(const.QHP_TYPE, const.CSV_QHP_TYPE, mapping.enum(Enum.qhp_type, required=True)),
+    Column(const.DESIGN_TYPE, const.CSV_DESIGN_TYPE, mapping.enum(Enum.design_type, required=True)),
+    Column(const.CHILD_ONLY, const.CSV_CHILD_ONLY, mapping.enum(Enum.child_only_type, required=True)),
+    Column(const.COMPOSITE_RATE, const.CSV_COMPOSITE_RATE, mapping.flag()),
+    Column(const.OUT_COUNTRY_COV, const.CSV_OUT_COUNTRY_COV, mapping.flag()),
+    Column(const.OUT_COUNTRY_COV_DESC, const.CSV_OUT_COUNTRY_COV_DESC),
+    Column(const.OUT_SERV_AREA_COV, const.CSV_OUT_SERV_AREA_COV, mapping.flag()),
+    Column(const.OUT_SERV_AREA_COV_DESC, const.CSV_OUT_SERV_AREA_COV_DESC),
+    Column(const.PLAN_EXCLUSIONS, const.CSV_PLAN_EXCLUSIONS),
+    Column(const.EFFECTIVE_DATE, const.CSV_EFFECTIVE_DATE),
+    Column(const.EXPIRATION_DATE, const.CSV_EXPIRATION_DATE),
+    Column(const.URL_ENROLLMENT, const.CSV_URL_ENROLLMENT),
+    Column(const.URL_FORMULARY, const.CSV_URL_FORMULARY),
+    Column(const.URL_BROCHURE, const.CSV_URL_BROCHURE),
+])
+
+PLAN_MULTI_NETWORK = mapping.Mapping(const.TABLE_PLAN_MULTI_NET, [
+    Column(const.PLAN_ID, const.CSV_PLAN_ID),
+    Column(const.FIRST_TIER_UTIL, const.CSV_FIRST_TIER_UTIL, mapping.percent),
+    Column(const.SECOND_TIER_UTIL, const.CSV_SECOND_TIER_UTIL, mapping.percent),
+])
+
+DENTAL_PLAN = mapping.Mapping(const.TABLE_DENTAL_PLAN, [
+    Column(const.PLAN_ID, const.CSV_PLAN_ID),
+    Column(const.D_METAL_LEVEL, const.CSV_METAL_LEVEL, mapping.enum(Enum.d_metal_type, required=True)),
+    Column(const.EHB_PEDIATRIC_QTY, const.CSV_EHB_PEDIATRIC_QTY),
+    Column(const.GUARANTEED_RATE, const.CSV_GUARANTEED_RATE, mapping.flag()),
+])
+
+DENTAL_PLAN_MOOP = mapping.Mapping(const.TABLE_D_PLAN_MOOP, [Column(const.PLAN_ID, const.CSV_PLAN_ID)] + integer_columns([
+    (const.INN_TIER1_INDIVIDUAL, const.CSV_MEHB_INN_TIER1_INDIVIDUAL_MOOP),
+    (const.INN_TIER1_FAM_PERSON, const.CSV_MEHB_INN_TIER1_FAM_PERSON_MOOP),
+    (const.INN_TIER1_FAM_GROUP, const.CSV_MEHB_INN_TIER1_FAM_GROUP_MOOP),
+    (const.INN_TIER2_INDIVIDUAL, const.CSV_MEHB_INN_TIER2_INDIVIDUAL_MOOP),
+    (const.INN_TIER2_FAM_PERSON, const.CSV_MEHB_INN_TIER2_FAM_PERSON_MOOP),
+    (const.INN_TIER2_FAM_GROUP, const.CSV_MEHB_INN_TIER2_FAM_GROUP_MOOP),
+    (const.OON_INDIVIDUAL, const.CSV_MEHB_OON_INDIVIDUAL_MOOP),
+    (const.OON_FAM_PERSON, const.CSV_MEHB_OON_FAM_PERSON_MOOP),
+    (const.OON_FAM_GROUP, const.CSV_MEHB_OON_FAM_GROUP_MOOP),
+    (const.COMB_INDIVIDUAL, const.CSV_MEHB_COMB_INDIVIDUAL_MOOP),
+    (const.COMB_FAM_PERSON, const.CSV_MEHB_COMB_FAM_PERSON_MOOP),
+    (const.COMB_FAM_GROUP, const.CSV_MEHB_COMB_FAM_GROUP_MOOP),
+]))
+
+DENTAL_PLAN_DED = mapping.Mapping(const.TABLE_D_PLAN_DED, [Column(const.PLAN_ID, const.CSV_PLAN_ID)] + integer_columns([
+    (const.INN_TIER1_INDIVIDUAL, const.CSV_MEHB_INN_TIER1_INDIVIDUAL_DED),
+    (const.INN_TIER1_FAM_PERSON, const.CSV_MEHB_INN_TIER1_FAM_PERSON_DED),
+    (const.INN_TIER1_FAM_GROUP, const.CSV_MEHB_INN_TIER1_FAM_GROUP_DED),
+    (const.INN_TIER2_INDIVIDUAL, const.CSV_MEHB_INN_TIER2_INDIVIDUAL_DED),
+    (const.INN_TIER2_FAM_PERSON, const.CSV_MEHB_INN_TIER2_FAM_PERSON_DED),
+    (const.INN_TIER2_FAM_GROUP, const.CSV_MEHB_INN_TIER2_FAM_GROUP_DED),
+    (const.OON_INDIVIDUAL, const.CSV_MEHB_OON_INDIVIDUAL_DED),
+    (const.OON_FAM_PERSON, const.CSV_MEHB_OON_FAM_PERSON_DED),
+    (const.OON_FAM_GROUP, const.CSV_MEHB_OON_FAM_GROUP_DED),
+    (const.COMB_INDIVIDUAL, const.CSV_MEHB_COMB_INDIVIDUAL_DED),
+    (const.COMB_FAM_PERSON, const.CSV_MEHB_COMB_FAM_PERSON_DED),
+    (const.COMB_FAM_GROUP, const.CSV_MEHB_COMB_FAM_GROUP_DED),
+]))
+
+MEDICAL_PLAN = mapping.Mapping(const.TABLE_MEDICAL_PLAN, [
+    Column(const.PLAN_ID, const.CSV_PLAN_ID),
+    Column(const.M_METAL_LEVEL, const.CSV_METAL_LEVEL, mapping.enum(Enum.m_metal_type, required=True)),
+    Column(const.PREG_NOTICE, const.CSV_PREG_NOTICE, mapping.flag()),
+    Column(const.WELLNESS_OFFER, const.CSV_WELLNESS_OFFER, mapping.flag()),
+    Column(const.UNI_DESIGN, const.CSV_UNI_DESIGN, mapping.flag()),
+    Column(const.EHB_PERCENT, const.CSV_EHB_PERCENT),
+])
+
+MEDICAL_PLAN_REFERRAL = mapping.Mapping(const.TABLE_M_PLAN_REFERRAL, [
+    Column(const.PLAN_ID, const.CSV_PLAN_ID),
+    Column(const.REFERRAL, const.CSV_REFERRAL),
+])
+
+MEDICAL_PLAN_SBC = mapping.Mapping(const.TABLE_M_PLAN_SBC, [Column(const.PLAN_ID, const.CSV_PLAN_ID)] + integer_columns([
+    (const.DED_BABY, const.CSV_DED_BABY),
+    (const.COPAY_BABY, const.CSV_COPAY_BABY),
+    (const.COINS_BABY, const.CSV_COINS_BABY),
+    (const.LIMIT_BABY, const.CSV_LIMIT_BABY),
+    (const.DED_DIABETES, const.CSV_DED_DIABETES),
+    (const.COPAY_DIABETES, const.CSV_COPAY_DIABETES),
+    (const.COINS_DIABETES, const.CSV_COINS_DIABETES),
+    (const.LIMIT_DIABETES, const.CSV_LIMIT_DIABETES),
+    (const.DED_FRACTURE, const.CSV_DED_FRACTURE),
+    (const.COPAY_FRACTURE, const.CSV_COPAY_FRACTURE),
+    (const.COINS_FRACTURE, const.CSV_COINS_FRACTURE),
+    (const.LIMIT_FRACTURE, const.CSV_LIMIT_FRACTURE),
+]))
+
+MEDICAL_PLAN_MOOP = mapping.Mapping(const.TABLE_M_PLAN_MOOP, [Column(const.PLAN_ID, const.CSV_PLAN_ID)] + integer_columns([
+    (const.MEHB_INN_TIER1_INDIVIDUAL, const.CSV_MEHB_INN_TIER1_INDIVIDUAL_MOOP),
+    (const.MEHB_INN_TIER1_FAM_PERSON, const.CSV_MEHB_INN_TIER1_FAM_PERSON_MOOP),
+    (const.MEHB_INN_TIER1_FAM_GROUP, const.CSV_MEHB_INN_TIER1_FAM_GROUP_MOOP),
+    (const.MEHB_INN_TIER2_INDIVIDUAL, const.CSV_MEHB_INN_TIER2_INDIVIDUAL_MOOP),
+    (const.MEHB_INN_TIER2_FAM_PERSON, const.CSV_MEHB_INN_TIER2_FAM_PERSON_MOOP),
+    (const.MEHB_INN_TIER2_FAM_GROUP, const.CSV_MEHB_INN_TIER2_FAM_GROUP_MOOP),
+    (const.MEHB_OON_INDIVIDUAL, const.CSV_MEHB_OON_INDIVIDUAL_MOOP),
+    (const.MEHB_OON_FAM_PERSON, const.CSV_MEHB_OON_FAM_PERSON_MOOP),
+    (const.MEHB_OON_FAM_GROUP, const.CSV_MEHB_OON_FAM_GROUP_MOOP),
+    (const.MEHB_COMB_INDIVIDUAL, const.CSV_MEHB_COMB_INDIVIDUAL_MOOP),
+    (const.MEHB_COMB_FAM_PERSON, const.CSV_MEHB_COMB_FAM_PERSON_MOOP),
+    (const.MEHB_COMB_FAM_GROUP, const.CSV_MEHB_COMB_FAM_GROUP_MOOP),
+    (const.DEHB_INN_TIER1_INDIVIDUAL, const.CSV_DEHB_INN_TIER1_INDIVIDUAL_MOOP),
+    (const.DEHB_INN_TIER1_FAM_PERSON, const.CSV_DEHB_INN_TIER1_FAM_PERSON_MOOP),
+    (const.DEHB_INN_TIER1_FAM_GROUP, const.CSV_DEHB_INN_TIER1_FAM_GROUP_MOOP),
+    (const.DEHB_INN_TIER2_INDIVIDUAL, const.CSV_DEHB_INN_TIER2_INDIVIDUAL_MOOP),
+    (const.DEHB_INN_TIER2_FAM_PERSON, const.CSV_DEHB_INN_TIER2_FAM_PERSON_MOOP),
+    (const.DEHB_INN_TIER2_FAM_GROUP, const.CSV_DEHB_INN_TIER2_FAM_GROUP_MOOP),
+    (const.DEHB_OON_INDIVIDUAL, const.CSV_DEHB_OON_INDIVIDUAL_MOOP),
+    (const.DEHB_OON_FAM_PERSON, const.CSV_DEHB_OON_FAM_PERSON_MOOP),
+    (const.DEHB_OON_FAM_GROUP, const.CSV_DEHB_OON_FAM_GROUP_MOOP),
+    (const.DEHB_COMB_INDIVIDUAL, const.CSV_DEHB_COMB_INDIVIDUAL_MOOP),
+    (const.DEHB_COMB_FAM_PERSON, const.CSV_DEHB_COMB_FAM_PERSON_MOOP),
+    (const.DEHB_COMB_FAM_GROUP, const.CSV_DEHB_COMB_FAM_GROUP_MOOP),
+]))
+
+MEDICAL_PLAN_MOOP_INT = mapping.Mapping(const.TABLE_M_PLAN_MOOP_INT, [Column(const.PLAN_ID, const.CSV_PLAN_ID)] + integer_columns([
+    (const.TEHB_INN_TIER1_INDIVIDUAL, const.CSV_TEHB_INN_TIER1_INDIVIDUAL_MOOP),
+    (const.TEHB_INN_TIER1_FAM_PERSON, const.CSV_TEHB_INN_TIER1_FAM_PERSON_MOOP),
+    (const.TEHB_INN_TIER1_FAM_GROUP, const.CSV_TEHB_INN_TIER1_FAM_GROUP_MOOP),
+    (const.TEHB_INN_TIER2_INDIVIDUAL, const.CSV_TEHB_INN_TIER2_INDIVIDUAL_MOOP),
+    (const.TEHB_INN_TIER2_FAM_PERSON, const.CSV_TEHB_INN_TIER2_FAM_PERSON_MOOP),
+    (const.TEHB_INN_TIER2_FAM_GROUP, const.CSV_TEHB_INN_TIER2_FAM_GROUP_MOOP),
+    (const.TEHB_OON_INDIVIDUAL, const.CSV_TEHB_OON_INDIVIDUAL_MOOP),
+    (const.TEHB_OON_FAM_PERSON, const.CSV_TEHB_OON_FAM_PERSON_MOOP),
+    (const.TEHB_OON_FAM_GROUP, const.CSV_TEHB_OON_FAM_GROUP_MOOP),
+    (const.TEHB_COMB_INDIVIDUAL, const.CSV_TEHB_COMB_INDIVIDUAL_MOOP),
+    (const.TEHB_COMB_FAM_PERSON, const.CSV_TEHB_COMB_FAM_PERSON_MOOP),
+    (const.TEHB_COMB_FAM_GROUP, const.CSV_TEHB_COMB_FAM_GROUP_MOOP),
+]))
+
+MEDICAL_PLAN_DED = mapping.Mapping(const.TABLE_M_PLAN_DED, [Column(const.PLAN_ID, const.CSV_PLAN_ID)] + integer_columns([
+    (const.MEHB_INN_TIER1_INDIVIDUAL, const.CSV_MEHB_INN_TIER1_INDIVIDUAL_DED),
+    (const.MEHB_INN_TIER1_FAM_PERSON, const.CSV_MEHB_INN_TIER1_FAM_PERSON_DED),
+    (const.MEHB_INN_TIER1_FAM_GROUP, const.CSV_MEHB_INN_TIER1_FAM_GROUP_DED),
+    (const.MEHB_INN_TIER1_COINS, const.CSV_MEHB_INN_TIER1_COINS_DED),
+    (const.MEHB_INN_TIER2_INDIVIDUAL, const.CSV_MEHB_INN_TIER2_INDIVIDUAL_DED),
+    (const.MEHB_INN_TIER2_FAM_PERSON, const.CSV_MEHB_INN_TIER2_FAM_PERSON_DED),
+    (const.MEHB_INN_TIER2_FAM_GROUP, const.CSV_MEHB_INN_TIER2_FAM_GROUP_DED),
+    (const.MEHB_INN_TIER2_COINS, const.CSV_MEHB_INN_TIER2_COINS_DED),
+    (const.MEHB_OON_INDIVIDUAL, const.CSV_MEHB_OON_INDIVIDUAL_DED),
+    (const.MEHB_OON_FAM_PERSON, const.CSV_MEHB_OON_FAM_PERSON_DED),
+    (const.MEHB_OON_FAM_GROUP, const.CSV_MEHB_OON_FAM_GROUP_DED),
+    (const.MEHB_COMB_INDIVIDUAL, const.CSV_MEHB_COMB_INDIVIDUAL_DED),
+    (const.MEHB_COMB_FAM_PERSON, const.CSV_MEHB_COMB_FAM_PERSON_DED),
+    (const.MEHB_COMB_FAM_GROUP, const.CSV_MEHB_COMB_FAM_GROUP_DED),
+    (const.DEHB_INN_TIER1_INDIVIDUAL, const.CSV_DEHB_INN_TIER1_INDIVIDUAL_DED),
+    (const.DEHB_INN_TIER1_FAM_PERSON, const.CSV_DEHB_INN_TIER1_FAM_PERSON_DED),
+    (const.DEHB_INN_TIER1_FAM_GROUP, const.CSV_DEHB_INN_TIER1_FAM_GROUP_DED),
+    (const.DEHB_INN_TIER1_COINS, const.CSV_DEHB_INN_TIER1_COINS_DED),
+    (const.DEHB_INN_TIER2_INDIVIDUAL, const.CSV_DEHB_INN_TIER2_INDIVIDUAL_DED),
+    (const.DEHB_INN_TIER2_FAM_PERSON, const.CSV_DEHB_INN_TIER2_FAM_PERSON_DED),
+    (const.DEHB_INN_TIER2_FAM_GROUP, const.CSV_DEHB_INN_TIER2_FAM_GROUP_DED),
+    (const.DEHB_INN_TIER2_COINS, const.CSV_DEHB_INN_TIER2_COINS_DED),
+    (const.DEHB_OON_INDIVIDUAL, const.CSV_DEHB_OON_INDIVIDUAL_DED),
+    (const.DEHB_OON_FAM_PERSON, const.CSV_DEHB_OON_FAM_PERSON_DED),
+    (const.DEHB_OON_FAM_GROUP, const.CSV_DEHB_OON_FAM_GROUP_DED),
+    (const.DEHB_COMB_INDIVIDUAL, const.CSV_DEHB_COMB_INDIVIDUAL_DED),
+    (const.DEHB_COMB_FAM_PERSON, const.CSV_DEHB_COMB_FAM_PERSON_DED),
+    (const.DEHB_COMB_FAM_GROUP, const.CSV_DEHB_COMB_FAM_GROUP_DED),
+]))
+
+MEDICAL_PLAN_DED_INT = mapping.Mapping(const.TABLE_M_PLAN_DED_INT, [Column(const.PLAN_ID, const.CSV_PLAN_ID)] + integer_columns([
+    (const.TEHB_INN_TIER1_INDIVIDUAL, const.CSV_TEHB_INN_TIER1_INDIVIDUAL_DED),
+    (const.TEHB_INN_TIER1_FAM_PERSON, const.CSV_TEHB_INN_TIER1_FAM_PERSON_DED),
+    (const.TEHB_INN_TIER1_FAM_GROUP, const.CSV_TEHB_INN_TIER1_FAM_GROUP_DED),
+    (const.TEHB_INN_TIER1_COINS, const.CSV_TEHB_INN_TIER1_COINS_DED),
+    (const.TEHB_INN_TIER2_INDIVIDUAL, const.CSV_TEHB_INN_TIER2_INDIVIDUAL_DED),
+    (const.TEHB_INN_TIER2_FAM_PERSON, const.CSV_TEHB_INN_TIER2_FAM_PERSON_DED),
+    (const.TEHB_INN_TIER2_FAM_GROUP, const.CSV_TEHB_INN_TIER2_FAM_GROUP_DED),
+    (const.TEHB_INN_TIER2_COINS, const.CSV_TEHB_INN_TIER2_COINS_DED),
+    (const.TEHB_OON_INDIVIDUAL, const.CSV_TEHB_OON_INDIVIDUAL_DED),
+    (const.TEHB_OON_FAM_PERSON, const.CSV_TEHB_OON_FAM_PERSON_DED),
+    (const.TEHB_OON_FAM_GROUP, const.CSV_TEHB_OON_FAM_GROUP_DED),
+    (const.TEHB_COMB_INDIVIDUAL, const.CSV_TEHB_COMB_INDIVIDUAL_DED),
+    (const.TEHB_COMB_FAM_PERSON, const.CSV_TEHB_COMB_FAM_PERSON_DED),
+    (const.TEHB_COMB_FAM_GROUP, const.CSV_TEHB_COMB_FAM_GROUP_DED),
+]))
+
+PLAN_MAPPINGS = [PLAN_GENERAL_INFO, PLAN_MULTI_NETWORK, DENTAL_PLAN, DENTAL_PLAN_MOOP, DENTAL_PLAN_DED,
+                 MEDICAL_PLAN, MEDICAL_PLAN_REFERRAL, MEDICAL_PLAN_SBC, MEDICAL_PLAN_MOOP, MEDICAL_PLAN_MOOP_INT,
+                 MEDICAL_PLAN_DED, MEDICAL_PLAN_DED_INT]
 
-    if raw[const.CSV_HPID]:
-        attr[const.HPID] = raw[const.CSV_HPID]
 
-    if raw[const.CSV_NETWORK_ID]:
-        attr[const.NETWORK_ID] = raw[const.CSV_NETWORK_ID]
+def load_plans():
+    """
+    Load Plan_Attributes CSV file into database
+    :return: number of csv records read
+    """
+    print("------LOAD Plan_Attributes_PUF.csv------")
+    mark = open_checkpoint("plans", file_plan)
+    if mark.completed:
+        return 0
+
+    with reader.CsvStream(file_plan, interval=progress_interval, start=mark.offset) as stream:
+        stream.every(checkpoint_rows, lambda: save_checkpoint(mark, stream.offset, stream.rows))
+        mapping.bind_all(stream.header, PLAN_MAPPINGS)
+        plan_id = stream.index[const.CSV_PLAN_ID]
+        multi_network = stream.index[const.CSV_MULTI_NETWORK]
+        dental_only = stream.index[const.CSV_DENTAL_ONLY]
+        referral_required = stream.index[const.CSV_REFERRAL_REQUIRED]
+        moop_integrated = stream.index[const.CSV_MOOP_INTEGRATED]
+        ded_integrated = stream.index[const.CSV_DED_INTEGRATED]
+        disease_program = stream.index[const.CSV_DISEASE_PROGRAM]
+
+        # End of the last record written: a failed record is read again on --resume
+        written = stream.offset
+        failed = False
+        for row in source_rows(stream, "plans"):
+            succeed = add_plan_general_info(row)
+            if not succeed:
+                print("Fail")
+                failed = True
+                break
 
-    if raw[const.CSV_SERV_AREA_ID]:
-        attr[const.SERV_AREA_ID] = raw[const.CSV_SERV_AREA_ID]
+            # Plans that use multiple tiers
+            if row[multi_network] == 'Yes':
+                add_plan_multi_network(row)
 
-    if raw[const.CSV_FORMULARY_ID]:
-        attr[const.FORMULARY_ID] = raw[const.CSV_FORMULARY_ID]
+            # Divide plan into dental and medical
+            if row[dental_only] == "Yes":
+                # Is dental plan
+                add_dental_plan(row)
 
-    if raw[const.CSV_IS_NEW_PLAN] == 'New':
-        attr[const.IS_NEW_PLAN] = True
-    else:
-        attr[const.IS_NEW_PLAN] = False
+                # Maximum out of pocket information for dental plan
+                add_dental_plan_moop(row)
 
-    if raw[const.CSV_MARK_COVERAGE] in Enum.mark_cov_type:
-        attr[const.MARK_COVERAGE] = Enum.mark_cov_type[raw[const.CSV_MARK_COVERAGE]]
-    else:
-        print("MARK_COVERAGE")
-        return False
+                # Deductible information for dental plan
+                add_dental_plan_ded(row)
 
-    if raw[const.CSV_PLAN_TYPE] in Enum.plan_type:
-        attr[const.PLAN_TYPE] = Enum.plan_type[raw[const.CSV_PLAN_TYPE]]
-    else:
-        print("PLAN_TYPE")
-        return False
+            else:
+                # Is medical plan
+                add_medical_plan(row)
 
-    if raw[const.CSV_QHP_TYPE] in Enum.qhp_type:
-        attr[const.QHP_TYPE] = Enum.qhp_type[raw[const.CSV_QHP_TYPE]]
-    else:
-        print("QHP_TYPE")
-        return False
+                # Has specialist referral
+                if row[referral_required] == 'Yes':
+                    add_medical_plan_referral(row)
 
-    if raw[const.CSV_DESIGN_TYPE] in Enum.design_type:
-        attr[const.DESIGN_TYPE] = Enum.design_type[raw[const.CSV_DESIGN_TYPE]]
-    else:
-        print("DESIGN_TYPE")
-        return False
+                # Summary of benefits and coverage information for medical plan
+                add_medical_plan_sbc(row)
 
-    if raw[const.CSV_CHILD_ONLY] in Enum.child_only_type:
-        attr[const.CHILD_ONLY] = Enum.child_only_type[raw[const.CSV_CHILD_ONLY]]
-    else:
-        print("CHILD_ONLY")
-        return False
+                # Maximum out of pocket information for medical plan (staged: see load_plans_staged)
+                if row[moop_integrated] == 'Yes':
+                    add_medical_plan_moop_int(row)
+                elif not use_staging:
+                    add_medical_plan_moop(row)
 
-    if raw[const.CSV_COMPOSITE_RATE] == 'Yes':
-        attr[const.COMPOSITE_RATE] = True
-    else:
-        attr[const.COMPOSITE_RATE] = False
+                # Deductible information for medical plan
+                if row[ded_integrated] == 'Yes':
+                    add_medical_plan_ded_int(row)
+                elif not use_staging:
+                    add_medical_plan_ded(row)
 
-    if raw[const.CSV_OUT_COUNTRY_COV] == 'Yes':
-        attr[const.OUT_COUNTRY_COV] = True
-    else:
-        attr[const.OUT_COUNTRY_COV] = False
+                if row[disease_program]:
+                    add_medical_plan_disease(row[plan_id], row[disease_program])
 
-    if raw[const.CSV_OUT_COUNTRY_COV_DESC]:
-        attr[const.OUT_COUNTRY_COV_DESC] = raw[const.CSV_OUT_COUNTRY_COV_DESC]
+            written = stream.offset
 
-    if raw[const.CSV_OUT_SERV_AREA_COV] == 'Yes':
-        attr[const.OUT_SERV_AREA_COV] = True
+    if failed:
+        save_checkpoint(mark, written, stream.rows)
     else:
-        attr[const.OUT_SERV_AREA_COV] = False
-
-    if raw[const.CSV_OUT_SERV_AREA_COV_DESC]:
-        attr[const.OUT_SERV_AREA_COV_DESC] = raw[const.CSV_OUT_SERV_AREA_COV_DESC]
-
-    if raw[const.CSV_PLAN_EXCLUSIONS]:
-        attr[const.PLAN_EXCLUSIONS] = raw[const.CSV_PLAN_EXCLUSIONS]
-
-    if raw[const.CSV_EFFECTIVE_DATE]:
-        attr[const.EFFECTIVE_DATE] = raw[const.CSV_EFFECTIVE_DATE]
-
-    if raw[const.CSV_EXPIRATION_DATE]:
-        attr[const.EXPIRATION_DATE] = raw[const.CSV_EXPIRATION_DATE]
+        save_checkpoint(mark, stream.offset, stream.rows, completed=not use_staging)
+        print("\nDONE!")
+    writer.report()
+    documents.report()
+    if use_staging:
+        load_plans_staged(mark, stream.rows, failed)
+    return stream.rows
 
-    if raw[const.CSV_URL_ENROLLMENT]:
-        attr[const.URL_ENROLLMENT] = raw[const.CSV_URL_ENROLLMENT]
 
-    if raw[const.CSV_URL_FORMULARY]:
-        attr[const.URL_FORMULARY] = raw[const.CSV_URL_FORMULARY]
-
-    if raw[const.CSV_URL_BROCHURE]:
-        attr[const.URL_BROCHURE] = raw[const.CSV_URL_BROCHURE]
+def load_plans_staged(mark, rows, failed=False):
+    """
+    Fill medical_plan_moop/medical_plan_ded of medical plans without integrated moop/deductible from
+    Plan_Attributes CSV file staged in postgres
+    :param mark: checkpoint of the plan file, completed in the same transaction
+    :param rows: records read by load_plans
+    :param failed: load_plans stopped at a record it could not write, the file is not complete
+    :return:
+    """
+    if failed:
+        # The staged insert covers every record of the file, not only the plans written
+        print("Staged moop/deductible skipped, the plan file is not complete")
+        return
+    cursor = conn.cursor()
+    staging.tune(cursor)
+    with staging.Stage(cursor, file_plan, "stage_plan_attributes") as stage:
+        stage.load()
+        medical = sql.SQL("{} <> 'Yes'").format(stage.cell(const.CSV_DENTAL_ONLY))
+        stage.insert_mapping(MEDICAL_PLAN_MOOP, where=staged_rows("plans", stage, medical + sql.SQL(
+            " AND {} <> 'Yes'").format(stage.cell(const.CSV_MOOP_INTEGRATED))))
+        stage.insert_mapping(MEDICAL_PLAN_DED, where=staged_rows("plans", stage, medical + sql.SQL(
+            " AND {} <> 'Yes'").format(stage.cell(const.CSV_DED_INTEGRATED))))
+        cursor.execute(*mark.save(mark.size, rows, completed=True))
+    conn.commit()
+    stage.stats.report()
 
-    save_data(const.TABLE_PLAN, attr)
 
+def add_plan_general_info(row):
+    try:
+        save_row(PLAN_GENERAL_INFO, row)
+    except mapping.MappingError as e:
+        print(e)
+        return False
     return True
 
 
-def add_plan_multi_network(raw):
-    attr = dict()
-
-    if raw[const.CSV_PLAN_ID]:
-        attr[const.PLAN_ID] = raw[const.CSV_PLAN_ID]
-
-    if raw[const.CSV_FIRST_TIER_UTIL]:
-        attr[const.FIRST_TIER_UTIL] = raw[const.CSV_FIRST_TIER_UTIL].rstrip("%")
-
-    if raw[const.CSV_SECOND_TIER_UTIL]:
-        attr[const.SECOND_TIER_UTIL] = raw[const.CSV_SECOND_TIER_UTIL].rstrip("%")
-
-    save_data(const.TABLE_PLAN_MULTI_NET, attr)
-
-
-def add_dental_plan(raw):
-    attr = dict()
+def add_plan_multi_network(row):
+    save_row(PLAN_MULTI_NETWORK, row)
 
-    if raw[const.CSV_PLAN_ID]:
-        attr[const.PLAN_ID] = raw[const.CSV_PLAN_ID]
 
-    if raw[const.CSV_METAL_LEVEL] in Enum.d_metal_type:
-        attr[const.D_METAL_LEVEL] = Enum.d_metal_type[raw[const.CSV_METAL_LEVEL]]
-    else:
+def add_dental_plan(row):
+    try:
+        save_row(DENTAL_PLAN, row)
+    except mapping.MappingError:
         return False
-
-    if raw[const.CSV_EHB_PEDIATRIC_QTY]:
-        attr[const.EHB_PEDIATRIC_QTY] = raw[const.CSV_EHB_PEDIATRIC_QTY]
-
-    if raw[const.CSV_GUARANTEED_RATE] == 'Yes':
-        attr[const.GUARANTEED_RATE] = True
-    else:
-        attr[const.GUARANTEED_RATE] = False
-
-    # print(dental_plan)
-
-    save_data(const.TABLE_DENTAL_PLAN, attr)
-
     return True
 
 
-def add_dental_plan_moop(raw):
-    attr = dict()
-
-    if raw[const.CSV_PLAN_ID]:
-        attr[const.PLAN_ID] = raw[const.CSV_PLAN_ID]
-
-    if raw[const.CSV_MEHB_INN_TIER1_INDIVIDUAL_MOOP]:
-        attr[const.INN_TIER1_INDIVIDUAL] = utils.get_num_int(raw[const.CSV_MEHB_INN_TIER1_INDIVIDUAL_MOOP])
-
-    if raw[const.CSV_MEHB_INN_TIER1_FAM_PERSON_MOOP]:
-        attr[const.INN_TIER1_FAM_PERSON] = utils.get_num_int(raw[const.CSV_MEHB_INN_TIER1_FAM_PERSON_MOOP])
-
-    if raw[const.CSV_MEHB_INN_TIER1_FAM_GROUP_MOOP]:
-        attr[const.INN_TIER1_FAM_GROUP] = utils.get_num_int(raw[const.CSV_MEHB_INN_TIER1_FAM_GROUP_MOOP])
-
-    if raw[const.CSV_MEHB_INN_TIER2_INDIVIDUAL_MOOP]:
-        attr[const.INN_TIER2_INDIVIDUAL] = utils.get_num_int(raw[const.CSV_MEHB_INN_TIER2_INDIVIDUAL_MOOP])
-
-    if raw[const.CSV_MEHB_INN_TIER2_FAM_PERSON_MOOP]:
-        attr[const.INN_TIER2_FAM_PERSON] = utils.get_num_int(raw[const.CSV_MEHB_INN_TIER2_FAM_PERSON_MOOP])
-
-    if raw[const.CSV_MEHB_INN_TIER2_FAM_GROUP_MOOP]:
-        attr[const.INN_TIER2_FAM_GROUP] = utils.get_num_int(raw[const.CSV_MEHB_INN_TIER2_FAM_GROUP_MOOP])
-
-    if raw[const.CSV_MEHB_OON_INDIVIDUAL_MOOP]:
-        attr[const.OON_INDIVIDUAL] = utils.get_num_int(raw[const.CSV_MEHB_OON_INDIVIDUAL_MOOP])
-
-    if raw[const.CSV_MEHB_OON_FAM_PERSON_MOOP]:
-        attr[const.OON_FAM_PERSON] = utils.get_num_int(raw[const.CSV_MEHB_OON_FAM_PERSON_MOOP])
-
-    if raw[const.CSV_MEHB_OON_FAM_GROUP_MOOP]:
-        attr[const.OON_FAM_GROUP] = utils.get_num_int(raw[const.CSV_MEHB_OON_FAM_GROUP_MOOP])
-
-    if raw[const.CSV_MEHB_COMB_INDIVIDUAL_MOOP]:
-        attr[const.COMB_INDIVIDUAL] = utils.get_num_int(raw[const.CSV_MEHB_COMB_INDIVIDUAL_MOOP])
-
-    if raw[const.CSV_MEHB_COMB_FAM_PERSON_MOOP]:
-        attr[const.COMB_FAM_PERSON] = utils.get_num_int(raw[const.CSV_MEHB_COMB_FAM_PERSON_MOOP])
-
-    if raw[const.CSV_MEHB_COMB_FAM_GROUP_MOOP]:
-        attr[const.COMB_FAM_GROUP] = utils.get_num_int(raw[const.CSV_MEHB_COMB_FAM_GROUP_MOOP])
-
-    save_data(const.TABLE_D_PLAN_MOOP, attr)
-
-
-def add_dental_plan_ded(raw):
-    attr = dict()
-
-    if raw[const.CSV_PLAN_ID]:
-        attr[const.PLAN_ID] = raw[const.CSV_PLAN_ID]
-
-    if raw[const.CSV_MEHB_INN_TIER1_INDIVIDUAL_DED]:
-        attr[const.INN_TIER1_INDIVIDUAL] = utils.get_num_int(raw[const.CSV_MEHB_INN_TIER1_INDIVIDUAL_DED])
-
-    if raw[const.CSV_MEHB_INN_TIER1_FAM_PERSON_DED]:
-        attr[const.INN_TIER1_FAM_PERSON] = utils.get_num_int(raw[const.CSV_MEHB_INN_TIER1_FAM_PERSON_DED])
-
-    if raw[const.CSV_MEHB_INN_TIER1_FAM_GROUP_DED]:
-        attr[const.INN_TIER1_FAM_GROUP] = utils.get_num_int(raw[const.CSV_MEHB_INN_TIER1_FAM_GROUP_DED])
-
-    if raw[const.CSV_MEHB_INN_TIER2_INDIVIDUAL_DED]:
-        attr[const.INN_TIER2_INDIVIDUAL] = utils.get_num_int(raw[const.CSV_MEHB_INN_TIER2_INDIVIDUAL_DED])
-
-    if raw[const.CSV_MEHB_INN_TIER2_FAM_PERSON_DED]:
-        attr[const.INN_TIER2_FAM_PERSON] = utils.get_num_int(raw[const.CSV_MEHB_INN_TIER2_FAM_PERSON_DED])
-
-    if raw[const.CSV_MEHB_INN_TIER2_FAM_GROUP_DED]:
-        attr[const.INN_TIER2_FAM_GROUP] = utils.get_num_int(raw[const.CSV_MEHB_INN_TIER2_FAM_GROUP_DED])
-
-    if raw[const.CSV_MEHB_OON_INDIVIDUAL_DED]:
-        attr[const.OON_INDIVIDUAL] = utils.get_num_int(raw[const.CSV_MEHB_OON_INDIVIDUAL_DED])
-
-    if raw[const.CSV_MEHB_OON_FAM_PERSON_DED]:
-        attr[const.OON_FAM_PERSON] = utils.get_num_int(raw[const.CSV_MEHB_OON_FAM_PERSON_DED])
-
-    if raw[const.CSV_MEHB_OON_FAM_GROUP_DED]:
-        attr[const.OON_FAM_GROUP] = utils.get_num_int(raw[const.CSV_MEHB_OON_FAM_GROUP_DED])
-
-    if raw[const.CSV_MEHB_COMB_INDIVIDUAL_DED]:
-        attr[const.COMB_INDIVIDUAL] = utils.get_num_int(raw[const.CSV_MEHB_COMB_INDIVIDUAL_DED])
+def add_dental_plan_moop(row):
+    save_row(DENTAL_PLAN_MOOP, row)
 
-    if raw[const.CSV_MEHB_COMB_FAM_PERSON_DED]:
-        attr[const.COMB_FAM_PERSON] = utils.get_num_int(raw[const.CSV_MEHB_COMB_FAM_PERSON_DED])
 
-    if raw[const.CSV_MEHB_COMB_FAM_GROUP_DED]:
-        attr[const.COMB_FAM_GROUP] = utils.get_num_int(raw[const.CSV_MEHB_COMB_FAM_GROUP_DED])
+def add_dental_plan_ded(row):
+    save_row(DENTAL_PLAN_DED, row)
 
-    save_data(const.TABLE_D_PLAN_DED, attr)
 
-
-def add_medical_plan(raw):
-    attr = dict()
-
-    if raw[const.CSV_PLAN_ID]:
-        attr[const.PLAN_ID] = raw[const.CSV_PLAN_ID]
-
-    if raw[const.CSV_METAL_LEVEL] in Enum.m_metal_type:
-        attr[const.M_METAL_LEVEL] = Enum.m_metal_type[raw[const.CSV_METAL_LEVEL]]
-    else:
+def add_medical_plan(row):
+    try:
+        save_row(MEDICAL_PLAN, row)
+    except mapping.MappingError:
         return False
-
-    if raw[const.CSV_PREG_NOTICE] == 'Yes':
-        attr[const.PREG_NOTICE] = True
-    else:
-        attr[const.PREG_NOTICE] = False
-
-    if raw[const.CSV_WELLNESS_OFFER] == 'Yes':
-        attr[const.WELLNESS_OFFER] = True
-    else:
-        attr[const.WELLNESS_OFFER] = False
-
-    if raw[const.CSV_UNI_DESIGN] == 'Yes':
-        attr[const.UNI_DESIGN] = True
-    else:
-        attr[const.UNI_DESIGN] = False
-
-    if raw[const.CSV_EHB_PERCENT]:
-        attr[const.EHB_PERCENT] = raw[const.CSV_EHB_PERCENT]
-
-    # print(medical_plan)
-    save_data(const.TABLE_MEDICAL_PLAN, attr)
-
     return True
 
 
-def add_medical_plan_referral(raw):
-    attr = dict()
-
-    if raw[const.CSV_PLAN_ID]:
-        attr[const.PLAN_ID] = raw[const.CSV_PLAN_ID]
-
-    if raw[const.CSV_REFERRAL]:
-        attr[const.REFERRAL] = raw[const.CSV_REFERRAL]
-
-    # print(attr)
-
-    save_data(const.TABLE_M_PLAN_REFERRAL, attr)
-
-
-def add_medical_plan_sbc(raw):
-    attr = dict()
-
-    if raw[const.CSV_PLAN_ID]:
-        attr[const.PLAN_ID] = raw[const.CSV_PLAN_ID]
-
-    if raw[const.CSV_DED_BABY]:
-        attr[const.DED_BABY] = utils.get_num_int(raw[const.CSV_DED_BABY])
-
-    if raw[const.CSV_COPAY_BABY]:
-        attr[const.COPAY_BABY] = utils.get_num_int(raw[const.CSV_COPAY_BABY])
-
-    if raw[const.CSV_COINS_BABY]:
-        attr[const.COINS_BABY] = utils.get_num_int(raw[const.CSV_COINS_BABY])
-
-    if raw[const.CSV_LIMIT_BABY]:
-        attr[const.LIMIT_BABY] = utils.get_num_int(raw[const.CSV_LIMIT_BABY])
-
-    if raw[const.CSV_DED_DIABETES]:
-        attr[const.DED_DIABETES] = utils.get_num_int(raw[const.CSV_DED_DIABETES])
-
-    if raw[const.CSV_COPAY_DIABETES]:
-        attr[const.COPAY_DIABETES] = utils.get_num_int(raw[const.CSV_COPAY_DIABETES])
-
-    if raw[const.CSV_COINS_DIABETES]:
-        attr[const.COINS_DIABETES] = utils.get_num_int(raw[const.CSV_COINS_DIABETES])
-
-    if raw[const.CSV_LIMIT_DIABETES]:
-        attr[const.LIMIT_DIABETES] = utils.get_num_int(raw[const.CSV_LIMIT_DIABETES])
-
-    if raw[const.CSV_DED_FRACTURE]:
-        attr[const.DED_FRACTURE] = utils.get_num_int(raw[const.CSV_DED_FRACTURE])
-
-    if raw[const.CSV_COPAY_FRACTURE]:
-        attr[const.COPAY_FRACTURE] = utils.get_num_int(raw[const.CSV_COPAY_FRACTURE])
-
-    if raw[const.CSV_COINS_FRACTURE]:
-        attr[const.COINS_FRACTURE] = utils.get_num_int(raw[const.CSV_COINS_FRACTURE])
-
-    if raw[const.CSV_LIMIT_FRACTURE]:
-        attr[const.LIMIT_FRACTURE] = utils.get_num_int(raw[const.CSV_LIMIT_FRACTURE])
-
-    save_data(const.TABLE_M_PLAN_SBC, attr)
-
-
-def add_medical_plan_moop(raw):
-    attr = dict()
-
-    if raw[const.CSV_PLAN_ID]:
-        attr[const.PLAN_ID] = raw[const.CSV_PLAN_ID]
-
-    if raw[const.CSV_MEHB_INN_TIER1_INDIVIDUAL_MOOP]:
-        attr[const.MEHB_INN_TIER1_INDIVIDUAL] = utils.get_num_int(raw[const.CSV_MEHB_INN_TIER1_INDIVIDUAL_MOOP])
-
-    if raw[const.CSV_MEHB_INN_TIER1_FAM_PERSON_MOOP]:
-        attr[const.MEHB_INN_TIER1_FAM_PERSON] = utils.get_num_int(raw[const.CSV_MEHB_INN_TIER1_FAM_PERSON_MOOP])
-
-    if raw[const.CSV_MEHB_INN_TIER1_FAM_GROUP_MOOP]:
-        attr[const.MEHB_INN_TIER1_FAM_GROUP] = utils.get_num_int(raw[const.CSV_MEHB_INN_TIER1_FAM_GROUP_MOOP])
-
-    if raw[const.CSV_MEHB_INN_TIER2_INDIVIDUAL_MOOP]:
-        attr[const.MEHB_INN_TIER2_INDIVIDUAL] = utils.get_num_int(raw[const.CSV_MEHB_INN_TIER2_INDIVIDUAL_MOOP])
-
-    if raw[const.CSV_MEHB_INN_TIER2_FAM_PERSON_MOOP]:
-        attr[const.MEHB_INN_TIER2_FAM_PERSON] = utils.get_num_int(raw[const.CSV_MEHB_INN_TIER2_FAM_PERSON_MOOP])
-
-    if raw[const.CSV_MEHB_INN_TIER2_FAM_GROUP_MOOP]:
-        attr[const.MEHB_INN_TIER2_FAM_GROUP] = utils.get_num_int(raw[const.CSV_MEHB_INN_TIER2_FAM_GROUP_MOOP])
-
-    if raw[const.CSV_MEHB_OON_INDIVIDUAL_MOOP]:
-        attr[const.MEHB_OON_INDIVIDUAL] = utils.get_num_int(raw[const.CSV_MEHB_OON_INDIVIDUAL_MOOP])
-
-    if raw[const.CSV_MEHB_OON_FAM_PERSON_MOOP]:
-        attr[const.MEHB_OON_FAM_PERSON] = utils.get_num_int(raw[const.CSV_MEHB_OON_FAM_PERSON_MOOP])
-
-    if raw[const.CSV_MEHB_OON_FAM_GROUP_MOOP]:
-        attr[const.MEHB_OON_FAM_GROUP] = utils.get_num_int(raw[const.CSV_MEHB_OON_FAM_GROUP_MOOP])
-
-    if raw[const.CSV_MEHB_COMB_INDIVIDUAL_MOOP]:
-        attr[const.MEHB_COMB_INDIVIDUAL] = utils.get_num_int(raw[const.CSV_MEHB_COMB_INDIVIDUAL_MOOP])
+def add_medical_plan_referral(row):
+    save_row(MEDICAL_PLAN_REFERRAL, row)
 
-    if raw[const.CSV_MEHB_COMB_FAM_PERSON_MOOP]:
-        attr[const.MEHB_COMB_FAM_PERSON] = utils.get_num_int(raw[const.CSV_MEHB_COMB_FAM_PERSON_MOOP])
 
-    if raw[const.CSV_MEHB_COMB_FAM_GROUP_MOOP]:
-        attr[const.MEHB_COMB_FAM_GROUP] = utils.get_num_int(raw[const.CSV_MEHB_COMB_FAM_GROUP_MOOP])
+def add_medical_plan_sbc(row):
+    save_row(MEDICAL_PLAN_SBC, row)
 
-    if raw[const.CSV_DEHB_INN_TIER1_INDIVIDUAL_MOOP]:
-        attr[const.DEHB_INN_TIER1_INDIVIDUAL] = utils.get_num_int(raw[const.CSV_DEHB_INN_TIER1_INDIVIDUAL_MOOP])
 
-    if raw[const.CSV_DEHB_INN_TIER1_FAM_PERSON_MOOP]:
-        attr[const.DEHB_INN_TIER1_FAM_PERSON] = utils.get_num_int(raw[const.CSV_DEHB_INN_TIER1_FAM_PERSON_MOOP])
+def add_medical_plan_moop(row):
+    save_row(MEDICAL_PLAN_MOOP, row)
 
-    if raw[const.CSV_DEHB_INN_TIER1_FAM_GROUP_MOOP]:
-        attr[const.DEHB_INN_TIER1_FAM_GROUP] = utils.get_num_int(raw[const.CSV_DEHB_INN_TIER1_FAM_GROUP_MOOP])
 
-    if raw[const.CSV_DEHB_INN_TIER2_INDIVIDUAL_MOOP]:
-        attr[const.DEHB_INN_TIER2_INDIVIDUAL] = utils.get_num_int(raw[const.CSV_DEHB_INN_TIER2_INDIVIDUAL_MOOP])
+def add_medical_plan_moop_int(row):
+    save_row(MEDICAL_PLAN_MOOP_INT, row)
 
-    if raw[const.CSV_DEHB_INN_TIER2_FAM_PERSON_MOOP]:
-        attr[const.DEHB_INN_TIER2_FAM_PERSON] = utils.get_num_int(raw[const.CSV_DEHB_INN_TIER2_FAM_PERSON_MOOP])
 
-    if raw[const.CSV_DEHB_INN_TIER2_FAM_GROUP_MOOP]:
-        attr[const.DEHB_INN_TIER2_FAM_GROUP] = utils.get_num_int(raw[const.CSV_DEHB_INN_TIER2_FAM_GROUP_MOOP])
+def add_medical_plan_ded(row):
+    save_row(MEDICAL_PLAN_DED, row)
 
-    if raw[const.CSV_DEHB_OON_INDIVIDUAL_MOOP]:
-        attr[const.DEHB_OON_INDIVIDUAL] = utils.get_num_int(raw[const.CSV_DEHB_OON_INDIVIDUAL_MOOP])
 
-    if raw[const.CSV_DEHB_OON_FAM_PERSON_MOOP]:
-        attr[const.DEHB_OON_FAM_PERSON] = utils.get_num_int(raw[const.CSV_DEHB_OON_FAM_PERSON_MOOP])
+def add_medical_plan_ded_int(row):
+    save_row(MEDICAL_PLAN_DED_INT, row)
 
-    if raw[const.CSV_DEHB_OON_FAM_GROUP_MOOP]:
-        attr[const.DEHB_OON_FAM_GROUP] = utils.get_num_int(raw[const.CSV_DEHB_OON_FAM_GROUP_MOOP])
 
-    if raw[const.CSV_DEHB_COMB_INDIVIDUAL_MOOP]:
-        attr[const.DEHB_COMB_INDIVIDUAL] = utils.get_num_int(raw[const.CSV_DEHB_COMB_INDIVIDUAL_MOOP])
-
-    if raw[const.CSV_DEHB_COMB_FAM_PERSON_MOOP]:
-        attr[const.DEHB_COMB_FAM_PERSON] = utils.get_num_int(raw[const.CSV_DEHB_COMB_FAM_PERSON_MOOP])
-
-    if raw[const.CSV_DEHB_COMB_FAM_GROUP_MOOP]:
-        attr[const.DEHB_COMB_FAM_GROUP] = utils.get_num_int(raw[const.CSV_DEHB_COMB_FAM_GROUP_MOOP])
-
-    save_data(const.TABLE_M_PLAN_MOOP, attr)
-
-
-def add_medical_plan_moop_int(raw):
-    attr = dict()
-
-    if raw[const.CSV_PLAN_ID]:
-        attr[const.PLAN_ID] = raw[const.CSV_PLAN_ID]
-
-    if raw[const.CSV_TEHB_INN_TIER1_INDIVIDUAL_MOOP]:
-        attr[const.TEHB_INN_TIER1_INDIVIDUAL] = utils.get_num_int(raw[const.CSV_TEHB_INN_TIER1_INDIVIDUAL_MOOP])
-
-    if raw[const.CSV_TEHB_INN_TIER1_FAM_PERSON_MOOP]:
-        attr[const.TEHB_INN_TIER1_FAM_PERSON] = utils.get_num_int(raw[const.CSV_TEHB_INN_TIER1_FAM_PERSON_MOOP])
-
-    if raw[const.CSV_TEHB_INN_TIER1_FAM_GROUP_MOOP]:
-        attr[const.TEHB_INN_TIER1_FAM_GROUP] = utils.get_num_int(raw[const.CSV_TEHB_INN_TIER1_FAM_GROUP_MOOP])
-
-    if raw[const.CSV_TEHB_INN_TIER2_INDIVIDUAL_MOOP]:
-        attr[const.TEHB_INN_TIER2_INDIVIDUAL] = utils.get_num_int(raw[const.CSV_TEHB_INN_TIER2_INDIVIDUAL_MOOP])
-
-    if raw[const.CSV_TEHB_INN_TIER2_FAM_PERSON_MOOP]:
-        attr[const.TEHB_INN_TIER2_FAM_PERSON] = utils.get_num_int(raw[const.CSV_TEHB_INN_TIER2_FAM_PERSON_MOOP])
-
-    if raw[const.CSV_TEHB_INN_TIER2_FAM_GROUP_MOOP]:
-        attr[const.TEHB_INN_TIER2_FAM_GROUP] = utils.get_num_int(raw[const.CSV_TEHB_INN_TIER2_FAM_GROUP_MOOP])
-
-    if raw[const.CSV_TEHB_OON_INDIVIDUAL_MOOP]:
-        attr[const.TEHB_OON_INDIVIDUAL] = utils.get_num_int(raw[const.CSV_TEHB_OON_INDIVIDUAL_MOOP])
-
-    if raw[const.CSV_TEHB_OON_FAM_PERSON_MOOP]:
-        attr[const.TEHB_OON_FAM_PERSON] = utils.get_num_int(raw[const.CSV_TEHB_OON_FAM_PERSON_MOOP])
-
-    if raw[const.CSV_TEHB_OON_FAM_GROUP_MOOP]:
-        attr[const.TEHB_OON_FAM_GROUP] = utils.get_num_int(raw[const.CSV_TEHB_OON_FAM_GROUP_MOOP])
-
-    if raw[const.CSV_TEHB_COMB_INDIVIDUAL_MOOP]:
-        attr[const.TEHB_COMB_INDIVIDUAL] = utils.get_num_int(raw[const.CSV_TEHB_COMB_INDIVIDUAL_MOOP])
-
-    if raw[const.CSV_TEHB_COMB_FAM_PERSON_MOOP]:
-        attr[const.TEHB_COMB_FAM_PERSON] = utils.get_num_int(raw[const.CSV_TEHB_COMB_FAM_PERSON_MOOP])
-
-    if raw[const.CSV_TEHB_COMB_FAM_GROUP_MOOP]:
-        attr[const.TEHB_COMB_FAM_GROUP] = utils.get_num_int(raw[const.CSV_TEHB_COMB_FAM_GROUP_MOOP])
-
-    save_data(const.TABLE_M_PLAN_MOOP_INT, attr)
-
-
-def add_medical_plan_ded(raw):
-    attr = dict()
-
-    if raw[const.CSV_PLAN_ID]:
-        attr[const.PLAN_ID] = raw[const.CSV_PLAN_ID]
-
-    if raw[const.CSV_MEHB_INN_TIER1_INDIVIDUAL_DED]:
-        attr[const.MEHB_INN_TIER1_INDIVIDUAL] = utils.get_num_int(raw[const.CSV_MEHB_INN_TIER1_INDIVIDUAL_DED])
-
-    if raw[const.CSV_MEHB_INN_TIER1_FAM_PERSON_DED]:
-        attr[const.MEHB_INN_TIER1_FAM_PERSON] = utils.get_num_int(raw[const.CSV_MEHB_INN_TIER1_FAM_PERSON_DED])
-
-    if raw[const.CSV_MEHB_INN_TIER1_FAM_GROUP_DED]:
-        attr[const.MEHB_INN_TIER1_FAM_GROUP] = utils.get_num_int(raw[const.CSV_MEHB_INN_TIER1_FAM_GROUP_DED])
-
-    if raw[const.CSV_MEHB_INN_TIER1_COINS_DED]:
-        attr[const.MEHB_INN_TIER1_COINS] = utils.get_num_int(raw[const.CSV_MEHB_INN_TIER1_COINS_DED])
-
-    if raw[const.CSV_MEHB_INN_TIER2_INDIVIDUAL_DED]:
-        attr[const.MEHB_INN_TIER2_INDIVIDUAL] = utils.get_num_int(raw[const.CSV_MEHB_INN_TIER2_INDIVIDUAL_DED])
-
-    if raw[const.CSV_MEHB_INN_TIER2_FAM_PERSON_DED]:
-        attr[const.MEHB_INN_TIER2_FAM_PERSON] = utils.get_num_int(raw[const.CSV_MEHB_INN_TIER2_FAM_PERSON_DED])
-
-    if raw[const.CSV_MEHB_INN_TIER2_FAM_GROUP_DED]:
-        attr[const.MEHB_INN_TIER2_FAM_GROUP] = utils.get_num_int(raw[const.CSV_MEHB_INN_TIER2_FAM_GROUP_DED])
-
-    if raw[const.CSV_MEHB_INN_TIER2_COINS_DED]:
-        attr[const.MEHB_INN_TIER2_COINS] = utils.get_num_int(raw[const.CSV_MEHB_INN_TIER2_COINS_DED])
-
-    if raw[const.CSV_MEHB_OON_INDIVIDUAL_DED]:
-        attr[const.MEHB_OON_INDIVIDUAL] = utils.get_num_int(raw[const.CSV_MEHB_OON_INDIVIDUAL_DED])
-
-    if raw[const.CSV_MEHB_OON_FAM_PERSON_DED]:
-        attr[const.MEHB_OON_FAM_PERSON] = utils.get_num_int(raw[const.CSV_MEHB_OON_FAM_PERSON_DED])
-
-    if raw[const.CSV_MEHB_OON_FAM_GROUP_DED]:
-        attr[const.MEHB_OON_FAM_GROUP] = utils.get_num_int(raw[const.CSV_MEHB_OON_FAM_GROUP_DED])
-
-    if raw[const.CSV_MEHB_COMB_INDIVIDUAL_DED]:
-        attr[const.MEHB_COMB_INDIVIDUAL] = utils.get_num_int(raw[const.CSV_MEHB_COMB_INDIVIDUAL_DED])
-
-    if raw[const.CSV_MEHB_COMB_FAM_PERSON_DED]:
-        attr[const.MEHB_COMB_FAM_PERSON] = utils.get_num_int(raw[const.CSV_MEHB_COMB_FAM_PERSON_DED])
-
-    if raw[const.CSV_MEHB_COMB_FAM_GROUP_DED]:
-        attr[const.MEHB_COMB_FAM_GROUP] = utils.get_num_int(raw[const.CSV_MEHB_COMB_FAM_GROUP_DED])
-
-    if raw[const.CSV_DEHB_INN_TIER1_INDIVIDUAL_DED]:
-        attr[const.DEHB_INN_TIER1_INDIVIDUAL] = utils.get_num_int(raw[const.CSV_DEHB_INN_TIER1_INDIVIDUAL_DED])
-
-    if raw[const.CSV_DEHB_INN_TIER1_FAM_PERSON_DED]:
-        attr[const.DEHB_INN_TIER1_FAM_PERSON] = utils.get_num_int(raw[const.CSV_DEHB_INN_TIER1_FAM_PERSON_DED])
-
-    if raw[const.CSV_DEHB_INN_TIER1_FAM_GROUP_DED]:
-        attr[const.DEHB_INN_TIER1_FAM_GROUP] = utils.get_num_int(raw[const.CSV_DEHB_INN_TIER1_FAM_GROUP_DED])
-
-    if raw[const.CSV_DEHB_INN_TIER1_COINS_DED]:
-        attr[const.DEHB_INN_TIER1_COINS] = utils.get_num_int(raw[const.CSV_DEHB_INN_TIER1_COINS_DED])
-
-    if raw[const.CSV_DEHB_INN_TIER2_INDIVIDUAL_DED]:
-        attr[const.DEHB_INN_TIER2_INDIVIDUAL] = utils.get_num_int(raw[const.CSV_DEHB_INN_TIER2_INDIVIDUAL_DED])
-
-    if raw[const.CSV_DEHB_INN_TIER2_FAM_PERSON_DED]:
-        attr[const.DEHB_INN_TIER2_FAM_PERSON] = utils.get_num_int(raw[const.CSV_DEHB_INN_TIER2_FAM_PERSON_DED])
-
-    if raw[const.CSV_DEHB_INN_TIER2_FAM_GROUP_DED]:
-        attr[const.DEHB_INN_TIER2_FAM_GROUP] = utils.get_num_int(raw[const.CSV_DEHB_INN_TIER2_FAM_GROUP_DED])
-
-    if raw[const.CSV_DEHB_INN_TIER2_COINS_DED]:
-        attr[const.DEHB_INN_TIER2_COINS] = utils.get_num_int(raw[const.CSV_DEHB_INN_TIER2_COINS_DED])
-
-    if raw[const.CSV_DEHB_OON_INDIVIDUAL_DED]:
-        attr[const.DEHB_OON_INDIVIDUAL] = utils.get_num_int(raw[const.CSV_DEHB_OON_INDIVIDUAL_DED])
-
-    if raw[const.CSV_DEHB_OON_FAM_PERSON_DED]:
-        attr[const.DEHB_OON_FAM_PERSON] = utils.get_num_int(raw[const.CSV_DEHB_OON_FAM_PERSON_DED])
-
-    if raw[const.CSV_DEHB_OON_FAM_GROUP_DED]:
-        attr[const.DEHB_OON_FAM_GROUP] = utils.get_num_int(raw[const.CSV_DEHB_OON_FAM_GROUP_DED])
-
-    if raw[const.CSV_DEHB_COMB_INDIVIDUAL_DED]:
-        attr[const.DEHB_COMB_INDIVIDUAL] = utils.get_num_int(raw[const.CSV_DEHB_COMB_INDIVIDUAL_DED])
-
-    if raw[const.CSV_DEHB_COMB_FAM_PERSON_DED]:
-        attr[const.DEHB_COMB_FAM_PERSON] = utils.get_num_int(raw[const.CSV_DEHB_COMB_FAM_PERSON_DED])
-
-    if raw[const.CSV_DEHB_COMB_FAM_GROUP_DED]:
-        attr[const.DEHB_COMB_FAM_GROUP] = utils.get_num_int(raw[const.CSV_DEHB_COMB_FAM_GROUP_DED])
-
-    save_data(const.TABLE_M_PLAN_DED, attr)
-
-
-def add_medical_plan_ded_int(raw):
-    attr = dict()
-
-    if raw[const.CSV_PLAN_ID]:
-        attr[const.PLAN_ID] = raw[const.CSV_PLAN_ID]
-
-    if raw[const.CSV_TEHB_INN_TIER1_INDIVIDUAL_DED]:
-        attr[const.TEHB_INN_TIER1_INDIVIDUAL] = utils.get_num_int(raw[const.CSV_TEHB_INN_TIER1_INDIVIDUAL_DED])
-
-    if raw[const.CSV_TEHB_INN_TIER1_FAM_PERSON_DED]:
-        attr[const.TEHB_INN_TIER1_FAM_PERSON] = utils.get_num_int(raw[const.CSV_TEHB_INN_TIER1_FAM_PERSON_DED])
-
-    if raw[const.CSV_TEHB_INN_TIER1_FAM_GROUP_DED]:
-        attr[const.TEHB_INN_TIER1_FAM_GROUP] = utils.get_num_int(raw[const.CSV_TEHB_INN_TIER1_FAM_GROUP_DED])
-
-    if raw[const.CSV_TEHB_INN_TIER1_COINS_DED]:
-        attr[const.TEHB_INN_TIER1_COINS] = utils.get_num_int(raw[const.CSV_TEHB_INN_TIER1_COINS_DED])
-
-    if raw[const.CSV_TEHB_INN_TIER2_INDIVIDUAL_DED]:
-        attr[const.TEHB_INN_TIER2_INDIVIDUAL] = utils.get_num_int(raw[const.CSV_TEHB_INN_TIER2_INDIVIDUAL_DED])
-
-    if raw[const.CSV_TEHB_INN_TIER2_FAM_PERSON_DED]:
-        attr[const.TEHB_INN_TIER2_FAM_PERSON] = utils.get_num_int(raw[const.CSV_TEHB_INN_TIER2_FAM_PERSON_DED])
-
-    if raw[const.CSV_TEHB_INN_TIER2_FAM_GROUP_DED]:
-        attr[const.TEHB_INN_TIER2_FAM_GROUP] = utils.get_num_int(raw[const.CSV_TEHB_INN_TIER2_FAM_GROUP_DED])
-
-    if raw[const.CSV_TEHB_INN_TIER2_COINS_DED]:
-        attr[const.TEHB_INN_TIER2_COINS] = utils.get_num_int(raw[const.CSV_TEHB_INN_TIER2_COINS_DED])
-
-    if raw[const.CSV_TEHB_OON_INDIVIDUAL_DED]:
-        attr[const.TEHB_OON_INDIVIDUAL] = utils.get_num_int(raw[const.CSV_TEHB_OON_INDIVIDUAL_DED])
-
-    if raw[const.CSV_TEHB_OON_FAM_PERSON_DED]:
-        attr[const.TEHB_OON_FAM_PERSON] = utils.get_num_int(raw[const.CSV_TEHB_OON_FAM_PERSON_DED])
-
-    if raw[const.CSV_TEHB_OON_FAM_GROUP_DED]:
-        attr[const.TEHB_OON_FAM_GROUP] = utils.get_num_int(raw[const.CSV_TEHB_OON_FAM_GROUP_DED])
-
-    if raw[const.CSV_TEHB_COMB_INDIVIDUAL_DED]:
-        attr[const.TEHB_COMB_INDIVIDUAL] = utils.get_num_int(raw[const.CSV_TEHB_COMB_INDIVIDUAL_DED])
-
-    if raw[const.CSV_TEHB_COMB_FAM_PERSON_DED]:
-        attr[const.TEHB_COMB_FAM_PERSON] = utils.get_num_int(raw[const.CSV_TEHB_COMB_FAM_PERSON_DED])
-
-    if raw[const.CSV_TEHB_COMB_FAM_GROUP_DED]:
-        attr[const.TEHB_COMB_FAM_GROUP] = utils.get_num_int(raw[const.CSV_TEHB_COMB_FAM_GROUP_DED])
-
-    save_data(const.TABLE_M_PLAN_DED_INT, attr)
-
-
-def add_medical_plan_disease(raw, collection):
+def add_medical_plan_disease(plan_id, disease):
     record = dict()
 
-    record["_id"] = raw[const.CSV_PLAN_ID]
-    record["disease"] = raw[const.CSV_DISEASE_PROGRAM]
-
-    collection.insert_one(record)
+    record["_id"] = plan_id
+    record["disease"] = disease
+
+    if timers is None:
+        documents.write(record)
+        return
+    start = time.perf_counter()
+    documents.write(record)
+    timers.write += time.perf_counter() - start
+
+
+# ------------------------- Benefits Data Set -------------------------
+
+# One memo table per enumeration, shared by the in-network/out-of-network columns
+COPAY_PARSER = mapping.CostShareParser(Enum.copay_type, "Copay")
+COINS_PARSER = mapping.CostShareParser(Enum.coins_type, "Coinsurance")
+
+PLAN_BENEFIT = mapping.Mapping(const.TABLE_BENEFIT, [
+    Column(const.PLAN_ID, const.CSV_PLAN_ID),
+    Column(const.BENEFIT_NAME, const.CSV_BENEFIT_NAME),
+    Column((const.COPAY_INN_TIER1, const.COPAY_INN_TIER1_TYPE), const.CSV_COPAY_INN_TIER1, COPAY_PARSER),
+    Column((const.COPAY_INN_TIER2, const.COPAY_INN_TIER2_TYPE), const.CSV_COPAY_INN_TIER2, COPAY_PARSER),
+    Column((const.COPAY_OON, const.COPAY_OON_TYPE), const.CSV_COPAY_OON, COPAY_PARSER),
+    Column((const.COINS_INN_TIER1, const.COINS_INN_TIER1_TYPE), const.CSV_COINS_INN_TIER1, COINS_PARSER),
+    Column((const.COINS_INN_TIER2, const.COINS_INN_TIER2_TYPE), const.CSV_COINS_INN_TIER2, COINS_PARSER),
+    Column((const.COINS_OON, const.COINS_OON_TYPE), const.CSV_COINS_OON, COINS_PARSER),
+    Column(const.IS_EHB, const.CSV_IS_EHB, mapping.flag()),
+    Column(const.EXCL_FROM_INN_MOOP, const.CSV_EXCL_FROM_INN_MOOP, mapping.flag()),
+    Column(const.EXCL_FROM_OON_MOOP, const.CSV_EXCL_FROM_OON_MOOP, mapping.flag()),
+    Column(const.BENEFIT_EXCL, const.CSV_BENEFIT_EXCL),
+])
+
+PLAN_BENEFIT_LIMIT = mapping.Mapping(const.TABLE_BENEFIT_LIMIT, [
+    Column(const.PLAN_ID, const.CSV_PLAN_ID),
+    Column(const.BENEFIT_NAME, const.CSV_BENEFIT_NAME),
+    Column(const.BENEFIT_LIMIT_QTY, const.CSV_BENEFIT_LIMIT_QTY),
+    Column(const.BENEFIT_LIMIT_UNIT, const.CSV_BENEFIT_LIMIT_UNIT),
+    Column(const.BENEFIT_EXPLANATION, const.CSV_BENEFIT_EXPLANATION),
+])
+
+BENEFIT_MAPPINGS = [PLAN_BENEFIT, PLAN_BENEFIT_LIMIT]
 
 
 def load_benefits():
     """
     Load Benefits Cost Sharing CSV file into database
-    :return:
+    :return: number of csv records read
     """
     print("------LOAD Benefits_Cost_Sharing_PUF.csv------")
+    mark = open_checkpoint("benefits", file_benefits)
+    if mark.completed:
+        return 0
+
+    # Foreign keys are checked in memory, a dry run has no plans to check against
+    parents = None
+    if not dry_run:
+        parents = references.Parents(writer)
+        with conn.cursor() as cursor:
+            parents.load(cursor)
+        conn.commit()
+
+    with reader.CsvStream(file_benefits, interval=progress_interval, start=mark.offset) as stream:
+        stream.every(checkpoint_rows, lambda: save_checkpoint(mark, stream.offset, stream.rows))
+        mapping.bind_all(stream.header, BENEFIT_MAPPINGS)
+        is_cover = stream.index[const.CSV_IS_COVER]
+        quant_limit = stream.index[const.CSV_QUANT_LIMIT]
+        plan_id = stream.index[const.CSV_PLAN_ID]
+
+        for row in source_rows(stream, "benefits"):
+            if row[is_cover] == 'Covered':
+                if parents is not None and not parents.has_plan(row[plan_id]):
+                    parents.quarantine(PLAN_BENEFIT, row)
+                    if row[quant_limit] == 'Yes':
+                        parents.quarantine(PLAN_BENEFIT_LIMIT, row)
+                    continue
+                add_plan_benefits(row)
+
+                if row[quant_limit] == 'Yes':
+                    add_plan_benefits_limit(row)
+
+    save_checkpoint(mark, stream.offset, stream.rows, completed=True)
+    print("\nDONE!")
+    writer.report()
+    if parents is not None:
+        parents.report()
+    for name, parser in (("Copay", COPAY_PARSER), ("Coinsurance", COINS_PARSER)):
+        print("%s cells: %d hits, %d misses, %d cached" % ((name,) + parser.stats()))
+    return stream.rows
+
+
+def add_plan_benefits(row):
+    save_row(PLAN_BENEFIT, row)
+
+
+def add_plan_benefits_limit(row):
+    save_row(PLAN_BENEFIT_LIMIT, row)
+
+
+# ------------------------- Rate Data Set -------------------------
+
+RATE_INDIVIDUAL = mapping.Mapping(const.TABLE_RATE_INDIVIDUAL, [
+    Column(const.RATE_EFF_DATE, const.CSV_RATE_EFF_DATE),
+    Column(const.RATE_EXPI_DATE, const.CSV_RATE_EXPI_DATE),
+    Column(const.RATE_STD_COMP_ID, const.CSV_RATE_STD_COMP_ID),
+    Column(const.RATE_AREA_ID, const.CSV_RATE_AREA_ID, mapping.integer),
+    Column(const.RATE_TOBACCO, const.CSV_RATE_TOBACCO, mapping.flag('Tobacco User/Non-Tobacco User')),
+    Column((const.RATE_AGE_FROM, const.RATE_AGE_TO), const.CSV_RATE_AGE, mapping.age_range),
+    Column(const.RATE_INDI_RATE, const.CSV_RATE_INDI_RATE),
+    Column(const.RATE_INDI_TOBACCO_RATE, const.CSV_RATE_INDI_TOBACCO_RATE),
+])
+
+# Columns shared by every family rate tuple, family_type and family_rate are appended per family option
+RATE_FAMILY = mapping.Mapping(const.TABLE_RATE_FAMILY, [
+    Column(const.RATE_FAM_EFF_DATE, const.CSV_RATE_EFF_DATE),
+    Column(const.RATE_FAM_EXPI_DATE, const.CSV_RATE_EXPI_DATE),
+    Column(const.RATE_FAM_STD_COMP_ID, const.CSV_RATE_STD_COMP_ID),
+    Column(const.RATE_FAM_AREA_ID, const.CSV_RATE_AREA_ID, mapping.integer),
+    Column(const.RATE_FAM_INDI_RATE, const.CSV_RATE_INDI_RATE),
+])
+RATE_FAMILY_COLUMNS = RATE_FAMILY.columns + (const.RATE_FAM_TYPE, const.RATE_FAM_RATE)
+
+# Family option columns, each one is also the name of its family_type
+FAMILY_OPTIONS = [const.CSV_RATE_COUPLE,
+                  const.CSV_RATE_PRIM_ONE_DEPENDENT,
+                  const.CSV_RATE_PRIM_TWO_DEPENDENT,
+                  const.CSV_RATE_PRIM_THREE_DEPENDENT,
+                  const.CSV_RATE_COUPLE_ONE_DEPENDENT,
+                  const.CSV_RATE_COUPLE_TWO_DEPENDENT,
+                  const.CSV_RATE_COUPLE_THREE_DEPENDENT]
+
+RATE_MAPPINGS = [RATE_INDIVIDUAL, RATE_FAMILY]
+
+
+def family_options(index):
+    """
+    Resolve family option columns against a csv header
+    :param index: csv column name -> position
+    :return: list of (position, family type id)
+    """
+    return [(index[option], Enum.family_type[option]) for option in FAMILY_OPTIONS]
 
-    with open(file_benefits, mode='r', encoding='iso-8859-1') as fd:
-        # Count total row number
-        reader = csv.DictReader(fd)
-        count = 0
-        rows = sum(1 for _ in reader)
-        fd.seek(0)
-
-        # Loading data into database
-        reader = csv.DictReader(fd)
-        for raw_data in reader:
-            if raw_data[const.CSV_IS_COVER] == 'Covered':
-                add_plan_benefits(raw_data)
 
-                if raw_data[const.CSV_QUANT_LIMIT] == 'Yes':
-                    add_plan_benefits_limit(raw_data)
+def load_rate(workers=1):
+    """
+    Load Rate CSV file into database
+    :param workers: number of processes sharing the file, 1 loads it in this process
+    :return: number of csv records read
+    """
+    global writer
+    print("------LOAD Rate_PUF.csv------")
+    mark = open_checkpoint("rate", file_rate)
+    if mark.completed:
+        return 0
+
+    # Rates go to detached tables attached as plan year partitions at the end; a delta load merges into
+    # the attached partitions instead (see load_delta)
+    detached = not dry_run and changes is None
+    if detached and mark.offset is None:
+        with conn.cursor() as cursor:
+            partitions.prepare(cursor)
+        conn.commit()
+
+    # Staged and sharded loads commit once at the end, a partial load resumes record by record
+    if mark.offset is None:
+        if use_staging:
+            return load_rate_staged(mark)
+        if workers > 1 and archive.is_compressed(file_rate):
+            print("Compressed file, loading without shards")
+        elif workers > 1 and changes is None:
+            if subset is not None:
+                # Shard workers inherit the selected standard components instead of each scanning the plans
+                subset.scan()
+            records = load_rate_parallel(workers)
+            attach_rate(mark, mark.size, records)
+            return records
+
+    base = writer
+    if detached:
+        writer = delta.RedirectWriter(base, partitions.load_tables())
+    try:
+        with reader.CsvStream(file_rate, interval=progress_interval, start=mark.offset) as stream:
+            stream.every(checkpoint_rows, lambda: save_checkpoint(mark, stream.offset, stream.rows))
+            load_rate_rows(stream)
+
+        # A resumed load finding every record written only attaches the partitions
+        save_checkpoint(mark, stream.offset, stream.rows, completed=not detached)
+    finally:
+        writer = base
+    print("\nDONE!")
+    writer.report()
+    if detached:
+        attach_rate(mark, stream.offset, stream.rows)
+    return stream.rows
 
-            count += 1
-            print('\rLoading Process:{:.2f}%'.format(count * 100 / rows), end='')
 
+def attach_rate(mark, offset, rows):
+    """
+    Attach the plan years of the detached rate tables and complete the checkpoint in one transaction
+    :param mark: checkpoint of the rate file
+    :param offset: byte offset after the last record
+    :param rows: records read
+    :return: N/A
+    """
+    with conn.cursor() as cursor:
+        steps = partitions.attach(cursor, replace=args.replace_years)
+        cursor.execute(*mark.save(offset, rows, completed=True))
     conn.commit()
-    print("\nDONE!")
+    partitions.report(steps)
 
 
-def add_plan_benefits(raw):
-    attr = dict()
+def load_rate_staged(mark):
+    """
+    Load Rate CSV file through a staging table, family options are unnested into rate_family tuples in postgres
+    :param mark: checkpoint of the rate file, completed in the same transaction
+    :return: number of csv records read
+    """
+    cursor = conn.cursor()
+    staging.tune(cursor)
+    with staging.Stage(cursor, file_rate, "stage_rate") as stage:
+        stage.load()
+        age = stage.cell(const.CSV_RATE_AGE)
+        individual = sql.SQL("{} <> 'Family Option'").format(age)
+        stage.insert(partitions.load_table(const.TABLE_RATE_INDIVIDUAL), RATE_INDIVIDUAL.columns,
+                     RATE_INDIVIDUAL.select(stage.cell), where=staged_rows("rate", stage, individual))
+
+        # One (family_type, family_rate) pair per family option column, empty options are skipped
+        options = sql.SQL("CROSS JOIN LATERAL unnest({}::INT[], ARRAY[{}]) AS o(family_type, family_rate)").format(
+            sql.Literal([Enum.family_type[option] for option in FAMILY_OPTIONS]),
+            sql.SQL(", ").join(stage.cell(option) for option in FAMILY_OPTIONS))
+        family = sql.SQL("{} = 'Family Option' AND o.family_rate <> ''").format(age)
+        stage.insert(partitions.load_table(const.TABLE_RATE_FAMILY), RATE_FAMILY_COLUMNS,
+                     RATE_FAMILY.select(stage.cell) + [sql.SQL("o.family_type"), sql.SQL("o.family_rate")],
+                     joins=options, where=staged_rows("rate", stage, family))
+        steps = partitions.attach(cursor, replace=args.replace_years)
+        cursor.execute(*mark.save(mark.size, stage.rows, completed=True))
+    conn.commit()
+    print("DONE!")
+    stage.stats.report()
+    partitions.report(steps)
+    return stage.rows
 
-    if raw[const.CSV_PLAN_ID]:
-        attr[const.PLAN_ID] = raw[const.CSV_PLAN_ID]
 
-    if raw[const.CSV_BENEFIT_NAME]:
-        attr[const.BENEFIT_NAME] = raw[const.CSV_BENEFIT_NAME]
+def load_rate_rows(stream):
+    mapping.bind_all(stream.header, RATE_MAPPINGS)
+    age = stream.index[const.CSV_RATE_AGE]
+    options = family_options(stream.index)
 
-    if raw[const.CSV_COPAY_INN_TIER1]:
-        attr[const.COPAY_INN_TIER1] = utils.get_num_decimal(raw[const.CSV_COPAY_INN_TIER1])
-        desc = utils.get_desc(raw[const.CSV_COPAY_INN_TIER1])
-        if desc:
-            if desc == 'Not Applicable':
-                attr[const.COPAY_INN_TIER1] = None
-            attr[const.COPAY_INN_TIER1_TYPE] = Enum.copay_type[desc]
-        else:
-            attr[const.COPAY_INN_TIER1_TYPE] = Enum.copay_type["Copay"]
-    else:
-        attr[const.COPAY_INN_TIER1] = None
-        attr[const.COPAY_INN_TIER1_TYPE] = Enum.copay_type["Not Applicable"]
-
-    if raw[const.CSV_COPAY_INN_TIER2]:
-        attr[const.COPAY_INN_TIER2] = utils.get_num_decimal(raw[const.CSV_COPAY_INN_TIER2])
-        desc = utils.get_desc(raw[const.CSV_COPAY_INN_TIER2])
-        if desc:
-            if desc == 'Not Applicable':
-                attr[const.COPAY_INN_TIER2] = None
-            attr[const.COPAY_INN_TIER2_TYPE] = Enum.copay_type[desc]
-        else:
-            attr[const.COPAY_INN_TIER2_TYPE] = Enum.copay_type["Copay"]
-    else:
-        attr[const.COPAY_INN_TIER2] = None
-        attr[const.COPAY_INN_TIER2_TYPE] = Enum.copay_type["Not Applicable"]
-
-    if raw[const.CSV_COPAY_OON]:
-        attr[const.COPAY_OON] = utils.get_num_decimal(raw[const.CSV_COPAY_OON])
-        desc = utils.get_desc(raw[const.CSV_COPAY_OON])
-        if desc:
-            if desc == 'Not Applicable':
-                attr[const.COPAY_OON] = None
-            attr[const.COPAY_OON_TYPE] = Enum.copay_type[desc]
+    for row in source_rows(stream, "rate"):
+        if row[age] == 'Family Option':
+            # Family Rate
+            add_rate_family(row, options)
         else:
-            attr[const.COPAY_OON_TYPE] = Enum.copay_type["Copay"]
-    else:
-        attr[const.COPAY_OON] = None
-        attr[const.COPAY_OON_TYPE] = Enum.copay_type["Not Applicable"]
-
-    if raw[const.CSV_COINS_INN_TIER1]:
-        attr[const.COINS_INN_TIER1] = utils.get_num_decimal(raw[const.CSV_COINS_INN_TIER1])
-        desc = utils.get_desc(raw[const.CSV_COINS_INN_TIER1])
-        if desc:
-            if desc == 'Not Applicable':
-                attr[const.COINS_INN_TIER1] = None
-            attr[const.COINS_INN_TIER1_TYPE] = Enum.coins_type[desc]
-        else:
-            attr[const.COINS_INN_TIER1_TYPE] = Enum.coins_type["Coinsurance"]
-    else:
-        attr[const.COINS_INN_TIER1] = None
-        attr[const.COINS_INN_TIER1_TYPE] = Enum.coins_type["Not Applicable"]
-
-    if raw[const.CSV_COINS_INN_TIER2]:
-        attr[const.COINS_INN_TIER2] = utils.get_num_decimal(raw[const.CSV_COINS_INN_TIER2])
-        desc = utils.get_desc(raw[const.CSV_COINS_INN_TIER2])
-        if desc:
-            if desc == 'Not Applicable':
-                attr[const.COINS_INN_TIER2] = None
-            attr[const.COINS_INN_TIER2_TYPE] = Enum.coins_type[desc]
-        else:
-            attr[const.COINS_INN_TIER2_TYPE] = Enum.coins_type["Coinsurance"]
-    else:
-        attr[const.COINS_INN_TIER2] = None
-        attr[const.COINS_INN_TIER2_TYPE] = Enum.coins_type["Not Applicable"]
-
-    if raw[const.CSV_COINS_OON]:
-        attr[const.COINS_OON] = utils.get_num_decimal(raw[const.CSV_COINS_OON])
-        desc = utils.get_desc(raw[const.CSV_COINS_OON])
-        if desc:
-            if desc == 'Not Applicable':
-                attr[const.COINS_OON] = None
-            attr[const.COINS_OON_TYPE] = Enum.coins_type[desc]
-        else:
-            attr[const.COINS_OON_TYPE] = Enum.coins_type["Coinsurance"]
-    else:
-        attr[const.COINS_OON] = None
-        attr[const.COINS_OON_TYPE] = Enum.coins_type["Not Applicable"]
-
-    if raw[const.CSV_IS_EHB] == 'Yes':
-        raw[const.IS_EHB] = True
-    else:
-        raw[const.IS_EHB] = False
-
-    if raw[const.CSV_EXCL_FROM_INN_MOOP] == 'Yes':
-        raw[const.EXCL_FROM_INN_MOOP] = True
-    else:
-        raw[const.EXCL_FROM_INN_MOOP] = False
-
-    if raw[const.CSV_EXCL_FROM_OON_MOOP] == 'Yes':
-        raw[const.EXCL_FROM_OON_MOOP] = True
-    else:
-        raw[const.EXCL_FROM_OON_MOOP] = False
-
-    if raw[const.CSV_BENEFIT_EXCL]:
-        attr[const.BENEFIT_EXCL] = raw[const.CSV_BENEFIT_EXCL]
-
-    # print(attr)
-
-    save_data(const.TABLE_BENEFIT, attr)
-
-
-def add_plan_benefits_limit(raw):
-    attr = dict()
-
-    if raw[const.CSV_PLAN_ID]:
-        attr[const.PLAN_ID] = raw[const.CSV_PLAN_ID]
-
-    if raw[const.CSV_BENEFIT_NAME]:
-        attr[const.BENEFIT_NAME] = raw[const.CSV_BENEFIT_NAME]
-
-    if raw[const.CSV_BENEFIT_LIMIT_QTY]:
-        attr[const.BENEFIT_LIMIT_QTY] = raw[const.CSV_BENEFIT_LIMIT_QTY]
-
-    if raw[const.CSV_BENEFIT_LIMIT_UNIT]:
-        attr[const.BENEFIT_LIMIT_UNIT] = raw[const.CSV_BENEFIT_LIMIT_UNIT]
-
-    if raw[const.CSV_BENEFIT_EXPLANATION]:
-        attr[const.BENEFIT_EXPLANATION] = raw[const.CSV_BENEFIT_EXPLANATION]
+            # Individual Rate
+            add_rate_individual(row)
 
-    # print(attr)
 
-    save_data(const.TABLE_BENEFIT_LIMIT, attr)
-
-
-def load_rate():
+def load_rate_parallel(workers):
     """
-    Load Rate CSV file into database
-    :return:
+    Split Rate CSV file into byte range shards loaded by a process pool
+    :param workers: number of worker processes, each with its own connection
+    :return: number of csv records read, RuntimeError when the shards do not reconcile with the file
     """
-    print("------LOAD Rate_PUF.csv------")
-
-    with open(file_rate, mode='r', encoding='iso-8859-1') as fd:
-        # Count total row number
-        reader = csv.DictReader(fd)
-        count = 0
-        rows = sum(1 for _ in reader)
-        fd.seek(0)
-
-        # Loading data into database
-        reader = csv.DictReader(fd)
-        for raw_data in reader:
-            if raw_data[const.CSV_RATE_AGE] == 'Family Option':
-                # Family Rate
-                add_rate_family(raw_data)
-            else:
-                # Individual Rate
-                add_rate_individual(raw_data)
-
-            count += 1
-            print('\rLoading Process:{:.2f}%'.format(count * 100 / rows), end='')
+    ranges = shard.plan(file_rate, workers * const.SHARDS_PER_WORKER)
+    tasks = [(i, start, end) for i, (start, end) in enumerate(ranges)]
+    print("%d shards, %d workers" % (len(tasks), workers))
+
+    results = list()
+    with multiprocessing.Pool(workers, initializer=init_shard_worker,
+                              initargs=(args.mode, args.batch_size, dry_run)) as pool:
+        for result in pool.imap_unordered(load_rate_shard, tasks):
+            results.append(result)
+            if progress_interval is not None:
+                print('\rShards loaded: {}/{}'.format(len(results), len(tasks)), end='')
 
-    conn.commit()
     print("\nDONE!")
+    # Shards commit on their own connections: a mismatch stops the load before anything is attached
+    if not shard.reconcile(file_rate, results):
+        raise RuntimeError("Rate shards do not add up to %s, nothing attached; load it again" % file_rate)
+    return sum(result["records"] for result in results)
 
 
-def add_rate_individual(raw):
-    attr = dict()
-
-    if raw[const.CSV_RATE_EFF_DATE]:
-        attr[const.RATE_EFF_DATE] = raw[const.CSV_RATE_EFF_DATE]
-
-    if raw[const.CSV_RATE_EXPI_DATE]:
-        attr[const.RATE_EXPI_DATE] = raw[const.CSV_RATE_EXPI_DATE]
-
-    if raw[const.CSV_RATE_STD_COMP_ID]:
-        attr[const.RATE_STD_COMP_ID] = raw[const.CSV_RATE_STD_COMP_ID]
-
-    if raw[const.CSV_RATE_AREA_ID]:
-        attr[const.RATE_AREA_ID] = utils.get_num_int(raw[const.CSV_RATE_AREA_ID])
+def init_shard_worker(mode, batch_size, dry=False):
+    """
+    Open the connection and writer of a shard worker process
+    """
+    global conn, writer, dry_run
+    dry_run = dry
+    if dry_run:
+        conn = None
+        writer = writers.NullWriter()
+        return
+    conn = connect()
+    # Shards write into the detached rate tables, attached by the main process
+    writer = delta.RedirectWriter(writers.create_writer(mode, conn.cursor(), batch_size), partitions.load_tables())
+
+
+def load_rate_shard(task):
+    """
+    Load one byte range of Rate CSV file, runs in a worker process
+    :param task: (shard number, start offset, end offset)
+    :return: shard summary for shard.reconcile
+    """
+    number, start, end = task
+    began = time.perf_counter()
+    with reader.CsvStream(file_rate, interval=None, start=start, end=end) as stream:
+        load_rate_rows(stream)
+    commit()
 
-    if raw[const.CSV_RATE_TOBACCO] == 'Tobacco User/Non-Tobacco User':
-        attr[const.RATE_TOBACCO] = True
-    else:
-        attr[const.RATE_TOBACCO] = False
+    # Rows of the detached rate tables are reported under the partitioned tables they are attached to
+    partitioned = dict((load, table) for table, load in partitions.load_tables().items())
+    tables = dict((partitioned.get(table, table), rows) for table, rows in writer.stats.rows.items())
+    writer.stats.reset()
+    return dict(shard=number, start=start, end=end, offset=stream.offset, lines=stream.line_count,
+                records=stream.rows, tables=tables, seconds=time.perf_counter() - began)
 
-    if raw[const.CSV_RATE_AGE]:
-        age_pair = utils.get_age_pair(raw[const.CSV_RATE_AGE])
-        attr[const.RATE_AGE_FROM] = age_pair[0]
-        attr[const.RATE_AGE_TO] = age_pair[1]
 
-    if raw[const.CSV_RATE_INDI_RATE]:
-        attr[const.RATE_INDI_RATE] = raw[const.CSV_RATE_INDI_RATE]
+def add_rate_individual(row):
+    save_row(RATE_INDIVIDUAL, row)
 
-    if raw[const.CSV_RATE_INDI_TOBACCO_RATE]:
-        attr[const.RATE_INDI_TOBACCO_RATE] = raw[const.CSV_RATE_INDI_TOBACCO_RATE]
 
-    save_data(const.TABLE_RATE_INDIVIDUAL, attr)
+def add_rate_family(row, options):
+    base = convert(RATE_FAMILY, row)
+    for position, family_type in options:
+        if row[position]:
+            save_data(const.TABLE_RATE_FAMILY, RATE_FAMILY_COLUMNS, base + (family_type, row[position]))
 
 
-def add_rate_family(raw):
-    attr = dict()
+# ------------------------- Business Rule Data Set -------------------------
 
-    if raw[const.CSV_RATE_EFF_DATE]:
-        attr[const.RATE_FAM_EFF_DATE] = raw[const.CSV_RATE_EFF_DATE]
+BUSINESS_RULES = mapping.Mapping(const.TABLE_BUSINESS_RULE, [
+    Column(const.RULE_STD_COMP_ID, const.CSV_RULE_STD_COMP_ID),
+    Column(const.RULE_PROD_ID, const.CSV_RULE_PROD_ID),
+    Column(const.RULE_RATE_RULE_TYPE, const.CSV_RULE_RATE_RULE_TYPE, mapping.enum(Enum.rate_rule_type)),
+    Column(const.RULE_SINGLE_PARENT_MAX_DEPENDENT, const.CSV_RULE_SINGLE_PARENT_MAX_DEPENDENT),
+    Column(const.RULE_TWO_PARENTS_MAX_DEPENDENT, const.CSV_RULE_TWO_PARENTS_MAX_DEPENDENT),
+    Column(const.RULE_DEPENDENT_MAX_AGE, const.CSV_RULE_DEPENDENT_MAX_AGE, mapping.not_applicable),
+    Column(const.RULE_CHILD_ONLY_MAX_CHILDREN, const.CSV_RULE_CHILD_ONLY_MAX_CHILDREN),
+    Column(const.RULE_DOMESTIC_PARTNER_AS_SPOUSE, const.CSV_RULE_DOMESTIC_PARTNER_AS_SPOUSE, mapping.flag()),
+    Column(const.RULE_SAME_SEX_PARTNER_AS_SPOUSE, const.CSV_RULE_SAME_SEX_PARTNER_AS_SPOUSE, mapping.flag()),
+    Column(const.RULE_AGE_DETERMINE_RULE, const.CSV_RULE_AGE_DETERMINE_RULE, mapping.enum(Enum.age_rule_type)),
+    Column(const.RULE_MIN_TOBACCO_FREE_MONTHS, const.CSV_RULE_MIN_TOBACCO_FREE_MONTHS, mapping.not_applicable),
+])
 
-    if raw[const.CSV_RATE_EXPI_DATE]:
-        attr[const.RATE_FAM_EXPI_DATE] = raw[const.CSV_RATE_EXPI_DATE]
+BUSINESS_RULE_COHABIT_COLUMNS = (const.COHABIT_STD_COMP_ID, const.COHABIT_TYPE, const.COHABIT_REQUIRED)
 
-    if raw[const.CSV_RATE_STD_COMP_ID]:
-        attr[const.RATE_FAM_STD_COMP_ID] = raw[const.CSV_RATE_STD_COMP_ID]
+# Cohabitation tuples are split from the rule by add_business_rules_cohabit, only their key is a plain column
+BUSINESS_RULE_COHABIT_KEY = mapping.Mapping(const.TABLE_BUSINESS_RULE_COHABIT, [
+    Column(const.COHABIT_STD_COMP_ID, const.CSV_RULE_STD_COMP_ID),
+])
 
-    if raw[const.CSV_RATE_AREA_ID]:
-        attr[const.RATE_FAM_AREA_ID] = utils.get_num_int(raw[const.CSV_RATE_AREA_ID])
+RULE_MAPPINGS = [BUSINESS_RULES]
 
-    if raw[const.CSV_RATE_INDI_RATE]:
-        attr[const.RATE_FAM_INDI_RATE] = raw[const.CSV_RATE_INDI_RATE]
 
-    if raw[const.CSV_RATE_COUPLE]:
-        family_type = Enum.family_type[const.CSV_RATE_COUPLE]
-        attr[const.RATE_FAM_TYPE] = family_type
-        attr[const.RATE_FAM_RATE] = raw[const.CSV_RATE_COUPLE]
-        save_data(const.TABLE_RATE_FAMILY, attr)
+def load_business_rules():
+    """
+    Load Business Rule CSV file into database
+    :return: number of csv records read
+    """
+    print("------LOAD Business_Rules_PUF.csv------")
+    mark = open_checkpoint("business_rules", file_business_rules)
+    if mark.completed:
+        return 0
 
-    if raw[const.CSV_RATE_PRIM_ONE_DEPENDENT]:
-        family_type = Enum.family_type[const.CSV_RATE_PRIM_ONE_DEPENDENT]
-        attr[const.RATE_FAM_TYPE] = family_type
-        attr[const.RATE_FAM_RATE] = raw[const.CSV_RATE_PRIM_ONE_DEPENDENT]
-        save_data(const.TABLE_RATE_FAMILY, attr)
+    if use_staging and mark.offset is None:
+        return load_business_rules_staged(mark)
 
-    if raw[const.CSV_RATE_PRIM_TWO_DEPENDENT]:
-        family_type = Enum.family_type[const.CSV_RATE_PRIM_TWO_DEPENDENT]
-        attr[const.RATE_FAM_TYPE] = family_type
-        attr[const.RATE_FAM_RATE] = raw[const.CSV_RATE_PRIM_TWO_DEPENDENT]
-        save_data(const.TABLE_RATE_FAMILY, attr)
+    with reader.CsvStream(file_business_rules, interval=progress_interval, start=mark.offset) as stream:
+        stream.every(checkpoint_rows, lambda: save_checkpoint(mark, stream.offset, stream.rows))
+        mapping.bind_all(stream.header, RULE_MAPPINGS)
+        std_comp_id = stream.index[const.CSV_RULE_STD_COMP_ID]
+        cohabit_rule = stream.index[const.CSV_RULE_COHABIT_RULE]
 
-    if raw[const.CSV_RATE_PRIM_THREE_DEPENDENT]:
-        family_type = Enum.family_type[const.CSV_RATE_PRIM_THREE_DEPENDENT]
-        attr[const.RATE_FAM_TYPE] = family_type
-        attr[const.RATE_FAM_RATE] = raw[const.CSV_RATE_PRIM_THREE_DEPENDENT]
-        save_data(const.TABLE_RATE_FAMILY, attr)
+        for row in source_rows(stream, "business_rules"):
+            add_business_rules(row)
 
-    if raw[const.CSV_RATE_COUPLE_ONE_DEPENDENT]:
-        family_type = Enum.family_type[const.CSV_RATE_COUPLE_ONE_DEPENDENT]
-        attr[const.RATE_FAM_TYPE] = family_type
-        attr[const.RATE_FAM_RATE] = raw[const.CSV_RATE_COUPLE_ONE_DEPENDENT]
-        save_data(const.TABLE_RATE_FAMILY, attr)
+            add_business_rules_cohabit(row[std_comp_id], row[cohabit_rule])
 
-    if raw[const.CSV_RATE_COUPLE_TWO_DEPENDENT]:
-        family_type = Enum.family_type[const.CSV_RATE_COUPLE_TWO_DEPENDENT]
-        attr[const.RATE_FAM_TYPE] = family_type
-        attr[const.RATE_FAM_RATE] = raw[const.CSV_RATE_COUPLE_TWO_DEPENDENT]
-        save_data(const.TABLE_RATE_FAMILY, attr)
+    save_checkpoint(mark, stream.offset, stream.rows, completed=True)
+    print("\nDONE!")
+    writer.report()
+    return stream.rows
 
-    if raw[const.CSV_RATE_COUPLE_THREE_DEPENDENT]:
-        family_type = Enum.family_type[const.CSV_RATE_COUPLE_THREE_DEPENDENT]
-        attr[const.RATE_FAM_TYPE] = family_type
-        attr[const.RATE_FAM_RATE] = raw[const.CSV_RATE_COUPLE_THREE_DEPENDENT]
-        save_data(const.TABLE_RATE_FAMILY, attr)
 
+def load_business_rules_staged(mark):
+    """
+    Load Business Rule CSV file through a staging table, cohabitation rules are split in postgres.
 
-def load_business_rules():
+    Unknown cohabitation types are stored as NULL instead of failing the load.
+    :param mark: checkpoint of the business rule file, completed in the same transaction
+    :return: number of csv records read
     """
-    Load Business Rule CSV file into database
-    :return:
+    cursor = conn.cursor()
+    staging.tune(cursor)
+    with staging.Stage(cursor, file_business_rules, "stage_business_rules") as stage:
+        stage.load()
+        stage.insert_mapping(BUSINESS_RULES, where=staged_rows("business_rules", stage))
+
+        # "Spouse,Yes;Child,No" -> one (cohabit type, required) tuple per ';' separated pair
+        rule = stage.cell(const.CSV_RULE_COHABIT_RULE)
+        stage.insert(const.TABLE_BUSINESS_RULE_COHABIT, BUSINESS_RULE_COHABIT_COLUMNS,
+                     [sql.SQL("NULLIF({}, '')").format(stage.cell(const.CSV_RULE_STD_COMP_ID)),
+                      mapping.case(sql.SQL("split_part(c.pair, ',', 1)"), Enum.cohabit_type),
+                      sql.SQL("split_part(c.pair, ',', 2) = 'Yes'")],
+                     joins=sql.SQL("CROSS JOIN LATERAL unnest(string_to_array({}, ';')) AS c(pair)").format(rule),
+                     where=staged_rows("business_rules", stage, sql.SQL("{} <> ''").format(rule)))
+        cursor.execute(*mark.save(mark.size, stage.rows, completed=True))
+    conn.commit()
+    print("DONE!")
+    stage.stats.report()
+    return stage.rows
+
+
+def add_business_rules(row):
+    save_row(BUSINESS_RULES, row)
+
+
+def add_business_rules_cohabit(std_comp_id, cohabit_rule):
+    if not cohabit_rule:
+        return
+
+    for cohabit_pair in cohabit_rule.split(';'):
+        pair = cohabit_pair.split(',')
+        cohabit_obj = pair[0]
+        cohabit_required = pair[1] == 'Yes'
+        save_data(const.TABLE_BUSINESS_RULE_COHABIT, BUSINESS_RULE_COHABIT_COLUMNS,
+                  (std_comp_id or None, Enum.cohabit_type[cohabit_obj], cohabit_required))
+
+
+# ------------------------- Orchestration -------------------------
+
+# Data set loads and the loads they depend on: plan_benefit references plan_general_info,
+# rates and business rules reference nothing loaded here
+DATASETS = collections.OrderedDict([
+    ("plans", []),
+    ("benefits", ["plans"]),
+    ("rate", []),
+    ("business_rules", []),
+])
+
+
+# ------------------------- Delta Loading -------------------------
+
+# Csv columns identifying a record, the natural key of the tables it fills
+DELTA_KEYS = {
+    "plans": [const.CSV_PLAN_ID],
+    "benefits": [const.CSV_PLAN_ID, const.CSV_BENEFIT_NAME],
+    "rate": [const.CSV_RATE_EFF_DATE, const.CSV_RATE_EXPI_DATE, const.CSV_RATE_STD_COMP_ID, const.CSV_RATE_AREA_ID,
+             const.CSV_RATE_AGE],
+    "business_rules": [const.CSV_RULE_STD_COMP_ID],
+}
+
+# Tables filled by each data set, referenced tables first. Plans, benefits and business rules are updated
+# in place; removing a plan also removes its benefits, which belong to the benefits data set.
+DELTA_TABLES = {
+    "plans": [
+        delta.DeltaTable(PLAN_GENERAL_INFO, (const.PLAN_ID,), delta.UPSERT),
+        delta.DeltaTable(PLAN_MULTI_NETWORK, (const.PLAN_ID,)),
+        delta.DeltaTable(MEDICAL_PLAN, (const.PLAN_ID,)),
+        delta.DeltaTable(MEDICAL_PLAN_REFERRAL, (const.PLAN_ID,)),
+        delta.DeltaTable(MEDICAL_PLAN_SBC, (const.PLAN_ID,)),
+        delta.DeltaTable(MEDICAL_PLAN_MOOP, (const.PLAN_ID,)),
+        delta.DeltaTable(MEDICAL_PLAN_MOOP_INT, (const.PLAN_ID,)),
+        delta.DeltaTable(MEDICAL_PLAN_DED, (const.PLAN_ID,)),
+        delta.DeltaTable(MEDICAL_PLAN_DED_INT, (const.PLAN_ID,)),
+        delta.DeltaTable(DENTAL_PLAN, (const.PLAN_ID,)),
+        delta.DeltaTable(DENTAL_PLAN_MOOP, (const.PLAN_ID,)),
+        delta.DeltaTable(DENTAL_PLAN_DED, (const.PLAN_ID,)),
+        delta.DeltaTable(PLAN_BENEFIT, (const.PLAN_ID,), delta.DEPENDENT),
+        delta.DeltaTable(PLAN_BENEFIT_LIMIT, (const.PLAN_ID,), delta.DEPENDENT),
+    ],
+    "benefits": [
+        delta.DeltaTable(PLAN_BENEFIT, (const.PLAN_ID, const.BENEFIT_NAME), delta.UPSERT),
+        delta.DeltaTable(PLAN_BENEFIT_LIMIT, (const.PLAN_ID, const.BENEFIT_NAME)),
+    ],
+    "rate": [
+        delta.DeltaTable(RATE_INDIVIDUAL, (const.RATE_EFF_DATE, const.RATE_EXPI_DATE, const.RATE_STD_COMP_ID,
+                                           const.RATE_AREA_ID, const.RATE_AGE_FROM, const.RATE_AGE_TO),
+                         where=lambda cell: sql.SQL("{} <> 'Family Option'").format(cell(const.CSV_RATE_AGE))),
+        delta.DeltaTable(RATE_FAMILY, (const.RATE_FAM_EFF_DATE, const.RATE_FAM_EXPI_DATE,
+                                       const.RATE_FAM_STD_COMP_ID, const.RATE_FAM_AREA_ID),
+                         where=lambda cell: sql.SQL("{} = 'Family Option'").format(cell(const.CSV_RATE_AGE))),
+    ],
+    "business_rules": [
+        delta.DeltaTable(BUSINESS_RULES, (const.RULE_STD_COMP_ID,), delta.UPSERT),
+        delta.DeltaTable(BUSINESS_RULE_COHABIT_KEY, (const.COHABIT_STD_COMP_ID,)),
+    ],
+}
+
+
+def dataset_file(name):
     """
-    print("------LOAD Business_Rules_PUF.csv------")
-
-    with open(file_business_rules, mode='r', encoding='iso-8859-1') as fd:
-        # Count total row number
-        reader = csv.DictReader(fd)
-        count = 0
-        rows = sum(1 for _ in reader)
-        fd.seek(0)
-
-        # Loading data into database
-        reader = csv.DictReader(fd)
-        for raw_data in reader:
-            add_business_rules(raw_data)
+    :param name: name in DATASETS
+    :return: csv file of the data set
+    """
+    return {"plans": file_plan, "benefits": file_benefits, "rate": file_rate,
+            "business_rules": file_business_rules}[name]
 
-            add_business_rules_cohabit(raw_data)
 
-            count += 1
-            print('\rLoading Process:{:.2f}%'.format(count * 100 / rows), end='')
+def load_delta(name):
+    """
+    Load the records of a data set changed since its last load.
+
+    A first pass fingerprints every record, the loader of the data set then
+    reads the file again and writes the new and changed records into delta
+    tables, which are merged into the data set tables in one transaction.
+    Without stored fingerprints (first delta load) every record is new and
+    the tables are refreshed completely.
+    :param name: name in DATASETS
+    :return: number of csv records loaded
+    """
+    global writer, changes
+    changes = delta.Delta(name, DELTA_KEYS[name], DELTA_TABLES[name])
+    print("------DELTA %s------" % dataset_file(name))
+    with conn.cursor() as cursor:
+        with reader.CsvStream(dataset_file(name), interval=None) as stream:
+            changes.classify(cursor, stream.index, selected_rows(stream, name))
+        changes.prepare(cursor)
+    conn.commit()
 
+    if name == "plans":
+        # Disease programs of changed and removed plans are written again or go
+        documents.flush()
+        documents.collection.delete_many({"_id": {"$in": [plan_id for plan_id, in changes.keys()]}})
+
+    base = writer
+    writer = changes.writer(base)
+    try:
+        records = load_dataset(name, full=True)
+    finally:
+        writer = base
+    documents.flush()
+
+    with conn.cursor() as cursor:
+        if name == "rate":
+            # Rates of a new plan year need its partition before the merge
+            for table, column in partitions.KEYS.items():
+                partitions.ensure(cursor, table, partitions.years(cursor, delta.PREFIX + table, column))
+        changes.apply(cursor)
     conn.commit()
-    print("\nDONE!")
+    changes.report()
+    changes = None
+    return records
 
 
-def add_business_rules(raw):
-    attr = dict()
+def load_dataset(name, full=False):
+    """
+    Load one data set with the active connection and writer
+    :param name: name in DATASETS
+    :param full: load every record even in delta mode
+    :return: number of csv records read
+    """
+    if use_delta and not full:
+        return load_delta(name)
+    if name == "plans":
+        return load_plans()
+    if name == "benefits":
+        return load_benefits()
+    if name == "rate":
+        return load_rate(workers=args.rate_workers)
+    if name == "business_rules":
+        return load_business_rules()
+    raise ValueError("Unknown data set %s" % name)
+
+
+def open_writer(options, connection):
+    """
+    Create the writer selected on the command line for a connection
+    :param options: parsed command line arguments
+    :param connection: postgres connection written to (pipeline writers open their own)
+    :return: writer
+    """
+    if options.dry_run:
+        return writers.NullWriter()
+    if options.pipeline:
+        return writers.PipelineWriter(connect, options.mode, options.batch_size, options.queue_size)
+    return writers.create_writer(options.mode, connection.cursor(), options.batch_size)
 
-    if raw[const.CSV_RULE_STD_COMP_ID]:
-        attr[const.RULE_STD_COMP_ID] = raw[const.CSV_RULE_STD_COMP_ID]
 
-    if raw[const.CSV_RULE_PROD_ID]:
-        attr[const.RULE_PROD_ID] = raw[const.CSV_RULE_PROD_ID]
+def connect_mongo(drop=False):
+    """
+    Connect to mongoDB
+    :param drop: drop the database first
+    :return: database
+    """
+    mongo = pymongo.MongoClient("mongodb://%s:%s/" % (const.MONGO_HOST, const.MONGO_PORT))
+    if drop and const.MONGO_DB_NAME in mongo.list_database_names():
+        mongo.drop_database(const.MONGO_DB_NAME)
+    return mongo[const.MONGO_DB_NAME]
 
-    if raw[const.CSV_RULE_RATE_RULE_TYPE] in Enum.rate_rule_type:
-        attr[const.RULE_RATE_RULE_TYPE] = Enum.rate_rule_type[raw[const.CSV_RULE_RATE_RULE_TYPE]]
 
-    if raw[const.CSV_RULE_SINGLE_PARENT_MAX_DEPENDENT]:
-        attr[const.RULE_SINGLE_PARENT_MAX_DEPENDENT] = raw[const.CSV_RULE_SINGLE_PARENT_MAX_DEPENDENT]
+def open_documents(options, database):
+    """
+    Create the batched writer of disease program documents
+    :param options: parsed command line arguments
+    :param database: mongoDB database, None for a dry run
+    :return: writers.DocumentWriter
+    """
+    # Documents written after the last checkpoint of an interrupted load are already there when resuming,
+    # a delta load writes into the collection of the last load
+    collection = database[const.COL_MEDICAL_DISEASE] if database is not None else None
+    return writers.DocumentWriter(collection, options.mongo_batch_size,
+                                  options.mongo_upsert or options.resume or options.delta)
 
-    if raw[const.CSV_RULE_TWO_PARENTS_MAX_DEPENDENT]:
-        attr[const.RULE_TWO_PARENTS_MAX_DEPENDENT] = raw[const.CSV_RULE_TWO_PARENTS_MAX_DEPENDENT]
 
-    if raw[const.CSV_RULE_DEPENDENT_MAX_AGE] != 'Not Applicable':
-        attr[const.RULE_DEPENDENT_MAX_AGE] = raw[const.CSV_RULE_DEPENDENT_MAX_AGE]
+def open_selection(options):
+    """
+    :param options: parsed command line arguments
+    :return: selection.Selection of the state/issuer/date options, None when loading everything
+    """
+    if not (options.states or options.issuers or options.effective_from or options.effective_to):
+        return None
+    return selection.Selection(file_plan, options.states, options.issuers, options.effective_from,
+                               options.effective_to)
 
-    if raw[const.CSV_RULE_CHILD_ONLY_MAX_CHILDREN]:
-        attr[const.RULE_CHILD_ONLY_MAX_CHILDREN] = raw[const.CSV_RULE_CHILD_ONLY_MAX_CHILDREN]
 
-    if raw[const.CSV_RULE_DOMESTIC_PARTNER_AS_SPOUSE] == 'Yes':
-        attr[const.RULE_DOMESTIC_PARTNER_AS_SPOUSE] = True
-    else:
-        attr[const.RULE_DOMESTIC_PARTNER_AS_SPOUSE] = False
+def run_load(name):
+    """
+    Load one data set, timing its stages and profiling it when asked
+    :param name: name in DATASETS
+    :return: number of csv records read
+    """
+    global timers
+    if stage_timers:
+        timers = profiling.StageTimers()
+    try:
+        if profile_dir is not None:
+            records = profiling.profiled(functools.partial(load_dataset, name),
+                                         os.path.join(profile_dir, "%s.prof" % name))
+        else:
+            records = load_dataset(name)
+        if timers is not None:
+            timers.report(name, records)
+        return records
+    finally:
+        timers = None
 
-    if raw[const.CSV_RULE_SAME_SEX_PARTNER_AS_SPOUSE] == 'Yes':
-        attr[const.RULE_SAME_SEX_PARTNER_AS_SPOUSE] = True
-    else:
-        attr[const.RULE_SAME_SEX_PARTNER_AS_SPOUSE] = False
 
-    if raw[const.CSV_RULE_AGE_DETERMINE_RULE] in Enum.age_rule_type:
-        attr[const.RULE_AGE_DETERMINE_RULE] = Enum.age_rule_type[raw[const.CSV_RULE_AGE_DETERMINE_RULE]]
+def set_options(options):
+    """
+    Copy the command line options into the module settings
+    :param options: parsed command line arguments
+    :return: N/A
+    """
+    global args, use_staging, resume, checkpoint_rows, use_delta, subset, dry_run, stage_timers, profile_dir
+    args = options
+    use_staging = options.staging
+    resume = options.resume
+    checkpoint_rows = options.checkpoint_rows
+    use_delta = options.delta
+    locate_files(options.data_dir)
+    subset = open_selection(options)
+    dry_run = options.dry_run
+    stage_timers = options.dry_run or options.timers
+    profile_dir = options.profile
+    if profile_dir is not None:
+        os.makedirs(profile_dir, exist_ok=True)
+
+
+def run_dataset(options, name):
+    """
+    Load one data set in an orchestrator worker process, on its own connections
+    :param options: parsed command line arguments
+    :param name: name in DATASETS
+    :return: number of csv records read
+    """
+    global conn, writer, mongodb, documents, progress_interval
+    set_options(options)
+    progress_interval = None
+    conn = connect() if not dry_run else None
+    writer = open_writer(options, conn)
+    mongodb = connect_mongo() if not dry_run else None
+    documents = open_documents(options, mongodb)
+    try:
+        return run_load(name)
+    finally:
+        documents.close()
+        writer.close()
+        if conn is not None:
+            conn.close()
 
-    if raw[const.CSV_RULE_MIN_TOBACCO_FREE_MONTHS] != 'Not Applicable':
-        attr[const.RULE_MIN_TOBACCO_FREE_MONTHS] = raw[const.CSV_RULE_MIN_TOBACCO_FREE_MONTHS]
 
-    save_data(const.TABLE_BUSINESS_RULE, attr)
+def comma_list(value):
+    return [item.strip() for item in value.split(",") if item.strip()]
 
 
-def add_business_rules_cohabit(raw):
-    attr = dict()
+def iso_date(value):
+    return datetime.date.fromisoformat(value).isoformat()
 
-    if raw[const.CSV_RULE_STD_COMP_ID]:
-        attr[const.RULE_STD_COMP_ID] = raw[const.CSV_RULE_STD_COMP_ID]
 
-    if raw[const.CSV_RULE_COHABIT_RULE]:
-        cohabit_pairs = raw[const.CSV_RULE_COHABIT_RULE].split(';')
-        for cohabit_pair in cohabit_pairs:
-            pair = cohabit_pair.split(',')
-            cohabit_obj = pair[0]
-            cohabit_required = pair[1]
-            attr[const.COHABIT_TYPE] = Enum.cohabit_type[cohabit_obj]
-            if cohabit_required == 'Yes':
-                attr[const.COHABIT_REQUIRED] = True
-            else:
-                attr[const.COHABIT_REQUIRED] = False
-            save_data(const.TABLE_BUSINESS_RULE_COHABIT, attr)
+def parse_args(argv=None):
+    """
+    :param argv: command line arguments, sys.argv[1:] when None
+    :return: parsed options
+    """
+    parser = argparse.ArgumentParser(description="Load CMS PUF data sets into postgres and mongoDB")
+    parser.add_argument("--mode", choices=[const.LOAD_MODE_COPY, const.LOAD_MODE_INSERT],
+                        default=const.LOAD_MODE_COPY,
+                        help="copy: buffered COPY FROM STDIN, insert: one INSERT per tuple (fallback)")
+    parser.add_argument("--batch-size", type=int, default=const.COPY_BATCH_SIZE,
+                        help="tuples buffered per table before flushing in copy mode")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="parse and write in separate stages, the writer stage using its own connection")
+    parser.add_argument("--queue-size", type=int, default=const.PIPELINE_QUEUE_SIZE,
+                        help="batches waiting for the writer stage before parsing blocks (pipeline only)")
+    parser.add_argument("--rate-workers", type=int, default=1,
+                        help="processes loading byte range shards of Rate_PUF.csv in parallel")
+    parser.add_argument("--parallel", action="store_true",
+                        help="load independent data sets at the same time, each in its own process")
+    parser.add_argument("--checkpoint-rows", type=int, default=const.CHECKPOINT_ROWS,
+                        help="csv records per transaction, each commit saves the data set checkpoint")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue every data set after its last checkpoint, skip completed ones")
+    parser.add_argument("--resume-ignore-mtime", action="store_true",
+                        help="resume files whose mtime changed since their checkpoint, e.g. copied; "
+                             "size and fingerprint must still match")
+    parser.add_argument("--mongo-batch-size", type=int, default=const.MONGO_BATCH_SIZE,
+                        help="disease program documents per unordered bulk write")
+    parser.add_argument("--mongo-upsert", action="store_true",
+                        help="replace disease program documents by plan id instead of dropping the mongoDB database")
+    parser.add_argument("--staging", action="store_true",
+                        help="COPY rate, business rule and plan files into unlogged staging tables and reshape "
+                             "them with INSERT ... SELECT")
+    parser.add_argument("--fast-load", action="store_true",
+                        help="drop keys, foreign keys and indexes before loading and rebuild them afterwards, "
+                             "moving violating rows to load_violations")
+    parser.add_argument("--build-workers", type=int, default=const.BUILD_WORKERS,
+                        help="connections rebuilding keys and indexes in parallel (fast load only)")
+    parser.add_argument("--data-dir",
+                        help="directory of the data set files; csv files may be replaced by their .csv.gz, "
+                             ".csv.zst or .zip download, decompressed while loading")
+    parser.add_argument("--states", type=comma_list,
+                        help="comma separated state codes of the plans to load, e.g. TX,FL; benefits, rates "
+                             "and business rules follow the selected plans")
+    parser.add_argument("--issuers", type=comma_list, help="comma separated HIOS issuer ids of the plans to load")
+    parser.add_argument("--effective-from", type=iso_date,
+                        help="first plan and rate effective date to load (YYYY-MM-DD)")
+    parser.add_argument("--effective-to", type=iso_date,
+                        help="last plan and rate effective date to load (YYYY-MM-DD)")
+    parser.add_argument("--delta", action="store_true",
+                        help="apply only the records inserted, changed or removed since the last load, "
+                             "compared by fingerprint")
+    parser.add_argument("--replace-years", action="store_true",
+                        help="swap the rate partitions of the loaded plan years for the loaded rates instead of "
+                             "appending to them")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="read, parse and transform every record but discard the tuples, nothing is written "
+                             "to postgres or mongoDB (enumerations are still read); prints the time of each stage")
+    parser.add_argument("--timers", action="store_true",
+                        help="print the read/parse/transform/write time of each data set")
+    parser.add_argument("--profile", metavar="DIR",
+                        help="run each data set under cProfile and save DIR/<data set>.prof")
+    parser.add_argument("--optimize", action="store_true",
+                        help="after loading: create extended statistics, CLUSTER the rate tables on "
+                             "std_component_id and VACUUM ANALYZE, timing the standard queries before and after")
+    options = parser.parse_args(argv)
+    if options.dry_run and (options.staging or options.fast_load or options.resume or options.delta or
+                            options.pipeline or options.optimize):
+        parser.error("--dry-run has no database, it cannot be combined with --staging, --fast-load, --resume, "
+                     "--delta, --pipeline or --optimize")
+    if options.resume_ignore_mtime and not options.resume:
+        parser.error("--resume-ignore-mtime only applies with --resume")
+    if options.delta and (options.staging or options.fast_load or options.resume):
+        parser.error("--delta merges into loaded tables, it cannot be combined with --staging, --fast-load "
+                     "or --resume")
+    return options
 
 
 if __name__ == '__main__':
-    # Connect to postgres database
-    conn = psycopg2.connect("host=%s dbname=%s user=%s" % (const.HOST_NAME,
-                                                           const.DB_NAME,
-                                                           const.DB_USER))
-    cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+    args = parse_args()
+    set_options(args)
 
-    # Connect to mongoDB
-    mongo = pymongo.MongoClient("mongodb://%s:%s/" % (const.MONGO_HOST, const.MONGO_PORT))
-    dblist = mongo.list_database_names()
-    if const.MONGO_DB_NAME in dblist:
-        # Drop database if exist
-        mongo.drop_database(const.MONGO_DB_NAME)
-    mongodb = mongo[const.MONGO_DB_NAME]
-
-    # Load Plan_Attributes_PUF.csv
-    load_plans()
+    # Connect to mongoDB, dropping the database if exist unless documents are upserted
+    mongodb = connect_mongo(drop=not (args.mongo_upsert or args.resume or args.delta)) if not dry_run else None
 
-    # Load Benefits_Cost_Sharing_PUF.csv
-    load_benefits()
+    if args.fast_load:
+        # Load into tables without keys, foreign keys and indexes
+        conn = connect()
+        constraints.defer(conn)
+        conn.close()
 
-    # Load Rate
-    load_rate()
-
-    # Load Business Rules
-    load_business_rules()
+    if args.parallel:
+        # Each data set loads on its own connections once the data sets it depends on are done
+        succeed = orchestrator.run(DATASETS, functools.partial(run_dataset, args))
+    else:
+        # Connect to postgres database
+        conn = connect() if not dry_run else None
+        writer = open_writer(args, conn)
+        documents = open_documents(args, mongodb)
+
+        # Load Plan_Attributes_PUF.csv, Benefits_Cost_Sharing_PUF.csv, Rate_PUF.csv and Business_Rules_PUF.csv
+        for dataset in DATASETS:
+            run_load(dataset)
+
+        documents.close()
+        writer.close()
+        if conn is not None:
+            conn.close()
+        succeed = True
+
+    if args.fast_load and succeed:
+        print("------BUILD constraints and indexes------")
+        constraints.build(connect, args.build_workers)
+
+    if not dry_run:
+        # Cached Query results of the previous version are no longer served; the checkpoints a failed
+        # load committed changed the data too
+        conn = connect()
+        with conn.cursor() as cursor:
+            version = result_cache.bump(cursor)
+        conn.commit()
+        conn.close()
+        print("Dataset version %d" % version)
+
+    if args.optimize and succeed:
+        print("------OPTIMIZE loaded tables------")
+        maintenance.optimize(connect)
+
+    sys.exit(0 if succeed else 1)
@@ -0,0 +1,178 @@
+# post-load optimization: indexes and extended statistics, CLUSTER on the hot access path, VACUUM ANALYZE
+import argparse
+import collections
+import time
+
+from psycopg2 import sql
+from tabulate import tabulate
+
+import constraints
+import indexes
+import constants as const
+from enumeration import Enum
+
+# Tables kept in the order of their hot access path: relation -> index, defined in indexes.INDEXES
+CLUSTER_INDEXES = collections.OrderedDict([
+    (const.TABLE_RATE_INDIVIDUAL, "rate_individual_std_component_idx"),
+    (const.TABLE_RATE_FAMILY, "rate_family_std_component_idx"),
+])
+
+# Extended statistics on correlated columns: (name, relation, columns); see schema.sql
+STATISTICS = [
+    ("medical_plans_metal_level_stats", const.TABLE_MEDICAL_PLAN, (const.M_METAL_LEVEL, const.PLAN_ID)),
+    ("dental_plans_metal_level_stats", const.TABLE_DENTAL_PLAN, (const.D_METAL_LEVEL, const.PLAN_ID)),
+    ("rate_individual_age_range_stats", const.TABLE_RATE_INDIVIDUAL, (const.RATE_AGE_FROM, const.RATE_AGE_TO)),
+    ("rate_individual_period_stats", const.TABLE_RATE_INDIVIDUAL, (const.RATE_EFF_DATE, const.RATE_EXPI_DATE)),
+    ("rate_family_period_stats", const.TABLE_RATE_FAMILY, (const.RATE_FAM_EFF_DATE, const.RATE_FAM_EXPI_DATE)),
+]
+
+
+def prepare(cursor):
+    """
+    Create or rebuild the indexes of the hot access paths (indexes.migrate) and create the extended
+    statistics missing in databases set up before they existed
+    :param cursor: postgres cursor
+    :return: report steps
+    """
+    steps = [["index " + action, table, seconds] for name, table, action, seconds in indexes.migrate(cursor)
+             if action != indexes.CURRENT]
+    for name, table, columns in STATISTICS:
+        steps.append(run(cursor, "statistics", table, sql.SQL(
+            "CREATE STATISTICS IF NOT EXISTS {} (ndistinct, dependencies) ON {} FROM {}").format(
+            sql.Identifier(name), sql.SQL(", ").join(sql.Identifier(column) for column in columns),
+            sql.Identifier(table))))
+    return steps
+
+
+def cluster(cursor, tables):
+    """
+    Rewrite tables in the order of their clustering index; takes an ACCESS EXCLUSIVE lock and
+    needs room for a second copy of the table. The partitioned rate tables are clustered partition
+    by partition, which needs postgres 15 or later
+    :param cursor: postgres cursor
+    :param tables: relations, the ones without a clustering index are skipped
+    :return: report steps
+    """
+    return [run(cursor, "cluster", table, sql.SQL("CLUSTER {} USING {}").format(
+        sql.Identifier(table), sql.Identifier(CLUSTER_INDEXES[table])))
+            for table in tables if table in CLUSTER_INDEXES]
+
+
+def vacuum_analyze(cursor, tables):
+    """
+    Set the visibility map (index only scans) and refresh the planner statistics, extended ones included
+    :param cursor: postgres cursor in autocommit mode
+    :param tables: relations
+    :return: report steps
+    """
+    return [run(cursor, "vacuum analyze", table, sql.SQL("VACUUM (ANALYZE) {}").format(sql.Identifier(table)))
+            for table in tables]
+
+
+def run(cursor, step, table, statement):
+    start = time.perf_counter()
+    cursor.execute(statement)
+    return [step, table, "%.2f" % (time.perf_counter() - start)]
+
+
+def sample_queries():
+    """
+    Calls of the standard database.Query methods with representative arguments
+    :return: ordered dict query -> function running it
+    """
+    # database connects when imported
+    from database import Query
+
+    silver = Enum.m_metal_type["Silver"]
+    intervals = Query.get_time_intervals(silver, 30)
+    queries = collections.OrderedDict([
+        ("get_time_intervals", lambda: Query.get_time_intervals(silver, 30)),
+        ("get_plans", lambda: Query.get_plans([const.PLAN_ID, const.PLAN_VAR_NAME], collections.OrderedDict(
+            [(const.MARK_COVERAGE, (const.EQUAL, Enum.mark_cov_type["Individual"]))]), "medical",
+            collections.OrderedDict([(const.M_METAL_LEVEL, (const.EQUAL, silver))]))),
+        ("get_eye_insurance", lambda: Query.get_eye_insurance("Eye Glasses", "Child", 10, silver)),
+        ("get_benefit_list", Query.get_benefit_list),
+        ("get_benefit", lambda: Query.get_benefit("Specialist Visit")),
+        ("get_plan_state", Query.get_plan_state),
+        ("get_tobacco_insurance", lambda: Query.get_tobacco_insurance(True, 30)),
+    ])
+    if intervals:
+        effective_date, expiration_date = intervals[0][0], intervals[0][1]
+        queries["get_avg_rate"] = lambda: Query.get_avg_rate(silver, 30, effective_date, expiration_date, "medical")
+    plans = queries["get_plans"]()
+    if plans:
+        plan_id = collections.OrderedDict([(const.PLAN_ID, (const.EQUAL, plans[0][0]))])
+        queries["plain_query"] = lambda: Query.plain_query([const.BENEFIT_NAME], const.TABLE_BENEFIT, plan_id,
+                                                           order_by=const.BENEFIT_NAME)
+        queries["plain_query_one"] = lambda: Query.plain_query_one([const.PLAN_ID, const.PLAN_VAR_NAME],
+                                                                   const.TABLE_PLAN, plan_id)
+    return queries
+
+
+def time_queries(repeat=1):
+    """
+    Time the standard database.Query methods with representative arguments
+    :param repeat: runs of each query, the fastest one is kept
+    :return: ordered dict query -> seconds
+    """
+    from database import Query, Statements
+
+    queries = sample_queries()
+    seconds = collections.OrderedDict()
+    # One borrowed connection for every run, released (and its transaction rolled back) before CLUSTER;
+    # results are not served from the result cache, every run reaches postgres
+    with Query.session() as session, Query.uncached():
+        for name, query in queries.items():
+            for _ in range(repeat):
+                start = time.perf_counter()
+                query()
+                spent = time.perf_counter() - start
+                seconds[name] = min(seconds.get(name, spent), spent)
+        # Planning vs execution time of the prepared statements, with the arguments of their last run
+        for name in list(Statements.registry):
+            Statements.explain(session, name)
+    return seconds
+
+
+def optimize(connect, tables=constraints.DATA_TABLES, clustered=True, repeat=1):
+    """
+    Post-load stage: create extended statistics, cluster the rate tables on std_component_id and
+    vacuum analyze the loaded tables, timing the standard queries before and after
+    :param connect: function opening a new postgres connection
+    :param tables: relations touched by the load
+    :param clustered: cluster the tables having a clustering index
+    :param repeat: runs of each timed query
+    :return: N/A
+    """
+    before = time_queries(repeat)
+
+    connection = connect()
+    # VACUUM cannot run inside a transaction block
+    connection.autocommit = True
+    with connection.cursor() as cursor:
+        steps = prepare(cursor)
+        if clustered:
+            steps += cluster(cursor, tables)
+        steps += vacuum_analyze(cursor, tables)
+    connection.close()
+    print(tabulate(steps, headers=["Step", "Table", "Seconds"], tablefmt="fancy_grid"))
+
+    after = time_queries(repeat)
+    data = list()
+    for name, seconds in before.items():
+        data.append([name, "%.3f" % seconds, "%.3f" % after[name],
+                     "%.1fx" % (seconds / after[name]) if after[name] > 0 else ""])
+    print(tabulate(data, headers=["Query", "Before (s)", "After (s)", "Speedup"], tablefmt="fancy_grid"))
+
+    from database import Statements
+    print(tabulate(Statements.report(), headers=Statements.REPORT_HEADERS, tablefmt="fancy_grid"))
+
+
+if __name__ == '__main__':
+    from load_data import connect
+
+    parser = argparse.ArgumentParser(description="Refresh statistics and physical order of the loaded tables")
+    parser.add_argument("--no-cluster", action="store_true", help="skip CLUSTER of the rate tables")
+    parser.add_argument("--repeat", type=int, default=1, help="runs of each timed query, the fastest is kept")
+    options = parser.parse_args()
+    optimize(connect, clustered=not options.no_cluster, repeat=options.repeat)
@@ -0,0 +1,244 @@
+# declarative csv column -> table column mapping used by load_data.py
+import functools
+import re
+
+from psycopg2 import sql
+
+import utils
+import constants as const
+from datetime import datetime
+
+
+class MappingError(ValueError):
+    """
+    Raised when a csv value cannot be mapped to its table column.
+    """
+    pass
+
+
+class Column:
+    """
+    Table column(s) filled from one csv column.
+
+    convert takes the raw csv string and returns the column value. When
+    target is a tuple of column names, convert must return a tuple with one
+    value per column. Without convert an empty string becomes NULL.
+
+    Converters with a sql attribute can also run inside postgres (see
+    staging.py): sql(cell) takes the text expression of the csv column and
+    returns one SQL expression per target column.
+    """
+
+    def __init__(self, target, source, convert=None):
+        self.target = target if isinstance(target, tuple) else (target,)
+        self.source = source
+        self.convert = convert
+
+
+class Mapping:
+    """
+    Mapping of csv columns onto the columns of one table.
+
+    bind() compiles the mapping against a file header into a function that
+    turns a positional csv row into the tuple of column values, so no dict
+    is built and no column name is looked up per row.
+    """
+
+    def __init__(self, table, columns):
+        self.table = table
+        self.definition = columns
+        self.columns = tuple(name for column in columns for name in column.target)
+        self.build = None
+
+    def bind(self, header):
+        """
+        Compile the mapping for a csv header
+        :param header: csv header row
+        :return: self
+        """
+        index = dict((name, i) for i, name in enumerate(header))
+        namespace = dict()
+        expressions = list()
+        for k, column in enumerate(self.definition):
+            if column.source not in index:
+                raise MappingError("%s: csv column %s missing" % (self.table, column.source))
+            cell = "r[%d]" % index[column.source]
+
+            if column.convert is None:
+                expression = "(%s or None)" % cell
+            else:
+                namespace["c%d" % k] = column.convert
+                expression = "c%d(%s)" % (k, cell)
+
+            if len(column.target) > 1:
+                expression = "*" + expression
+            expressions.append(expression)
+
+        source = "def build(r):\n    return (%s,)\n" % ", ".join(expressions)
+        exec(compile(source, "<mapping %s>" % self.table, "exec"), namespace)
+        self.build = namespace["build"]
+        return self
+
+    def select(self, cell):
+        """
+        SQL expressions producing the column values, in the order of columns
+        :param cell: function csv column name -> SQL text expression of the cell
+        :return: list of SQL expressions
+        """
+        expressions = list()
+        for column in self.definition:
+            if column.convert is None:
+                expressions.append(sql.SQL("NULLIF({}, '')").format(cell(column.source)))
+            elif hasattr(column.convert, "sql"):
+                expressions += column.convert.sql(cell(column.source))
+            else:
+                raise MappingError("%s: no SQL for the conversion of %s" % (self.table, column.source))
+        return expressions
+
+
+def bind_all(header, mappings):
+    """
+    Compile every mapping of a data set against its csv header
+    :param header: csv header row
+    :param mappings: mappings filled from that file
+    :return: N/A
+    """
+    for mapping in mappings:
+        mapping.bind(header)
+
+
+# Converters
+
+INTEGER = re.compile("[0-9,]+")
+
+
+def integer(value):
+    """
+    First group of digits, thousands separators removed (same as utils.get_num_int)
+    """
+    number = INTEGER.search(value)
+    return number.group().replace(",", "") if number else None
+
+
+integer.sql = lambda cell: [sql.SQL("replace(substring({} from '[0-9,]+'), ',', '')").format(cell)]
+
+
+def flag(true_value='Yes'):
+    def convert(value):
+        return value == true_value
+    convert.sql = lambda cell: [sql.SQL("({} = {})").format(cell, sql.Literal(true_value))]
+    return convert
+
+
+def enum(types, required=False):
+    """
+    Enumeration lookup, e.g. Enum.plan_type
+    :param types: value to id map
+    :param required: raise MappingError for unknown values instead of storing NULL
+    """
+    def convert(value):
+        type_id = types.get(value)
+        if type_id is None and required:
+            raise MappingError("unknown enumeration value %r" % value)
+        return type_id
+    if not required:
+        convert.sql = lambda cell: [case(cell, types)]
+    return convert
+
+
+def case(cell, values):
+    """
+    SQL CASE looking a cell up in a python dict, NULL when missing
+    """
+    if not values:
+        return sql.SQL("NULL")
+    return sql.SQL("CASE {} {} END").format(cell, sql.SQL(" ").join(
+        sql.SQL("WHEN {} THEN {}").format(sql.Literal(key), sql.Literal(value)) for key, value in values.items()))
+
+
+def timestamp(csv_format, db_format="%Y-%m-%d %H:%M:%S"):
+    def convert(value):
+        if value:
+            return datetime.strptime(value, csv_format).strftime(db_format)
+        return None
+    return convert
+
+
+def percent(value):
+    if value:
+        return value.rstrip("%")
+    return None
+
+
+def not_applicable(value):
+    if value and value != 'Not Applicable':
+        return value
+    return None
+
+
+not_applicable.sql = lambda cell: [sql.SQL("NULLIF(NULLIF({}, ''), 'Not Applicable')").format(cell)]
+
+
+def age_range(value):
+    if value:
+        return utils.get_age_pair(value)
+    return None, None
+
+
+# Bounds of utils.get_age_pair, any other value is a single age
+AGE_RANGES = {'0-14': (0, 14), '64 and over': (64, 100)}
+
+age_range.sql = lambda cell: [
+    sql.SQL("CASE {0} WHEN '' THEN NULL {1} ELSE {0} END").format(cell, sql.SQL(" ").join(
+        sql.SQL("WHEN {} THEN {}").format(sql.Literal(name), sql.Literal(str(bounds[i])))
+        for name, bounds in AGE_RANGES.items()))
+    for i in range(2)]
+
+
+class CostShareParser:
+    """
+    Memoized copay/coinsurance cell parser.
+
+    Turns a cell such as "$30.00 Copay after deductible" into
+    (amount, type id) using precompiled patterns. Benefit files repeat a few
+    hundred distinct cells millions of times, so results are kept in a
+    bounded LRU table; hits/misses are available through stats().
+    """
+
+    AMOUNT = re.compile("[0-9.,]+")
+    DESC = re.compile("[a-zA-Z ]+")
+
+    def __init__(self, types, default, max_size=const.COST_SHARE_CACHE_SIZE):
+        """
+        :param types: Enum.copay_type or Enum.coins_type
+        :param default: type name of a bare amount ("Copay"/"Coinsurance")
+        :param max_size: maximum number of memoized cells
+        """
+        self.types = types
+        self.default = default
+        self.lookup = functools.lru_cache(maxsize=max_size)(self.parse)
+
+    def __call__(self, value):
+        return self.lookup(value)
+
+    def parse(self, value):
+        if not value:
+            return None, self.types["Not Applicable"]
+
+        amount = self.AMOUNT.search(value)
+        amount = amount.group().replace(",", "") if amount else 0
+        desc = self.DESC.search(value)
+        desc = desc.group().strip() if desc else None
+
+        if not desc:
+            return amount, self.types[self.default]
+        if desc == 'Not Applicable':
+            return None, self.types[desc]
+        return amount, self.types[desc]
+
+    def stats(self):
+        """
+        :return: (hits, misses, current size)
+        """
+        info = self.lookup.cache_info()
+        return info.hits, info.misses, info.currsize
@@ -0,0 +1,100 @@
+# dependency aware parallel execution of load stages
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from tabulate import tabulate
+
+TIMELINE_WIDTH = 40
+
+
+def timed(execute, stage):
+    """
+    Run a stage in a worker process
+    :return: (start, end, records)
+    """
+    start = time.time()
+    records = execute(stage)
+    return start, time.time(), records
+
+
+def run(dependencies, execute, workers=None):
+    """
+    Run stages in parallel, each stage starting once its prerequisites are done.
+
+    A failed stage does not stop independent stages; stages depending on it
+    are skipped.
+    :param dependencies: ordered dict stage name -> list of prerequisite stage names
+    :param execute: module level function(stage name) -> records loaded, run in a worker process
+    :param workers: maximum number of stages running at the same time
+    :return: True when every stage succeeded
+    """
+    pending = dict(dependencies)
+    running = dict()
+    results = dict()
+    failed = dict()
+    origin = time.time()
+
+    with ProcessPoolExecutor(max_workers=workers or len(dependencies)) as pool:
+        while pending or running:
+            for stage in list(pending):
+                requires = pending[stage]
+                if any(required in failed for required in requires):
+                    failed[stage] = "skipped, %s failed" % ",".join(r for r in requires if r in failed)
+                    del pending[stage]
+                elif all(required in results for required in requires):
+                    print("[%7.1fs] start %s" % (time.time() - origin, stage))
+                    running[pool.submit(timed, execute, stage)] = stage
+                    del pending[stage]
+
+            if not running:
+                # Left over stages wait for stages that are not part of the run
+                for stage in pending:
+                    failed[stage] = "skipped, unknown prerequisite"
+                pending.clear()
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage = running.pop(future)
+                try:
+                    results[stage] = future.result()
+                    print("[%7.1fs] done  %s" % (time.time() - origin, stage))
+                except Exception as e:
+                    failed[stage] = "failed: %s" % e
+                    print("[%7.1fs] FAIL  %s: %s" % (time.time() - origin, stage, e))
+
+    timeline(dependencies, results, failed, origin)
+    return not failed
+
+
+def timeline(dependencies, results, failed, origin):
+    """
+    Print start/end/throughput per stage and the critical path of the run
+    """
+    total = max([end for _, end, _ in results.values()] + [origin]) - origin
+    scale = TIMELINE_WIDTH / total if total > 0 else 0
+
+    data = list()
+    for stage in dependencies:
+        if stage in results:
+            start, end, records = results[stage]
+            seconds = end - start
+            offset = int((start - origin) * scale)
+            bar = " " * offset + "#" * max(1, int(seconds * scale))
+            data.append([stage, "%.1f" % (start - origin), "%.1f" % (end - origin), "%.1f" % seconds, records,
+                         "%.0f" % (records / seconds if seconds > 0 else 0), bar])
+        else:
+            data.append([stage, "", "", "", "", "", failed.get(stage, "")])
+    print(tabulate(data, headers=["Stage", "Start (s)", "End (s)", "Seconds", "Records", "Records/s", "Timeline"],
+                   tablefmt="fancy_grid"))
+
+    # Critical path: walk back from the last stage to finish through the prerequisite finishing last
+    path = list()
+    candidates = [stage for stage in dependencies if stage in results]
+    while candidates:
+        stage = max(candidates, key=lambda name: results[name][1])
+        path.insert(0, stage)
+        candidates = [required for required in dependencies[stage] if required in results]
+    if path:
+        print("Critical path: %s (%.1fs of %.1fs)" % (" -> ".join(path), results[path[-1]][1] - results[path[0]][0],
+                                                      total))
@@ -0,0 +1,233 @@
+# yearly range partitions of the rate tables: loaded detached, attached in one transaction, dropped whole
+import argparse
+import collections
+import re
+import time
+
+from psycopg2 import sql
+from tabulate import tabulate
+
+import constants as const
+import result_cache
+
+# Partitioned relation -> partition key, one partition per plan year; see schema.sql
+KEYS = collections.OrderedDict([
+    (const.TABLE_RATE_INDIVIDUAL, const.RATE_EFF_DATE),
+    (const.TABLE_RATE_FAMILY, const.RATE_FAM_EFF_DATE),
+])
+
+# Suffix of the detached table a load writes into
+LOAD_SUFFIX = "_load"
+
+PARTITIONS = """
+SELECT c.relname::text, pg_get_expr(c.relpartbound, c.oid), c.reltuples::BIGINT, pg_total_relation_size(c.oid)
+FROM pg_inherits i
+         JOIN pg_class c ON c.oid = i.inhrelid
+WHERE i.inhparent = %s::regclass
+ORDER BY c.relname
+"""
+
+LOWER_BOUND = re.compile(r"FROM \('(\d{4})-01-01'\)")
+
+
+def partition_name(table, year):
+    return "%s_%d" % (table, year)
+
+
+def load_table(table):
+    return table + LOAD_SUFFIX
+
+
+def load_tables():
+    """
+    :return: partitioned table -> detached table written instead, for delta.RedirectWriter
+    """
+    return dict((table, load_table(table)) for table in KEYS)
+
+
+def bounds(year):
+    """
+    :return: first day of the plan year and of the next one, the range of its partition
+    """
+    return "%d-01-01" % year, "%d-01-01" % (year + 1)
+
+
+def in_year(column, year):
+    lower, upper = bounds(year)
+    return sql.SQL("{} >= {} AND {} < {}").format(sql.Identifier(column), sql.Literal(lower),
+                                                  sql.Identifier(column), sql.Literal(upper))
+
+
+def prepare(cursor, tables=KEYS):
+    """
+    Create empty detached copies of the partitioned tables, without keys or indexes; a load writes into them
+    :param cursor: postgres cursor
+    :param tables: partitioned relations
+    :return: N/A
+    """
+    for table in tables:
+        cursor.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(load_table(table))))
+        cursor.execute(sql.SQL("CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS)").format(
+            sql.Identifier(load_table(table)), sql.Identifier(table)))
+
+
+def years(cursor, table, column):
+    """
+    :param cursor: postgres cursor
+    :param table: relation holding rows of a partitioned table
+    :param column: partition key
+    :return: ordered dict plan year -> rows
+    """
+    cursor.execute(sql.SQL("SELECT CAST(date_part('year', {}) AS INT) AS year, count(*) FROM {} "
+                           "GROUP BY year ORDER BY year").format(sql.Identifier(column), sql.Identifier(table)))
+    return collections.OrderedDict(cursor.fetchall())
+
+
+def partitions(cursor, table):
+    """
+    :param cursor: postgres cursor
+    :param table: partitioned relation
+    :return: ordered dict plan year -> (partition, estimated rows, bytes) of its yearly partitions
+    """
+    cursor.execute(PARTITIONS, (table,))
+    found = collections.OrderedDict()
+    for name, bound, rows, size in cursor.fetchall():
+        match = LOWER_BOUND.search(bound)
+        if match is not None:
+            found[int(match.group(1))] = (name, rows, size)
+    return found
+
+
+def create(cursor, table, year):
+    """
+    Create the empty partition of a plan year
+    """
+    lower, upper = bounds(year)
+    cursor.execute(sql.SQL("CREATE TABLE {} PARTITION OF {} FOR VALUES FROM ({}) TO ({})").format(
+        sql.Identifier(partition_name(table, year)), sql.Identifier(table), sql.Literal(lower), sql.Literal(upper)))
+
+
+def ensure(cursor, table, plan_years):
+    """
+    Create the missing partitions of plan years, e.g. before merging rows into the partitioned table
+    :param cursor: postgres cursor
+    :param table: partitioned relation
+    :param plan_years: years the rows belong to
+    :return: N/A
+    """
+    attached = partitions(cursor, table)
+    for year in plan_years:
+        if year not in attached:
+            create(cursor, table, year)
+
+
+def attach(cursor, tables=KEYS, replace=False):
+    """
+    Move the rows of the detached load tables into the yearly partitions.
+
+    A load table holding a single plan year becomes its partition: a CHECK
+    constraint on the year bounds lets ATTACH PARTITION skip its validation
+    scan, the keys and indexes of the partitioned table are then built on
+    it. Several years are split into one new table each first. Rows of a
+    year already attached are appended to its partition, unless replace
+    is set. Runs in the caller's transaction, queries see a whole year or
+    nothing of it.
+    :param cursor: postgres cursor
+    :param tables: partitioned relations
+    :param replace: swap the attached partitions of the loaded years for the loaded rows
+    :return: report steps
+    """
+    steps = list()
+    for table in tables:
+        column = KEYS[table]
+        source = load_table(table)
+        loaded = years(cursor, source, column)
+        attached = partitions(cursor, table)
+        for year, rows in loaded.items():
+            name = partition_name(table, year)
+            select = sql.SQL("SELECT * FROM {} WHERE ").format(sql.Identifier(source)) + in_year(column, year)
+            if year in attached and not replace:
+                steps.append(run(cursor, table, year, "append", rows, sql.SQL("INSERT INTO {} ").format(
+                    sql.Identifier(attached[year][0])) + select))
+                continue
+            if year in attached:
+                steps.append(run(cursor, table, year, "drop", attached[year][1],
+                                 detach_statement(table, attached[year][0])))
+
+            if len(loaded) == 1:
+                cursor.execute(sql.SQL("ALTER TABLE {} RENAME TO {}").format(sql.Identifier(source),
+                                                                            sql.Identifier(name)))
+            else:
+                cursor.execute(sql.SQL("CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS)").format(
+                    sql.Identifier(name), sql.Identifier(table)))
+                steps.append(run(cursor, table, year, "split", rows, sql.SQL("INSERT INTO {} ").format(
+                    sql.Identifier(name)) + select))
+
+            check = sql.Identifier(name + "_bounds")
+            lower, upper = bounds(year)
+            cursor.execute(sql.SQL("ALTER TABLE {} ADD CONSTRAINT {} CHECK ({} IS NOT NULL AND {})").format(
+                sql.Identifier(name), check, sql.Identifier(column), in_year(column, year)))
+            steps.append(run(cursor, table, year, "attach", rows, sql.SQL(
+                "ALTER TABLE {} ATTACH PARTITION {} FOR VALUES FROM ({}) TO ({})").format(
+                sql.Identifier(table), sql.Identifier(name), sql.Literal(lower), sql.Literal(upper))))
+            cursor.execute(sql.SQL("ALTER TABLE {} DROP CONSTRAINT {}").format(sql.Identifier(name), check))
+        cursor.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(source)))
+    return steps
+
+
+def detach_statement(table, name):
+    return sql.SQL("ALTER TABLE {} DETACH PARTITION {}; DROP TABLE {}").format(
+        sql.Identifier(table), sql.Identifier(name), sql.Identifier(name))
+
+
+def drop(cursor, year, tables=KEYS):
+    """
+    Drop a plan year: its partitions are detached and dropped, no row is deleted one by one
+    :param cursor: postgres cursor
+    :param year: plan year
+    :param tables: partitioned relations
+    :return: report steps
+    """
+    steps = list()
+    for table in tables:
+        attached = partitions(cursor, table)
+        if year in attached:
+            steps.append(run(cursor, table, year, "drop", attached[year][1],
+                             detach_statement(table, attached[year][0])))
+    return steps
+
+
+def run(cursor, table, year, step, rows, statement):
+    start = time.perf_counter()
+    cursor.execute(statement)
+    return [table, year, step, rows, "%.2f" % (time.perf_counter() - start)]
+
+
+def report(steps):
+    if steps:
+        print(tabulate(steps, headers=["Table", "Year", "Step", "Rows", "Seconds"], tablefmt="fancy_grid"))
+
+
+if __name__ == '__main__':
+    from load_data import connect
+
+    parser = argparse.ArgumentParser(description="List or drop the plan year partitions of the rate tables")
+    parser.add_argument("--drop-year", type=int, action="append", default=list(),
+                        help="plan year whose partitions are dropped, may be repeated")
+    options = parser.parse_args()
+
+    connection = connect()
+    with connection.cursor() as cursor:
+        done = list()
+        for drop_year in options.drop_year:
+            done += drop(cursor, drop_year)
+        if done:
+            # Cached Query results may hold rows of the dropped years
+            print("Dataset version %d" % result_cache.bump(cursor))
+        connection.commit()
+        report(done)
+
+        data = [[table, year, name, rows, "%.1f MB" % (size / (1 << 20))]
+                for table in KEYS for year, (name, rows, size) in partitions(cursor, table).items()]
+    connection.close()
+    print(tabulate(data, headers=["Table", "Year", "Partition", "Rows (estimate)", "Size"], tablefmt="fancy_grid"))
@@ -0,0 +1,180 @@
+# thread-safe postgres connection pool with health checks, used by database.Query
+import collections
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+
+import constants as const
+
+
+class PoolError(Exception):
+    """
+    Raised when no connection frees up within the pool timeout, or the pool is closed.
+    """
+    pass
+
+
+class ConnectionPool:
+    """
+    Bounded set of postgres connections shared by threads.
+
+    acquire() hands out an idle connection, opens a new one while fewer
+    than max_size exist, or waits up to timeout for one to be released.
+    min_size connections are opened up front and kept when idle. A
+    connection idle for longer than check_interval is pinged before it is
+    handed out; a dead one is replaced. release() rolls back whatever the
+    borrower left open, so no transaction (and none of its locks) outlives a
+    borrow, and drops connections that are closed or broken.
+    """
+
+    def __init__(self, connect, min_size=const.POOL_MIN_SIZE, max_size=const.POOL_MAX_SIZE,
+                 timeout=const.POOL_TIMEOUT, check_interval=const.POOL_CHECK_INTERVAL):
+        """
+        :param connect: function opening a new postgres connection
+        :param min_size: connections opened up front and kept open
+        :param max_size: connections open at most, borrowed or idle
+        :param timeout: seconds acquire() waits for a connection
+        :param check_interval: seconds of idleness after which a connection is pinged before use
+        """
+        if not 0 <= min_size <= max_size or max_size < 1:
+            raise ValueError("Pool sizes must satisfy 0 <= min_size <= max_size, max_size >= 1")
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check_interval = check_interval
+        # (connection, time it was released), most recently released last
+        self.idle = collections.deque()
+        self.size = 0
+        self.closed = False
+        self.condition = threading.Condition()
+        self.stats = collections.Counter()
+        for _ in range(min_size):
+            self.idle.append((self.open(), time.monotonic()))
+            self.size += 1
+
+    def open(self):
+        connection = self.connect()
+        with self.condition:
+            self.stats["opened"] += 1
+        return connection
+
+    def acquire(self):
+        """
+        Borrow a connection, give it back with release(). Connections are
+        opened and pinged outside the lock, in a slot reserved for them, so
+        a slow server does not hold up the threads borrowing idle ones
+        :return: postgres connection
+        """
+        deadline = time.monotonic() + self.timeout
+        while True:
+            connection, released = self.reserve(deadline)
+            if connection is None:
+                try:
+                    connection = self.open()
+                except Exception:
+                    self.free_slot()
+                    raise
+            elif not self.healthy(connection, released):
+                with self.condition:
+                    self.discard(connection)
+                    self.condition.notify()
+                continue
+            with self.condition:
+                self.stats["borrowed"] += 1
+            return connection
+
+    def reserve(self, deadline):
+        """
+        Take an idle connection, or the slot of a new one while fewer than max_size are open
+        :param deadline: time.monotonic() to wait until
+        :return: (idle connection, time it was released), (None, None) for a new slot
+        """
+        with self.condition:
+            while True:
+                if self.closed:
+                    raise PoolError("Connection pool is closed")
+                if self.idle:
+                    return self.idle.pop()
+                if self.size < self.max_size:
+                    self.size += 1
+                    return None, None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolError("No connection released within %.1f s (%d open)" % (self.timeout, self.size))
+                self.stats["waits"] += 1
+                self.condition.wait(remaining)
+
+    def free_slot(self):
+        # The connection of a reserved slot could not be opened
+        with self.condition:
+            self.size -= 1
+            self.condition.notify()
+
+    def release(self, connection, discard=False):
+        """
+        Give a borrowed connection back
+        :param connection: connection from acquire()
+        :param discard: close it instead of keeping it, e.g. after a connection error
+        :return: N/A
+        """
+        # Still owned by the caller, rolled back outside the lock
+        if not discard and not connection.closed:
+            try:
+                if connection.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    connection.rollback()
+            except psycopg2.Error:
+                discard = True
+        with self.condition:
+            if discard or connection.closed or self.closed:
+                self.discard(connection)
+            else:
+                self.idle.append((connection, time.monotonic()))
+            self.condition.notify()
+
+    def healthy(self, connection, released):
+        """
+        :return: the idle connection can be handed out; pinged when idle for longer than check_interval
+        """
+        if connection.closed:
+            return False
+        if time.monotonic() - released < self.check_interval:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            connection.rollback()
+            healthy = True
+        except psycopg2.Error:
+            healthy = False
+        with self.condition:
+            self.stats["checks"] += 1
+            if not healthy:
+                self.stats["failed checks"] += 1
+        return healthy
+
+    def discard(self, connection):
+        self.size -= 1
+        self.stats["discarded"] += 1
+        if not connection.closed:
+            connection.close()
+
+    def close(self):
+        """
+        Close the idle connections; borrowed ones are closed when released
+        :return: N/A
+        """
+        with self.condition:
+            self.closed = True
+            while self.idle:
+                self.discard(self.idle.pop()[0])
+            self.condition.notify_all()
+
+    def report(self):
+        """
+        :return: [[counter, value]] of the pool usage, for tabulate
+        """
+        with self.condition:
+            return [["open", self.size], ["idle", len(self.idle)]] + sorted(self.stats.items())
@@ -0,0 +1,81 @@
+# per stage timers and cProfile runs of the loader
+import cProfile
+import io
+import pstats
+import time
+
+from tabulate import tabulate
+
+import constants as const
+
+
+class StageTimers:
+    """
+    Seconds spent in each loader stage while loading one data set.
+
+    read: csv decoding and record filtering (reader.CsvStream), parse: the
+    mapping converters (utils regexes, Enum lookups), write: tuple and
+    document writers, including commits. transform is the rest of the wall
+    time: the add_* logic of the loader loops.
+    """
+
+    def __init__(self):
+        self.read = 0.0
+        self.parse = 0.0
+        self.write = 0.0
+        self.start = time.perf_counter()
+
+    def rows(self, rows):
+        """
+        Iterate records, adding the time spent fetching each one to read
+        :param rows: iterable of csv records
+        :return: generator of the same records
+        """
+        clock = time.perf_counter
+        iterator = iter(rows)
+        while True:
+            began = clock()
+            write = self.write
+            row = next(iterator, None)
+            # Checkpoints committed between two records are write time
+            self.read += clock() - began - (self.write - write)
+            if row is None:
+                return
+            yield row
+
+    def report(self, dataset, records):
+        """
+        Print the share of each stage
+        :param dataset: data set name
+        :param records: csv records read
+        :return: N/A
+        """
+        wall = time.perf_counter() - self.start
+        transform = max(wall - self.read - self.parse - self.write, 0.0)
+        data = list()
+        for stage, seconds in (("read", self.read), ("parse", self.parse), ("transform", transform),
+                               ("write", self.write), ("total", wall)):
+            share = seconds * 100 / wall if wall > 0 else 0
+            per_record = seconds * 1e6 / records if records else 0
+            data.append([stage, "%.2f" % seconds, "%.1f%%" % share, "%.1f" % per_record])
+        print("Stages of %s, %d records" % (dataset, records))
+        print(tabulate(data, headers=["Stage", "Seconds", "Share", "us/record"], tablefmt="fancy_grid"))
+
+
+def profiled(function, path, top=const.PROFILE_TOP):
+    """
+    Run a function under cProfile, save the statistics and print the most expensive functions
+    :param function: function called without arguments
+    :param path: file receiving the statistics (python3 -m pstats <path>, snakeviz, ...)
+    :param top: number of functions printed, by cumulative time
+    :return: result of function
+    """
+    profile = cProfile.Profile()
+    try:
+        return profile.runcall(function)
+    finally:
+        profile.dump_stats(path)
+        out = io.StringIO()
+        pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(top)
+        print(out.getvalue())
+        print("Profile saved to %s" % path)
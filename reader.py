@@ -0,0 +1,162 @@
+# streaming csv reading used by load_data.py
+import csv
+import time
+
+import archive
+import constants as const
+
+
+class Progress:
+    """
+    Loading progress derived from the byte offset reached in the source file.
+
+    Output is throttled to one line per interval seconds so that terminal
+    writes do not slow the load down.
+    """
+
+    CHECK_EVERY = 256
+
+    def __init__(self, total_bytes, interval=const.PROGRESS_INTERVAL):
+        self.total = total_bytes
+        self.interval = interval
+        self.start = time.monotonic()
+        self.last = self.start
+
+    def update(self, offset, rows):
+        # Only look at the clock every CHECK_EVERY rows
+        if rows % self.CHECK_EVERY:
+            return
+        now = time.monotonic()
+        if now - self.last >= self.interval:
+            self.last = now
+            self.show(offset, rows, now)
+
+    def finish(self, offset, rows):
+        self.show(offset, rows, time.monotonic())
+
+    def show(self, offset, rows, now):
+        elapsed = now - self.start
+        if self.total is None:
+            # Compressed input of unknown size
+            rate = rows / elapsed if elapsed > 0 else 0
+            print('\rLoading Process: {} rows | {:.0f} rows/s'.format(rows, rate), end='')
+            return
+        percent = offset * 100 / self.total if self.total else 100
+        rate = rows / elapsed if elapsed > 0 else 0
+        if 0 < offset < self.total:
+            eta = elapsed * (self.total - offset) / offset
+        else:
+            eta = 0
+        print('\rLoading Process:{:.2f}% | {} rows | {:.0f} rows/s | ETA {}'.format(
+            percent, rows, rate, format_seconds(eta)), end='')
+
+
+class CsvStream:
+    """
+    Single pass CSV reader.
+
+    The file is read once, line by line in binary mode, so the exact byte
+    offset of the last complete record is always known. Iterating yields one
+    positional row (list) per record and reports progress as it goes; use
+    header/index to locate columns.
+
+    start/end restrict reading to a byte range of the file (see shard.py);
+    both must be record boundaries. The header is always read from the top.
+    Compressed files (see archive.py) are decoded while reading, offsets
+    then count decompressed bytes and start is reached by skipping.
+
+    every() registers a callback run after each chunk of records, once the
+    loader is done with the last record of the chunk; offset then is the
+    end of that record (see checkpoint.py).
+    """
+
+    def __init__(self, path, encoding=const.CSV_ENCODING, interval=const.PROGRESS_INTERVAL, start=None, end=None):
+        """
+        :param path: csv file, or .gz/.zst/.zip compressed csv file
+        :param encoding: file encoding
+        :param interval: seconds between progress lines, None to stay silent
+        :param start: first byte to read after the header
+        :param end: byte offset to stop at
+        """
+        self.path = path
+        self.encoding = encoding
+        self.interval = interval
+        self.fd = archive.open_source(path)
+        self.size = archive.source_size(path)
+        self.end = self.size if end is None else end
+        self.offset = 0
+        self.rows = 0
+        self.line_count = 0
+        self.chunk = None
+        self.on_chunk = None
+        self.reader = csv.reader(self.lines())
+        self.header = next(self.reader)
+        self.index = dict((name, i) for i, name in enumerate(self.header))
+
+        if start is not None and start > self.offset:
+            if archive.is_compressed(path):
+                while self.offset < start:
+                    skipped = len(self.fd.read(min(start - self.offset, const.DECOMPRESS_BLOCK)))
+                    if not skipped:
+                        break
+                    self.offset += skipped
+            else:
+                self.fd.seek(start)
+                self.offset = start
+        self.line_count = 0
+        self.start = self.offset
+        self.total = self.end - self.start if self.end is not None else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def every(self, rows, callback):
+        """
+        :param rows: records per chunk
+        :param callback: function called without arguments after each chunk
+        :return: N/A
+        """
+        self.chunk = rows
+        self.on_chunk = callback
+
+    def __iter__(self):
+        if self.interval is None and self.chunk is None:
+            for record in self.reader:
+                yield record
+                self.rows += 1
+            return
+
+        progress = Progress(self.total, self.interval) if self.interval is not None else None
+        chunk = self.chunk
+        for record in self.reader:
+            yield record
+            self.rows += 1
+            if chunk and self.rows % chunk == 0:
+                self.on_chunk()
+            if progress:
+                progress.update(self.offset - self.start, self.rows)
+        if progress:
+            progress.finish(self.offset - self.start, self.rows)
+
+    def lines(self):
+        readline = self.fd.readline
+        end = self.end if self.end is not None else float("inf")
+        while self.offset < end:
+            line = readline()
+            if not line:
+                return
+            self.offset += len(line)
+            self.line_count += 1
+            yield line.decode(self.encoding)
+
+    def close(self):
+        self.fd.close()
+
+
+def format_seconds(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return '{:d}:{:02d}:{:02d}'.format(hours, minutes, seconds)
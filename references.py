@@ -0,0 +1,71 @@
+# client side foreign key checks of the benefits load: rows without a parent are quarantined, not written
+import collections
+import json
+
+from psycopg2 import sql
+
+import constants as const
+
+# Child table -> foreign key checked before writing its rows; see schema.sql
+FOREIGN_KEYS = {
+    const.TABLE_BENEFIT: "plan_benefit_plan_id_fkey",
+    const.TABLE_BENEFIT_LIMIT: "plan_benefit_limitation_plan_id_benefit_name_fkey",
+}
+
+VIOLATION_COLUMNS = ("table_name", "constraint_name", "reason", "row_data")
+
+# Reason recorded by constraints.build for the orphans it finds
+REASON = "orphan"
+
+
+class Parents:
+    """
+    Keys the rows of the benefits load reference, checked in memory.
+
+    A benefit row must find its plan id among the loaded plans, read once
+    from postgres when the load starts. A limitation comes from the same
+    csv record as the benefit it references and is written right after it,
+    so the plan id check covers it too: the limitation of a benefit without
+    a plan is quarantined with it.
+
+    Rows without a parent go to load_violations through the writer of the
+    load, in the transaction of their checkpoint, instead of aborting it
+    with a foreign key violation.
+    """
+
+    def __init__(self, writer):
+        """
+        :param writer: writer of the load, quarantined rows are written to load_violations with it
+        """
+        self.writer = writer
+        self.plans = set()
+        self.orphans = collections.Counter()
+
+    def load(self, cursor):
+        """
+        Read the plan ids of the plans table
+        :param cursor: postgres cursor
+        :return: N/A
+        """
+        cursor.execute(sql.SQL("SELECT {} FROM {}").format(sql.Identifier(const.PLAN_ID),
+                                                           sql.Identifier(const.TABLE_PLAN)))
+        self.plans = set(plan_id for plan_id, in cursor)
+
+    def has_plan(self, plan_id):
+        return plan_id in self.plans
+
+    def quarantine(self, table_mapping, row):
+        """
+        Keep a row without a parent in load_violations
+        :param table_mapping: mapping.Mapping of the child table, bound to the csv header
+        :param row: positional csv row
+        :return: N/A
+        """
+        table = table_mapping.table
+        data = json.dumps(dict(zip(table_mapping.columns, table_mapping.build(row))), default=str)
+        self.writer.write(const.TABLE_LOAD_VIOLATION, VIOLATION_COLUMNS, (table, FOREIGN_KEYS[table], REASON, data))
+        self.orphans[table] += 1
+
+    def report(self):
+        for table, count in self.orphans.items():
+            print("%d %s rows without a parent moved to %s" % (count, table, const.TABLE_LOAD_VIOLATION))
@@ -0,0 +1,234 @@
+# cache of Query results, invalidated by the data set version the loader bumps
+import collections
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+
+from psycopg2 import sql
+
+import constants as const
+
+
+def bump(cursor):
+    """
+    Mark the data as changed, run by every load once its data is committed
+    :param cursor: postgres cursor, committed by the caller
+    :return: new version
+    """
+    cursor.execute(sql.SQL("UPDATE {} SET version = version + 1, loaded_at = now() RETURNING version").format(
+        sql.Identifier(const.TABLE_LOAD_VERSION)))
+    return cursor.fetchone()[0]
+
+
+def version_query():
+    return sql.SQL("SELECT version FROM {}").format(sql.Identifier(const.TABLE_LOAD_VERSION))
+
+
+def version_table_query():
+    # NULL when the table is missing, without the error that would abort the transaction of the caller
+    return sql.SQL("SELECT to_regclass({})").format(sql.Literal(const.TABLE_LOAD_VERSION))
+
+
+class MemoryStore:
+    """
+    In-process LRU store of pickled results, bounded by entries and bytes.
+    """
+
+    def __init__(self, max_entries=const.RESULT_CACHE_ENTRIES, max_bytes=const.RESULT_CACHE_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # key -> (expires, pickled result)
+        self.entries = collections.OrderedDict()
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        :return: (expires, pickled result), None when missing
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, expires, data):
+        if len(data) > self.max_bytes:
+            return
+        with self.lock:
+            self.remove(key)
+            self.entries[key] = (expires, data)
+            self.bytes += len(data)
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                self.remove(next(iter(self.entries)))
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= len(entry[1])
+
+    def clear(self, version=None):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+
+class DiskStore:
+    """
+    Store shared by the processes of one host: one pickle file per result,
+    named after the data set version and a digest of the key. Files are
+    written to a temporary name and renamed, so readers never see half a
+    file. Expired files are deleted when read; every write sweeps the
+    oldest files out of the directory beyond max_entries or max_bytes.
+    """
+
+    def __init__(self, directory, max_entries=const.RESULT_CACHE_ENTRIES, max_bytes=const.RESULT_CACHE_BYTES):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        version = key[0]
+        return os.path.join(self.directory, "%d-%s.pickle" % (version, hashlib.sha256(repr(key).encode()).hexdigest()))
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, "rb") as fd:
+                entry = pickle.load(fd)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if entry[0] <= time.time():
+            self.remove(path)
+            return None
+        return entry
+
+    def put(self, key, expires, data):
+        if len(data) > self.max_bytes:
+            return
+        fd, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as out:
+            pickle.dump((expires, data), out, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, self.path(key))
+        self.sweep()
+
+    def sweep(self):
+        """
+        Delete the oldest files until the directory is within max_entries and max_bytes
+        """
+        files = list()
+        for name in os.listdir(self.directory):
+            if name.endswith(".pickle"):
+                path = os.path.join(self.directory, name)
+                try:
+                    status = os.stat(path)
+                except OSError:
+                    continue
+                files.append((status.st_mtime, status.st_size, path))
+        count = len(files)
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            self.remove(path)
+            count -= 1
+            total -= size
+
+    @staticmethod
+    def remove(path):
+        # Another process may have removed or replaced it already
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def clear(self, version=None):
+        """
+        Delete the files of other data set versions, every file when version is None
+        """
+        prefix = None if version is None else "%d-" % version
+        for name in os.listdir(self.directory):
+            if name.endswith(".pickle") and (prefix is None or not name.startswith(prefix)):
+                self.remove(os.path.join(self.directory, name))
+
+
+class ResultCache:
+    """
+    Results of Query methods by method and arguments.
+
+    Keys start with the data set version stamped by the last load
+    (load_version, see bump()). The stamp is read again at most every
+    version_check seconds; once it moves, results of the old version are
+    never served and the store is cleared. Results also expire after ttl
+    seconds. Results are kept pickled, every hit gets its own copy.
+    """
+
+    def __init__(self, store, read_version, ttl=const.RESULT_CACHE_TTL,
+                 version_check=const.RESULT_CACHE_VERSION_CHECK):
+        """
+        :param store: MemoryStore or DiskStore
+        :param read_version: function returning the current data set version, None when it cannot be read
+        :param ttl: seconds a result is served
+        :param version_check: seconds the version read last is trusted
+        """
+        self.store = store
+        self.read_version = read_version
+        self.ttl = ttl
+        self.version_check = version_check
+        self.version = None
+        self.checked = 0.0
+        self.lock = threading.Lock()
+        self.stats = collections.Counter()
+
+    def current_version(self):
+        with self.lock:
+            if self.version is not None and time.monotonic() - self.checked < self.version_check:
+                return self.version
+        version = self.read_version()
+        with self.lock:
+            if version != self.version:
+                if self.version is not None and version is not None:
+                    self.stats["invalidations"] += 1
+                    self.store.clear(version)
+                self.version = version
+            self.checked = time.monotonic()
+        return version
+
+    def get(self, method, arguments, call):
+        """
+        :param method: method name
+        :param arguments: hashable, repr-stable arguments of the call
+        :param call: function computing the result on a miss
+        :return: result
+        """
+        version = self.current_version()
+        if version is None:
+            # No stamp to trust, e.g. a database created before load_version
+            self.stats["uncached"] += 1
+            return call()
+        key = (version, method, arguments)
+        entry = self.store.get(key)
+        now = time.time()
+        if entry is not None and entry[0] > now:
+            self.stats["hits"] += 1
+            return pickle.loads(entry[1])
+        self.stats["misses"] += 1
+        result = call()
+        self.store.put(key, now + self.ttl, pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+        return result
+
+    def clear(self):
+        self.store.clear()
+        with self.lock:
+            self.version = None
+
+    def report(self):
+        """
+        :return: [[counter, value]] of the cache usage, for tabulate
+        """
+        with self.lock:
+            return [["version", self.version]] + sorted(self.stats.items())
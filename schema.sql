@@ -507,6 +507,8 @@ ALTER TABLE plan_benefit_limitation
 
 /* -------------------------Rate Data Set--------------------------- */
 
+-- Rate tables are partitioned by plan year, one partition <table>_<year> per year, e.g. rate_individual_2020.
+-- The loader writes a year into a detached table and attaches it (partitions.py).
 CREATE TABLE rate_individual
 (
     effective_date          DATE,
@@ -519,7 +521,7 @@ CREATE TABLE rate_individual
     individual_rate         DECIMAL(6, 2),
     individual_tobacco_rate DECIMAL(6, 2),
     PRIMARY KEY (effective_date, expiration_date, std_component_id, rating_area_id, age_range_from, age_range_to)
-);
+) PARTITION BY RANGE (effective_date);
 
 ALTER TABLE rate_individual
     OWNER TO manager;
@@ -534,7 +536,7 @@ CREATE TABLE rate_family
     family_type      INT,
     family_rate      NUMERIC(6, 2),
     PRIMARY KEY (effective_date, expiration_date, std_component_id, rating_area_id, family_type)
-);
+) PARTITION BY RANGE (effective_date);
 
 ALTER TABLE rate_family
     OWNER TO manager;
@@ -569,6 +571,120 @@ CREATE TABLE business_rules_cohabitation
 ALTER TABLE business_rules_cohabitation
     OWNER TO manager;
 
+/* -------------------------Access Paths and Statistics--------------------------- */
+-- Indexes of the database.Query access paths, kept in step with indexes.py (python3 indexes.py migrates
+-- databases set up before and checks the query plans use them)
+-- Plan search: market coverage is always given; the other filters and the selected columns are covered
+CREATE INDEX plans_market_coverage_state_idx ON plans (market_coverage, state)
+    INCLUDE (plan_type, qhp_type, child_only_offering, plan_id, plan_variant_name);
+
+-- Standard component and state of the plans joined to the rates
+CREATE INDEX plans_plan_id_rate_idx ON plans (plan_id) INCLUDE (std_component_id, state);
+
+CREATE INDEX plans_state_idx ON plans (state);
+
+CREATE INDEX medical_plans_metal_level_idx ON medical_plans (metal_level) INCLUDE (plan_id);
+
+CREATE INDEX dental_plans_metal_level_idx ON dental_plans (metal_level) INCLUDE (plan_id);
+
+-- The primary key leads with plan_id, benefits are also looked up by name
+CREATE INDEX plan_benefit_benefit_name_idx ON plan_benefit (benefit_name) INCLUDE (plan_id);
+
+-- Rates are read by standard component (and age), CLUSTER ... USING these indexes keeps them in that order
+-- (maintenance.py); partitioned tables cannot be marked CLUSTER ON
+CREATE INDEX rate_individual_std_component_idx ON rate_individual (std_component_id, age_range_from, age_range_to)
+    INCLUDE (effective_date, expiration_date, individual_rate);
+
+-- Tobacco rates only: a constant predicate, usable by the generic plan of a prepared statement
+CREATE INDEX rate_individual_tobacco_idx ON rate_individual (std_component_id, age_range_from, age_range_to)
+    INCLUDE (effective_date, expiration_date, individual_rate, individual_tobacco_rate) WHERE tobacco;
+
+CREATE INDEX rate_family_std_component_idx ON rate_family (std_component_id, family_type);
+
+-- Correlated columns, the planner multiplies their selectivities otherwise
+CREATE STATISTICS medical_plans_metal_level_stats (ndistinct, dependencies) ON metal_level, plan_id FROM medical_plans;
+CREATE STATISTICS dental_plans_metal_level_stats (ndistinct, dependencies) ON metal_level, plan_id FROM dental_plans;
+CREATE STATISTICS rate_individual_age_range_stats (ndistinct, dependencies) ON age_range_from, age_range_to
+    FROM rate_individual;
+CREATE STATISTICS rate_individual_period_stats (ndistinct, dependencies) ON effective_date, expiration_date
+    FROM rate_individual;
+CREATE STATISTICS rate_family_period_stats (ndistinct, dependencies) ON effective_date, expiration_date
+    FROM rate_family;
+
+/* -------------------------Loader Bookkeeping--------------------------- */
+-- Constraint/index definitions set aside by a fast load (load_data.py --fast-load)
+CREATE TABLE load_deferred_ddl
+(
+    table_name  VARCHAR(63),
+    name        VARCHAR(63),
+    kind        CHAR(1),
+    definition  TEXT,
+    columns     TEXT[],
+    ref_table   VARCHAR(63),
+    ref_columns TEXT[],
+    PRIMARY KEY (table_name, name)
+);
+
+ALTER TABLE load_deferred_ddl
+    OWNER TO manager;
+
+-- Rows removed because they violate a constraint rebuilt after a fast load
+CREATE TABLE load_violations
+(
+    id              SERIAL,
+    table_name      VARCHAR(63),
+    constraint_name VARCHAR(63),
+    reason          VARCHAR(15),
+    row_data        JSONB,
+    detected_at     TIMESTAMP DEFAULT now(),
+    PRIMARY KEY (id)
+);
+
+ALTER TABLE load_violations
+    OWNER TO manager;
+
+-- Last committed position of each data set load (load_data.py --resume)
+CREATE TABLE load_checkpoints
+(
+    dataset     VARCHAR(31),
+    file_path   TEXT,
+    file_size   BIGINT,
+    file_mtime  DOUBLE PRECISION,
+    file_hash   CHAR(64),
+    byte_offset BIGINT,
+    rows        BIGINT,
+    completed   BOOLEAN,
+    updated_at  TIMESTAMP,
+    PRIMARY KEY (dataset)
+);
+
+ALTER TABLE load_checkpoints
+    OWNER TO manager;
+
+-- Fingerprint of every source row of the last load, by row key (load_data.py --delta)
+CREATE TABLE load_fingerprints
+(
+    dataset     VARCHAR(31),
+    row_key     TEXT[],
+    fingerprint BYTEA,
+    PRIMARY KEY (dataset, row_key)
+);
+
+ALTER TABLE load_fingerprints
+    OWNER TO manager;
+
+-- Stamp of the loaded data, bumped at the end of every load; Query result caches are keyed by it (result_cache.py)
+CREATE TABLE load_version
+(
+    id        BOOLEAN DEFAULT TRUE CHECK (id),
+    version   BIGINT,
+    loaded_at TIMESTAMP,
+    PRIMARY KEY (id)
+);
+
+ALTER TABLE load_version
+    OWNER TO manager;
+
 /* -------------------------Enumeration Initialization--------------------------- */
 
 INSERT INTO market_coverage_type
@@ -758,4 +874,9 @@ VALUES (27, 'Trustee');
 INSERT INTO cohabit_type
 VALUES (28, 'Other Relationship');
 INSERT INTO cohabit_type
-VALUES (29, 'Other Relative');
\ No newline at end of file
+VALUES (29, 'Other Relative');
+
+/* -------------------------Loader Bookkeeping Initialization--------------------------- */
+
+INSERT INTO load_version
+VALUES (TRUE, 0, now());
\ No newline at end of file
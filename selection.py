@@ -0,0 +1,147 @@
+# state / issuer / effective date subsets of the data sets
+from psycopg2 import sql
+
+import reader
+import constants as const
+
+
+class Selection:
+    """
+    Subset of the CMS files to load.
+
+    Plans are selected by state, issuer and plan effective date. The other
+    data sets follow the plans that survive: benefits by plan id, rates (also
+    by rate effective date) and business rules by standard component id.
+    Predicates look at the raw csv cells only, so excluded records are never
+    converted nor written. Each predicate has an SQL twin for the staging
+    tables (see staging.py).
+
+    Dates are compared as ISO 8601 strings (YYYY-MM-DD), the format of the
+    CMS files.
+    """
+
+    def __init__(self, plan_file, states=None, issuers=None, effective_from=None, effective_to=None):
+        """
+        :param plan_file: Plan_Attributes csv file, scanned for the selected plans
+        :param states: state codes, None for all
+        :param issuers: HIOS issuer ids, None for all
+        :param effective_from: first effective date (YYYY-MM-DD), None for no lower bound
+        :param effective_to: last effective date (YYYY-MM-DD), None for no upper bound
+        """
+        self.plan_file = plan_file
+        self.states = set(states) if states else None
+        self.issuers = set(issuers) if issuers else None
+        self.effective_from = effective_from
+        self.effective_to = effective_to
+        self.plan_ids = None
+        self.components = None
+
+    def scan(self):
+        """
+        Collect the plan ids and standard component ids of the selected plans, once
+        :return: N/A
+        """
+        if self.plan_ids is not None:
+            return
+        self.plan_ids = set()
+        self.components = set()
+        with reader.CsvStream(self.plan_file, interval=None) as stream:
+            selected = self.plans(stream.index)
+            plan_id = stream.index[const.CSV_PLAN_ID]
+            component = stream.index[const.CSV_STD_COMP_ID]
+            for row in stream:
+                if selected(row):
+                    self.plan_ids.add(row[plan_id])
+                    self.components.add(row[component])
+        print("Selection: %d plans, %d standard components" % (len(self.plan_ids), len(self.components)))
+
+    def predicate(self, dataset, index):
+        """
+        :param dataset: name in load_data.DATASETS
+        :param index: csv column name -> position
+        :return: function(row) -> the record is selected
+        """
+        if dataset == "plans":
+            return self.plans(index)
+        self.scan()
+        if dataset == "benefits":
+            return self.among(index[const.CSV_PLAN_ID], self.plan_ids)
+        if dataset == "rate":
+            return self.all_of([self.among(index[const.CSV_RATE_STD_COMP_ID], self.components),
+                                self.dates(index[const.CSV_RATE_EFF_DATE])])
+        if dataset == "business_rules":
+            return self.among(index[const.CSV_RULE_STD_COMP_ID], self.components)
+        raise ValueError("Unknown data set %s" % dataset)
+
+    def plans(self, index):
+        return self.all_of([self.among(index[const.CSV_PLAN_STATE], self.states),
+                            self.among(index[const.CSV_PLAN_ISSUER_ID], self.issuers),
+                            self.dates(index[const.CSV_EFFECTIVE_DATE])])
+
+    def among(self, position, values):
+        if values is None:
+            return None
+        return lambda row: row[position] in values
+
+    def dates(self, position):
+        low, high = self.effective_from, self.effective_to
+        if low is None and high is None:
+            return None
+        return lambda row: (low is None or row[position][:10] >= low) and (high is None or row[position][:10] <= high)
+
+    def all_of(self, tests):
+        tests = [test for test in tests if test is not None]
+        if not tests:
+            return lambda row: True
+        if len(tests) == 1:
+            return tests[0]
+        return lambda row: all(test(row) for test in tests)
+
+    def condition(self, dataset, cell):
+        """
+        SQL twin of predicate() for a staging table
+        :param dataset: name in load_data.DATASETS
+        :param cell: function csv column name -> SQL text expression of the cell
+        :return: SQL condition, None when every record is selected
+        """
+        if dataset == "plans":
+            conditions = [self.sql_among(cell(const.CSV_PLAN_STATE), self.states),
+                          self.sql_among(cell(const.CSV_PLAN_ISSUER_ID), self.issuers),
+                          self.sql_dates(cell(const.CSV_EFFECTIVE_DATE))]
+        else:
+            self.scan()
+            if dataset == "benefits":
+                conditions = [self.sql_among(cell(const.CSV_PLAN_ID), self.plan_ids)]
+            elif dataset == "rate":
+                conditions = [self.sql_among(cell(const.CSV_RATE_STD_COMP_ID), self.components),
+                              self.sql_dates(cell(const.CSV_RATE_EFF_DATE))]
+            else:
+                conditions = [self.sql_among(cell(const.CSV_RULE_STD_COMP_ID), self.components)]
+        conditions = [condition for condition in conditions if condition is not None]
+        return sql.SQL(" AND ").join(conditions) if conditions else None
+
+    def sql_among(self, expression, values):
+        if values is None:
+            return None
+        return sql.SQL("{} = ANY ({}::TEXT[])").format(expression, sql.Literal(sorted(values)))
+
+    def sql_dates(self, expression):
+        conditions = list()
+        if self.effective_from is not None:
+            conditions.append(sql.SQL("left({}, 10) >= {}").format(expression, sql.Literal(self.effective_from)))
+        if self.effective_to is not None:
+            conditions.append(sql.SQL("left({}, 10) <= {}").format(expression, sql.Literal(self.effective_to)))
+        return sql.SQL(" AND ").join(conditions) if conditions else None
+
+
+def restrict(condition, where):
+    """
+    :param condition: SQL condition of a selection, or None
+    :param where: SQL condition, or None
+    :return: both conditions
+    """
+    if condition is None:
+        return where
+    if where is None:
+        return condition
+    return sql.SQL("({}) AND ({})").format(condition, where)
@@ -0,0 +1,82 @@
+# byte range sharding of large csv files
+import os
+
+from tabulate import tabulate
+
+
+def plan(path, count):
+    """
+    Split a csv file into byte ranges that start and end on record boundaries.
+
+    Boundaries are moved forward to the next line break, which is a record
+    boundary for files without quoted line breaks such as Rate_PUF.csv.
+    :param path: csv file
+    :param count: wanted number of shards
+    :return: list of (start, end) byte ranges covering everything after the header
+    """
+    size = os.path.getsize(path)
+    with open(path, mode='rb') as fd:
+        fd.readline()
+        header_end = fd.tell()
+
+        bounds = [header_end]
+        step = (size - header_end) / max(count, 1)
+        for i in range(1, count):
+            fd.seek(int(header_end + step * i))
+            fd.readline()
+            position = fd.tell()
+            if bounds[-1] < position < size:
+                bounds.append(position)
+        bounds.append(size)
+
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def reconcile(path, results):
+    """
+    Check shard results against the source file and print a summary.
+
+    Shards must cover the file contiguously, every shard must have turned
+    each of its lines into exactly one record, and the records of all
+    shards must add up to the lines of the source file.
+    :param path: csv file
+    :param results: worker results, dicts with shard/start/end/offset/lines/records/tables/seconds
+    :return: True when everything adds up
+    """
+    results = sorted(results, key=lambda result: result["start"])
+    tables = sorted(set(table for result in results for table in result["tables"]))
+
+    data = list()
+    for result in results:
+        rate = result["records"] / result["seconds"] if result["seconds"] > 0 else 0
+        data.append([result["shard"], result["start"], result["end"], result["lines"], result["records"]] +
+                    [result["tables"].get(table, 0) for table in tables] +
+                    ["%.2f" % result["seconds"], "%.0f" % rate])
+    totals = [sum(result["tables"].get(table, 0) for result in results) for table in tables]
+    records = sum(result["records"] for result in results)
+    lines = sum(result["lines"] for result in results)
+    data.append(["Total", "", "", lines, records] + totals + ["", ""])
+    print(tabulate(data, headers=["Shard", "Start", "End", "Lines", "Records"] + tables + ["Seconds", "Records/s"],
+                   tablefmt="fancy_grid"))
+
+    problems = list()
+    with open(path, mode='rb') as fd:
+        fd.readline()
+        expected = fd.tell()
+    for result in results:
+        if result["start"] != expected:
+            problems.append("shard %d starts at %d, expected %d" % (result["shard"], result["start"], expected))
+        if result["offset"] != result["end"]:
+            problems.append("shard %d stopped at %d of %d" % (result["shard"], result["offset"], result["end"]))
+        if result["lines"] != result["records"]:
+            problems.append("shard %d read %d lines but %d records" % (result["shard"], result["lines"],
+                                                                       result["records"]))
+        expected = result["end"]
+    if expected != os.path.getsize(path):
+        problems.append("shards end at %d, file size is %d" % (expected, os.path.getsize(path)))
+
+    for problem in problems:
+        print("MISMATCH: " + problem)
+    if not problems:
+        print("Reconciled: %d source records in %d shards" % (records, len(results)))
+    return not problems
@@ -0,0 +1,354 @@
+# binary COPY snapshots of the loaded database and the disease collection, restored in parallel
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bson
+from psycopg2 import sql
+from tabulate import tabulate
+
+import constraints
+import partitions
+import result_cache
+import constants as const
+
+FORMAT_VERSION = 1
+MANIFEST = "manifest.json"
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema.sql")
+CREATE_TABLE = re.compile(r"^CREATE TABLE (\w+)", re.MULTILINE)
+
+# Definitions set aside by an unfinished fast load belong to the database they were taken from, and
+# so does its data set version: a restore bumps it instead of going back to an old one
+EXCLUDED_TABLES = {const.TABLE_DEFERRED_DDL, const.TABLE_LOAD_VERSION}
+
+SERIAL_COLUMNS = """
+SELECT a.attname::text, pg_get_serial_sequence(%s, a.attname)
+FROM pg_attribute a
+WHERE a.attrelid = %s::regclass
+  AND a.attnum > 0
+  AND NOT a.attisdropped
+  AND pg_get_serial_sequence(%s, a.attname) IS NOT NULL
+"""
+
+
+class HashingFile:
+    """
+    File object computing the sha256 and size of what COPY writes to or reads from it.
+    """
+
+    def __init__(self, fd):
+        self.fd = fd
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.digest.update(data)
+        self.size += len(data)
+        return self.fd.write(data)
+
+    def read(self, size=-1):
+        data = self.fd.read(size)
+        self.digest.update(data)
+        self.size += len(data)
+        return data
+
+    def readline(self, size=-1):
+        data = self.fd.readline(size)
+        self.digest.update(data)
+        self.size += len(data)
+        return data
+
+    def hexdigest(self):
+        return self.digest.hexdigest()
+
+
+def schema_tables(path=SCHEMA_FILE):
+    """
+    :param path: schema.sql
+    :return: tables created by the schema, in creation order (referenced tables first)
+    """
+    with open(path) as fd:
+        return [table for table in CREATE_TABLE.findall(fd.read()) if table not in EXCLUDED_TABLES]
+
+
+def schema_digest(path=SCHEMA_FILE):
+    """
+    Binary COPY data is only readable by columns of the same types, a snapshot is tied to its schema
+    :return: sha256 of schema.sql
+    """
+    with open(path, "rb") as fd:
+        return hashlib.sha256(fd.read()).hexdigest()
+
+
+def table_file(table):
+    return table + ".bin"
+
+
+def collection_file(name):
+    return name + ".bson"
+
+
+def export_table(connect, snapshot_id, directory, table):
+    """
+    COPY one table in binary format, in the exported snapshot of the coordinator connection
+    :param connect: function opening a new postgres connection
+    :param snapshot_id: pg_export_snapshot() of the coordinator
+    :param directory: snapshot directory
+    :param table: relation name
+    :return: manifest entry
+    """
+    began = time.perf_counter()
+    connection = connect()
+    connection.set_session(isolation_level="REPEATABLE READ", readonly=True)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SET TRANSACTION SNAPSHOT %s", (snapshot_id,))
+            # Partitioned tables are copied through a query over every partition
+            source = sql.Identifier(table)
+            if table in partitions.KEYS:
+                source = sql.SQL("(SELECT * FROM {})").format(source)
+            with open(os.path.join(directory, table_file(table)), "wb") as fd:
+                out = HashingFile(fd)
+                cursor.copy_expert(sql.SQL("COPY {} TO STDOUT (FORMAT binary)").format(source).as_string(cursor),
+                                   out)
+            rows = cursor.rowcount
+    finally:
+        connection.close()
+    return dict(table=table, file=table_file(table), rows=rows, bytes=out.size, sha256=out.hexdigest(),
+                seconds=round(time.perf_counter() - began, 3))
+
+
+def export_collection(collection, directory):
+    """
+    Write the documents of a mongoDB collection as concatenated BSON, the mongodump format
+    :return: manifest entry
+    """
+    began = time.perf_counter()
+    documents = 0
+    with open(os.path.join(directory, collection_file(collection.name)), "wb") as fd:
+        out = HashingFile(fd)
+        for document in collection.find():
+            out.write(bson.encode(document))
+            documents += 1
+    return dict(collection=collection.name, file=collection_file(collection.name), documents=documents,
+                bytes=out.size, sha256=out.hexdigest(), seconds=round(time.perf_counter() - began, 3))
+
+
+def export(connect, mongodb, root=const.SNAPSHOT_DIR, name=None, workers=const.SNAPSHOT_WORKERS):
+    """
+    Export every table of schema.sql and the disease collection into a new snapshot directory.
+
+    Tables are copied in parallel, one connection each, all reading the
+    snapshot exported by a coordinator transaction (pg_export_snapshot), so
+    the files are consistent with each other as pg_dump --jobs would be.
+    manifest.json lists the files with their rows, sizes and checksums.
+    :param connect: function opening a new postgres connection
+    :param mongodb: mongoDB database
+    :param root: directory holding the snapshots
+    :param name: snapshot name, the current time (YYYYMMDDTHHMMSS) when None
+    :param workers: tables copied at the same time
+    :return: snapshot directory
+    """
+    created = datetime.datetime.now()
+    directory = os.path.join(root, name or created.strftime("%Y%m%dT%H%M%S"))
+    os.makedirs(directory)
+
+    coordinator = connect()
+    coordinator.set_session(isolation_level="REPEATABLE READ", readonly=True)
+    with coordinator.cursor() as cursor:
+        cursor.execute("SELECT pg_export_snapshot(), current_database(), current_setting('server_version')")
+        snapshot_id, database, version = cursor.fetchone()
+        years = dict((table, list(partitions.partitions(cursor, table))) for table in partitions.KEYS)
+
+        tables = schema_tables()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            entries = list(pool.map(lambda table: export_table(connect, snapshot_id, directory, table), tables))
+    # The snapshot is only importable while its transaction is open
+    coordinator.rollback()
+    coordinator.close()
+
+    collection_entries = [export_collection(mongodb[const.COL_MEDICAL_DISEASE], directory)]
+
+    manifest = dict(format=FORMAT_VERSION, created=created.isoformat(timespec="seconds"), database=database,
+                    server_version=version, schema=schema_digest(), partitions=years, tables=entries,
+                    collections=collection_entries)
+    with open(os.path.join(directory, MANIFEST), "w") as fd:
+        json.dump(manifest, fd, indent=2)
+
+    report(entries, collection_entries)
+    return directory
+
+
+def read_manifest(directory):
+    with open(os.path.join(directory, MANIFEST)) as fd:
+        return json.load(fd)
+
+
+def restore_table(connect, directory, entry):
+    """
+    COPY one table back from its binary file, committed only when the file matches its checksum
+    :param connect: function opening a new postgres connection
+    :param directory: snapshot directory
+    :param entry: manifest entry of the table
+    :return: manifest entry, seconds of the restore
+    """
+    began = time.perf_counter()
+    connection = connect()
+    try:
+        with connection.cursor() as cursor:
+            with open(os.path.join(directory, entry["file"]), "rb") as fd:
+                source = HashingFile(fd)
+                cursor.copy_expert(sql.SQL("COPY {} FROM STDIN (FORMAT binary)").format(
+                    sql.Identifier(entry["table"])).as_string(cursor), source)
+            # Closing the connection without commit rolls the copy back
+            if source.hexdigest() != entry["sha256"]:
+                raise ValueError("%s does not match its checksum in %s" % (entry["file"], MANIFEST))
+            reset_sequences(cursor, entry["table"])
+        connection.commit()
+    finally:
+        connection.close()
+    return dict(entry, seconds=round(time.perf_counter() - began, 3))
+
+
+def reset_sequences(cursor, table):
+    """
+    Move the sequences of serial columns past the restored ids
+    """
+    cursor.execute(SERIAL_COLUMNS, (table, table, table))
+    for column, sequence in cursor.fetchall():
+        cursor.execute(sql.SQL("SELECT setval(%s, COALESCE(MAX({}), 0) + 1, false) FROM {}").format(
+            sql.Identifier(column), sql.Identifier(table)), (sequence,))
+
+
+def restore_collection(collection, directory, entry, batch_size=const.MONGO_BATCH_SIZE):
+    """
+    Replace the documents of a mongoDB collection with the ones of a BSON file
+    :return: manifest entry, seconds of the restore
+    """
+    began = time.perf_counter()
+    with open(os.path.join(directory, entry["file"]), "rb") as fd:
+        if hashlib.sha256(fd.read()).hexdigest() != entry["sha256"]:
+            raise ValueError("%s does not match its checksum in %s" % (entry["file"], MANIFEST))
+        fd.seek(0)
+        collection.drop()
+        batch = list()
+        for document in bson.decode_file_iter(fd):
+            batch.append(document)
+            if len(batch) >= batch_size:
+                collection.insert_many(batch, ordered=False)
+                batch = list()
+        if batch:
+            collection.insert_many(batch, ordered=False)
+    return dict(entry, seconds=round(time.perf_counter() - began, 3))
+
+
+def restore(connect, mongodb, directory, workers=const.SNAPSHOT_WORKERS, force=False):
+    """
+    Replace the content of the database and the disease collection with a snapshot.
+
+    The target has the tables of schema.sql (run it first on a new database).
+    Tables are emptied, the keys, foreign keys and indexes of the data tables
+    are set aside (constraints.defer), the files are copied in parallel and
+    the keys and indexes are then rebuilt in parallel (constraints.build).
+    :param connect: function opening a new postgres connection
+    :param mongodb: mongoDB database
+    :param directory: snapshot directory
+    :param workers: tables copied, then keys built, at the same time
+    :param force: restore a snapshot taken with another schema.sql
+    :return: N/A
+    """
+    manifest = read_manifest(directory)
+    if manifest["format"] != FORMAT_VERSION:
+        raise ValueError("Snapshot format %s, this version reads format %d" % (manifest["format"], FORMAT_VERSION))
+    if manifest["schema"] != schema_digest() and not force:
+        raise ValueError("Snapshot taken with another schema.sql, binary COPY needs the same column types")
+
+    connection = connect()
+    with connection.cursor() as cursor:
+        cursor.execute(sql.SQL("TRUNCATE {} CASCADE").format(
+            sql.SQL(", ").join(sql.Identifier(entry["table"]) for entry in manifest["tables"])))
+        for table, years in manifest["partitions"].items():
+            partitions.ensure(cursor, table, years)
+    connection.commit()
+    constraints.defer(connection)
+    connection.close()
+
+    # Largest files first, the pool does not wait on one big table at the end
+    entries = sorted(manifest["tables"], key=lambda entry: entry["bytes"], reverse=True)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        restored = list(pool.map(lambda entry: restore_table(connect, directory, entry), entries))
+    constraints.build(connect, workers)
+
+    collection_entries = [restore_collection(mongodb[entry["collection"]], directory, entry)
+                   for entry in manifest["collections"]]
+
+    connection = connect()
+    with connection.cursor() as cursor:
+        version = result_cache.bump(cursor)
+    connection.commit()
+    connection.close()
+    report(restored, collection_entries)
+    print("Dataset version %d" % version)
+
+
+def report(tables, collections):
+    data = [[entry["table"], entry["rows"], "%.1f" % (entry["bytes"] / (1 << 20)), "%.2f" % entry["seconds"]]
+            for entry in tables]
+    data += [[entry["collection"] + " (mongoDB)", entry["documents"], "%.1f" % (entry["bytes"] / (1 << 20)),
+              "%.2f" % entry["seconds"]] for entry in collections]
+    print(tabulate(data, headers=["Table", "Rows", "MB", "Seconds"], tablefmt="fancy_grid"))
+
+
+def snapshots(root=const.SNAPSHOT_DIR):
+    """
+    :return: snapshot directories under root, oldest first
+    """
+    if not os.path.isdir(root):
+        return list()
+    return [os.path.join(root, name) for name in sorted(os.listdir(root))
+            if os.path.isfile(os.path.join(root, name, MANIFEST))]
+
+
+def main():
+    from load_data import connect, connect_mongo
+
+    parser = argparse.ArgumentParser(description="Export or restore binary snapshots of the loaded database")
+    parser.add_argument("command", choices=["export", "restore", "list"])
+    parser.add_argument("snapshot", nargs="?",
+                        help="export: snapshot name (default: current time), restore: snapshot directory "
+                             "(default: latest under --root)")
+    parser.add_argument("--root", default=const.SNAPSHOT_DIR, help="directory holding the snapshots")
+    parser.add_argument("--workers", type=int, default=const.SNAPSHOT_WORKERS,
+                        help="tables copied (and keys rebuilt) at the same time, one connection each")
+    parser.add_argument("--force", action="store_true", help="restore a snapshot taken with another schema.sql")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        directory = export(connect, connect_mongo(), args.root, args.snapshot, args.workers)
+        print("Snapshot written to %s" % directory)
+    elif args.command == "restore":
+        found = snapshots(args.root)
+        directory = args.snapshot or (found[-1] if found else None)
+        if directory is None:
+            parser.error("no snapshot under %s" % args.root)
+        print("------RESTORE %s------" % directory)
+        restore(connect, connect_mongo(), directory, args.workers, args.force)
+    else:
+        data = list()
+        for directory in snapshots(args.root):
+            manifest = read_manifest(directory)
+            data.append([directory, manifest["created"], manifest["database"], len(manifest["tables"]),
+                         sum(entry["rows"] for entry in manifest["tables"]),
+                         "%.1f" % (sum(entry["bytes"] for entry in manifest["tables"] + manifest["collections"]) /
+                                   (1 << 20))])
+        print(tabulate(data, headers=["Snapshot", "Created", "Database", "Tables", "Rows", "MB"],
+                       tablefmt="fancy_grid"))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+# unlogged staging tables for set based loading
+import collections
+import csv
+import io
+import time
+
+from psycopg2 import sql
+
+import archive
+import writers
+import constants as const
+
+ALIAS = "s"
+
+
+def tune(cursor):
+    """
+    Settings for bulk INSERT ... SELECT: no wait for the WAL flush at commit,
+    more memory for sorts and hashes. They are local to the current
+    transaction (SET LOCAL), the loads that follow on the connection run
+    with the server settings again
+    :param cursor: postgres cursor, in the transaction of the staged load
+    :return: N/A
+    """
+    for name, value in (("synchronous_commit", "off"),
+                        ("work_mem", const.STAGING_WORK_MEM),
+                        ("maintenance_work_mem", const.STAGING_MAINTENANCE_WORK_MEM)):
+        cursor.execute("SELECT set_config(%s, %s, true)", (name, value))
+
+
+def column_types(cursor, table):
+    """
+    :param cursor: postgres cursor
+    :param table: relation name
+    :return: ordered dict column name -> SQL type, in table order
+    """
+    cursor.execute("SELECT attname::text, format_type(atttypid, atttypmod) FROM pg_attribute "
+                   "WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped ORDER BY attnum", (table,))
+    return collections.OrderedDict(cursor.fetchall())
+
+
+class Stage:
+    """
+    Raw copy of a csv file in an UNLOGGED table with one text column per
+    csv column.
+
+    Empty csv fields are stored as empty strings (FORCE_NOT_NULL), so SQL
+    conversions see the same values as the python converters. Normalized
+    tables are then filled with INSERT ... SELECT from the stage.
+    """
+
+    def __init__(self, cursor, path, table, encoding=const.CSV_ENCODING):
+        """
+        :param cursor: postgres cursor
+        :param path: csv file, or .gz/.zst/.zip compressed csv file
+        :param table: staging table name
+        :param encoding: file encoding
+        """
+        self.cursor = cursor
+        self.path = path
+        self.table = table
+        self.encoding = encoding
+        self.rows = 0
+        self.types = dict()
+        self.stats = writers.TableStats()
+        with io.TextIOWrapper(archive.open_source(path), encoding=encoding, newline='') as fd:
+            self.header = next(csv.reader(fd))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.drop()
+
+    def load(self):
+        """
+        Create the staging table and COPY the raw file into it
+        :return: number of csv records
+        """
+        start = time.perf_counter()
+        columns = [sql.Identifier(name) for name in self.header]
+        self.cursor.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(self.table)))
+        self.cursor.execute(sql.SQL("CREATE UNLOGGED TABLE {} ({})").format(
+            sql.Identifier(self.table), sql.SQL(", ").join(column + sql.SQL(" TEXT") for column in columns)))
+        with archive.open_source(self.path) as fd:
+            self.cursor.copy_expert(sql.SQL("COPY {} FROM STDIN WITH (FORMAT csv, HEADER true, ENCODING {}, "
+                                            "FORCE_NOT_NULL ({}))").format(sql.Identifier(self.table),
+                                                                          sql.Literal(self.encoding),
+                                                                          sql.SQL(", ").join(columns)), fd)
+        self.rows = self.cursor.rowcount
+        self.stats.add(self.table, self.rows, time.perf_counter() - start)
+        return self.rows
+
+    def cell(self, name):
+        """
+        SQL expression of a csv column of the current staging row
+        """
+        return sql.Identifier(ALIAS, name)
+
+    def insert_mapping(self, table_mapping, where=None):
+        """
+        Fill the table of a mapping.Mapping from the stage
+        :param table_mapping: mapping whose converters all have SQL
+        :param where: SQL condition selecting staging rows
+        :return: number of tuples inserted
+        """
+        return self.insert(table_mapping.table, table_mapping.columns, table_mapping.select(self.cell), where=where)
+
+    def insert(self, table, columns, expressions, joins=None, where=None):
+        """
+        INSERT INTO table (columns) SELECT expressions FROM the stage
+        :param table: relation name
+        :param columns: relation attributes
+        :param expressions: SQL text expressions, in the order of columns, cast to the column types
+        :param joins: SQL added after the stage in FROM, e.g. CROSS JOIN LATERAL unnest(...)
+        :param where: SQL condition selecting staging rows
+        :return: number of tuples inserted
+        """
+        types = self.column_types(table)
+        values = [sql.SQL("CAST({} AS {})").format(expression, sql.SQL(types[column]))
+                  for column, expression in zip(columns, expressions)]
+        query = sql.SQL("INSERT INTO {} ({}) SELECT {} FROM {} AS {}").format(
+            sql.Identifier(table), sql.SQL(", ").join(sql.Identifier(column) for column in columns),
+            sql.SQL(", ").join(values), sql.Identifier(self.table), sql.Identifier(ALIAS))
+        if joins is not None:
+            query += sql.SQL(" ") + joins
+        if where is not None:
+            query += sql.SQL(" WHERE ") + where
+
+        start = time.perf_counter()
+        self.cursor.execute(query)
+        self.stats.add(table, self.cursor.rowcount, time.perf_counter() - start)
+        return self.cursor.rowcount
+
+    def column_types(self, table):
+        types = self.types.get(table)
+        if types is None:
+            types = self.types[table] = column_types(self.cursor, table)
+        return types
+
+    def drop(self):
+        self.cursor.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(self.table)))
@@ -0,0 +1,378 @@
+# tuple writers used by load_data.py
+import collections
+import io
+import queue
+import threading
+import time
+
+import constants as const
+from psycopg2 import sql
+from pymongo import ReplaceOne
+from tabulate import tabulate
+
+
+class TableStats:
+    """
+    Rows written and time spent writing, per table.
+    """
+
+    def __init__(self):
+        self.rows = collections.OrderedDict()
+        self.seconds = collections.OrderedDict()
+
+    def add(self, table, rows, seconds):
+        self.rows[table] = self.rows.get(table, 0) + rows
+        self.seconds[table] = self.seconds.get(table, 0.0) + seconds
+
+    def report(self):
+        data = list()
+        for table, rows in self.rows.items():
+            seconds = self.seconds[table]
+            rate = rows / seconds if seconds > 0 else 0
+            data.append([table, rows, "%.2f" % seconds, "%.0f" % rate])
+        if data:
+            print(tabulate(data, headers=["Table", "Rows", "Write (s)", "Rows/s"], tablefmt="fancy_grid"))
+
+    def reset(self):
+        self.rows.clear()
+        self.seconds.clear()
+
+
+class InsertWriter:
+    """
+    Row-at-a-time writer, one INSERT statement per tuple.
+    """
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.statements = dict()
+        self.stats = TableStats()
+
+    def write(self, table, columns, values):
+        start = time.perf_counter()
+        self.cursor.execute(self.statement(table, columns), values)
+        self.stats.add(table, 1, time.perf_counter() - start)
+
+    def statement(self, table, columns):
+        # SQL text is built once per (table, columns) and reused for every tuple
+        key = (table, columns)
+        statement = self.statements.get(key)
+        if statement is None:
+            statement = sql.SQL("INSERT INTO {} ({}) VALUES ({})").format(
+                sql.Identifier(table),
+                sql.SQL(',').join(sql.Identifier(column) for column in columns),
+                sql.SQL(',').join(sql.Placeholder() * len(columns))
+            ).as_string(self.cursor)
+            self.statements[key] = statement
+        return statement
+
+    def execute(self, statement, params=None):
+        self.cursor.execute(statement, params)
+
+    def flush(self):
+        pass
+
+    def report(self):
+        self.stats.report()
+        self.stats.reset()
+
+    def close(self):
+        pass
+
+
+class CopyWriter:
+    """
+    Buffered writer streaming tuples into postgres with COPY FROM STDIN.
+
+    Tuples are buffered per table. Once any buffer reaches batch_size every
+    buffer is flushed, in the order the tables were first written, so parent
+    rows always reach the database before the rows referencing them.
+    """
+
+    def __init__(self, cursor, batch_size=const.COPY_BATCH_SIZE):
+        self.cursor = cursor
+        self.batch_size = batch_size
+        self.buffers = collections.OrderedDict()
+        self.statements = dict()
+        self.stats = TableStats()
+
+    def write(self, table, columns, values):
+        buffer = self.buffers.get(table)
+        if buffer is None:
+            buffer = self.buffers[table] = list()
+        buffer.append((columns, values))
+        if len(buffer) >= self.batch_size:
+            self.flush()
+
+    def execute(self, statement, params=None):
+        """
+        Run a statement after every tuple written so far
+        """
+        self.flush()
+        self.cursor.execute(statement, params)
+
+    def flush(self):
+        for table, buffer in self.buffers.items():
+            if buffer:
+                start = time.perf_counter()
+                self.copy(table, buffer)
+                self.stats.add(table, len(buffer), time.perf_counter() - start)
+                buffer.clear()
+
+    def copy(self, table, buffer):
+        # Rows of one table may carry different column sets, one COPY per set
+        groups = collections.OrderedDict()
+        for columns, values in buffer:
+            groups.setdefault(columns, list()).append(values)
+
+        for columns, rows in groups.items():
+            data = io.StringIO()
+            for values in rows:
+                data.write('\t'.join(copy_value(value) for value in values))
+                data.write('\n')
+            data.seek(0)
+
+            self.cursor.copy_expert(self.statement(table, columns), data)
+
+    def statement(self, table, columns):
+        key = (table, columns)
+        statement = self.statements.get(key)
+        if statement is None:
+            statement = sql.SQL("COPY {} ({}) FROM STDIN").format(
+                sql.Identifier(table),
+                sql.SQL(',').join(sql.Identifier(column) for column in columns)
+            ).as_string(self.cursor)
+            self.statements[key] = statement
+        return statement
+
+    def report(self):
+        self.stats.report()
+        self.stats.reset()
+
+    def close(self):
+        pass
+
+
+class NullWriter:
+    """
+    Writer discarding every tuple, for dry runs; only counts them per table.
+    """
+
+    def __init__(self):
+        self.stats = TableStats()
+
+    def write(self, table, columns, values):
+        self.stats.add(table, 1, 0.0)
+
+    def execute(self, statement, params=None):
+        pass
+
+    def flush(self):
+        pass
+
+    def report(self):
+        data = [[table, rows] for table, rows in self.stats.rows.items()]
+        if data:
+            print(tabulate(data, headers=["Table", "Tuples (discarded)"], tablefmt="fancy_grid"))
+        self.stats.reset()
+
+    def close(self):
+        pass
+
+
+class PipelineWriter:
+    """
+    Two stage parse/write pipeline.
+
+    The loader (parse stage) collects tuples into batches of batch_size and
+    hands them through a bounded queue to a writer thread that owns its own
+    connection and an INSERT or COPY writer. The writer thread commits when
+    the loader flushes, i.e. at checkpoints, so a committed transaction
+    always carries its checkpoint. At most queue_size batches are in flight,
+    so memory stays bounded whatever the size of the file; the parse stage
+    blocks while the queue is full.
+    """
+
+    STOP = "stop"
+    COMMIT = "commit"
+    EXECUTE = "execute"
+
+    def __init__(self, connect, mode, batch_size=const.COPY_BATCH_SIZE, queue_size=const.PIPELINE_QUEUE_SIZE):
+        """
+        :param connect: function returning a new postgres connection
+        :param mode: write mode of the writer stage (const.LOAD_MODE_COPY/INSERT)
+        :param batch_size: tuples per batch
+        :param queue_size: maximum number of batches waiting for the writer stage
+        """
+        self.conn = connect()
+        self.writer = create_writer(mode, self.conn.cursor(), batch_size)
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.batch = list()
+        self.error = None
+        self.blocked = 0.0
+        self.idle = 0.0
+        self.thread = threading.Thread(target=self.run, name="pipeline-writer", daemon=True)
+        self.thread.start()
+
+    def write(self, table, columns, values):
+        self.batch.append((table, columns, values))
+        if len(self.batch) >= self.batch_size:
+            self.submit(self.batch)
+            self.batch = list()
+
+    def submit(self, item):
+        self.check()
+        start = time.perf_counter()
+        self.queue.put(item)
+        self.blocked += time.perf_counter() - start
+
+    def execute(self, statement, params=None):
+        """
+        Run a statement on the writer stage connection after every tuple written so far
+        """
+        if self.batch:
+            self.submit(self.batch)
+            self.batch = list()
+        self.submit((self.EXECUTE, statement, params))
+
+    def run(self):
+        while True:
+            start = time.perf_counter()
+            item = self.queue.get()
+            self.idle += time.perf_counter() - start
+            try:
+                if item == self.STOP:
+                    return
+                if self.error is not None:
+                    # Keep draining so the parse stage never blocks on a dead writer
+                    continue
+                if item == self.COMMIT:
+                    self.writer.flush()
+                    self.conn.commit()
+                    continue
+                if isinstance(item, tuple):
+                    self.writer.execute(*item[1:])
+                    continue
+
+                for table, columns, values in item:
+                    self.writer.write(table, columns, values)
+            except Exception as e:
+                self.error = e
+                self.conn.rollback()
+            finally:
+                self.queue.task_done()
+
+    def check(self):
+        if self.error is not None:
+            raise RuntimeError("pipeline writer stage failed: %s" % self.error) from self.error
+
+    def flush(self):
+        """
+        Send the partial batch, wait for the writer stage to drain and commit
+        """
+        if self.batch:
+            self.submit(self.batch)
+            self.batch = list()
+        self.submit(self.COMMIT)
+        self.queue.join()
+        self.check()
+
+    def report(self):
+        self.writer.report()
+        print("Pipeline: parse stage blocked %.2fs, write stage idle %.2fs" % (self.blocked, self.idle))
+        self.blocked = 0.0
+        self.idle = 0.0
+
+    def close(self):
+        self.queue.put(self.STOP)
+        self.thread.join()
+        self.conn.close()
+
+
+class DocumentWriter:
+    """
+    Batched mongoDB writer.
+
+    Documents are buffered and sent batch_size at a time with one unordered
+    bulk write instead of one round trip per document. In upsert mode each
+    document replaces the one with the same _id, so a reload does not need
+    an empty collection. Without a collection (dry run) documents are only
+    counted.
+    """
+
+    def __init__(self, collection, batch_size=const.MONGO_BATCH_SIZE, upsert=False):
+        """
+        :param collection: pymongo collection, None to discard the documents
+        :param batch_size: documents per bulk write
+        :param upsert: replace documents by _id instead of inserting them
+        """
+        self.collection = collection
+        self.batch_size = batch_size
+        self.upsert = upsert
+        self.batch = list()
+        self.documents = 0
+        self.batches = 0
+        self.seconds = 0.0
+
+    def write(self, document):
+        self.batch.append(document)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.batch:
+            return
+        start = time.perf_counter()
+        if self.collection is not None and self.upsert:
+            self.collection.bulk_write([ReplaceOne({"_id": document["_id"]}, document, upsert=True)
+                                        for document in self.batch], ordered=False)
+        elif self.collection is not None:
+            self.collection.insert_many(self.batch, ordered=False)
+        self.seconds += time.perf_counter() - start
+        self.documents += len(self.batch)
+        self.batches += 1
+        self.batch = list()
+
+    def report(self):
+        if self.documents:
+            rate = self.documents / self.seconds if self.seconds > 0 else 0
+            name = self.collection.name if self.collection is not None else "(discarded)"
+            print(tabulate([[name, "upsert" if self.upsert else "insert", self.documents,
+                             self.batches, "%.2f" % self.seconds, "%.0f" % rate]],
+                           headers=["Collection", "Mode", "Documents", "Batches", "Write (s)", "Documents/s"],
+                           tablefmt="fancy_grid"))
+        self.documents = 0
+        self.batches = 0
+        self.seconds = 0.0
+
+    def close(self):
+        self.flush()
+
+
+def copy_value(value):
+    """
+    Encode a python value in COPY text format
+    :param value: attribute value
+    :return: escaped text
+    """
+    if value is None:
+        return '\\N'
+    if value is True:
+        return 't'
+    if value is False:
+        return 'f'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def create_writer(mode, cursor, batch_size=const.COPY_BATCH_SIZE):
+    """
+    Build the tuple writer for a load mode
+    :param mode: const.LOAD_MODE_COPY or const.LOAD_MODE_INSERT
+    :param cursor: postgres cursor
+    :param batch_size: tuples buffered per table before flushing (copy mode only)
+    :return: writer
+    """
+    if mode == const.LOAD_MODE_COPY:
+        return CopyWriter(cursor, batch_size)
+    return InsertWriter(cursor)